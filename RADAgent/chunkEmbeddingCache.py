@@ -0,0 +1,143 @@
+from peewee import CharField, BlobField, IntegerField, FloatField, SqliteDatabase, Model, fn
+
+import numpy as np
+import hashlib
+import threading
+import time
+
+
+class CachedEmbedding(Model):
+    key = CharField(primary_key=True, max_length=64)
+    vector = BlobField()
+    size = IntegerField()
+    last_used = FloatField(index=True)
+
+    class Meta:
+        database = SqliteDatabase(None, pragmas={"journal_mode": "wal"}, timeout=30)
+
+
+
+class ChunkEmbeddingCache:
+    """
+        Persistent embedding cache shared by every database, keyed by the content of the chunks.
+
+        The key of a chunk is the SHA-256 of the model id (model name and backend) and its text, so the same
+        manual uploaded to several slots, or a rebuild of a mostly unchanged slot, only runs the model for the
+        chunks never seen before. Vectors are stored as float32 in a SQLite file. When the file grows over
+        `max_bytes` the least recently used vectors are evicted down to 90% of the budget.
+    """
+
+    #Keys per query, below the SQLite limit of bound variables
+    LOOKUP_BATCH = 500
+
+    def __init__(self, path: str, model_id: str, max_bytes: int):
+        self.model_id = model_id
+        self.max_bytes = max_bytes
+        self.db = CachedEmbedding._meta.database
+        self.db.init(path)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.db.connect(reuse_if_open=True)
+        self.db.create_tables([CachedEmbedding], safe=True)
+        self.resident_bytes = CachedEmbedding.select(fn.COALESCE(fn.SUM(CachedEmbedding.size), 0)).scalar()
+        self.db.close()
+
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256("{}\0{}".format(self.model_id, text).encode("utf-8")).hexdigest()
+
+
+    def get_many(self, keys: list) -> dict:
+        """
+        Looks up the vectors of several chunks at once.
+
+        Returns:
+            Dict[str, List[float]]: The vectors found, by key. Missing keys are left out.
+        """
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        self.db.connect(reuse_if_open=True)
+        for start in range(0, len(unique_keys), self.LOOKUP_BATCH):
+            batch = unique_keys[start:start + self.LOOKUP_BATCH]
+            query = CachedEmbedding.select(CachedEmbedding.key, CachedEmbedding.vector).where(CachedEmbedding.key.in_(batch))
+            for entry in query:
+                found[entry.key] = np.frombuffer(entry.vector, dtype=np.float32).tolist()
+        if found:
+            with self.db.atomic():
+                found_keys = list(found)
+                for start in range(0, len(found_keys), self.LOOKUP_BATCH):
+                    CachedEmbedding.update(last_used=time.time()).where(
+                        CachedEmbedding.key.in_(found_keys[start:start + self.LOOKUP_BATCH])
+                    ).execute()
+        self.db.close()
+
+        with self.lock:
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+
+    def put_many(self, keys: list, embeddings: list):
+        """Stores the vectors of several chunks and evicts the least recently used ones if over budget."""
+        now = time.time()
+        rows = {}
+        for key, embedding in zip(keys, embeddings):
+            vector = np.asarray(embedding, dtype=np.float32).tobytes()
+            rows[key] = {"key": key, "vector": vector, "size": len(vector), "last_used": now}
+        if not rows:
+            return
+
+        self.db.connect(reuse_if_open=True)
+        with self.db.atomic():
+            existing = set()
+            row_keys = list(rows)
+            for start in range(0, len(row_keys), self.LOOKUP_BATCH):
+                query = CachedEmbedding.select(CachedEmbedding.key).where(CachedEmbedding.key.in_(row_keys[start:start + self.LOOKUP_BATCH]))
+                existing.update(entry.key for entry in query)
+            new_rows = [row for key, row in rows.items() if key not in existing]
+            for start in range(0, len(new_rows), self.LOOKUP_BATCH // 4):
+                CachedEmbedding.insert_many(new_rows[start:start + self.LOOKUP_BATCH // 4]).execute()
+        with self.lock:
+            self.resident_bytes += sum(row["size"] for row in new_rows)
+            over_budget = self.resident_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+        self.db.close()
+
+
+    def _evict(self):
+        target = int(self.max_bytes * 0.9)
+        with self.db.atomic():
+            freed = 0
+            evicted = 0
+            to_free = self.resident_bytes - target
+            query = CachedEmbedding.select(CachedEmbedding.key, CachedEmbedding.size).order_by(CachedEmbedding.last_used).tuples()
+            keys = []
+            for key, size in query.iterator():
+                if freed >= to_free:
+                    break
+                keys.append(key)
+                freed += size
+                evicted += 1
+            for start in range(0, len(keys), self.LOOKUP_BATCH):
+                CachedEmbedding.delete().where(CachedEmbedding.key.in_(keys[start:start + self.LOOKUP_BATCH])).execute()
+        with self.lock:
+            self.resident_bytes -= freed
+            self.evictions += evicted
+
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "resident_bytes": self.resident_bytes,
+                "budget_bytes": self.max_bytes,
+            }
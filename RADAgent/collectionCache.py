@@ -0,0 +1,146 @@
+from collections import OrderedDict
+import threading
+
+
+class CollectionCache:
+    """
+        Process-wide LRU cache of open vector store handles keyed by database id.
+
+        Opening a `Chroma` collection means opening its SQLite file and loading the HNSW segment
+        from disk, so handles are kept open between requests. The cache is bounded by a memory
+        budget (estimated from the size of each collection on disk) and by a maximum number of
+        entries; the least recently used collections are evicted first.
+
+        Dropping a handle does not free what it loaded by itself: `on_evict` is called with the database id
+        of every handle that leaves the cache, evicted, invalidated or too big to be kept, outside the lock.
+    """
+
+    def __init__(self, loader, size_estimator, budget_bytes: int, max_entries: int = 16, on_evict=None):
+        """
+        Args:
+            loader (Callable[[str], Any]): Opens the handle for a database id on a cache miss.
+            size_estimator (Callable[[str], int]): Returns the estimated resident size in bytes of a database.
+            budget_bytes (int): Memory budget for all cached handles. A single collection bigger than
+                                the budget is still served, but it is not kept in the cache.
+            max_entries (int, optional): Maximum number of open handles. Defaults to 16.
+            on_evict (Callable[[str], None], optional): Releases what the handle of a database id loaded.
+        """
+        self._loader = loader
+        self._size_estimator = size_estimator
+        self._on_evict = on_evict
+        self.budget_bytes = budget_bytes
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.resident_bytes = 0
+
+
+    def get(self, database_id: str):
+        """
+        Returns the handle for `database_id`, opening it on a miss and evicting cold handles if needed.
+        """
+        with self._lock:
+            entry = self._entries.get(database_id)
+            if entry is not None:
+                self._entries.move_to_end(database_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        #Open outside the lock, loading a collection can take seconds
+        handle = self._loader(database_id)
+        size = self._size_estimator(database_id)
+        self._store(database_id, handle, size)
+        return handle
+
+
+    def warm_up(self, database_id: str) -> bool:
+        """
+        Preloads the handle for `database_id` without counting it as a hit or a miss.
+
+        Returns:
+            bool: True if the handle was loaded, False if it was already cached.
+        """
+        with self._lock:
+            if database_id in self._entries:
+                return False
+
+        handle = self._loader(database_id)
+        size = self._size_estimator(database_id)
+        self._store(database_id, handle, size)
+        return True
+
+
+    def invalidate(self, database_id: str) -> bool:
+        """
+        Drops the handle for `database_id` from the cache.
+
+        Returns:
+            bool: True if a handle was removed.
+        """
+        with self._lock:
+            entry = self._entries.pop(database_id, None)
+            if entry is None:
+                return False
+            self.resident_bytes -= entry[1]
+        self._evicted([database_id])
+        return True
+
+
+    def contains(self, database_id: str) -> bool:
+        with self._lock:
+            return database_id in self._entries
+
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "resident_bytes": self.resident_bytes,
+                "budget_bytes": self.budget_bytes,
+                "max_entries": self.max_entries,
+                "collections": {database_id: entry[1] for database_id, entry in self._entries.items()},
+            }
+
+
+    def _store(self, database_id, handle, size):
+        evicted = []
+        with self._lock:
+            #A handle opened by a concurrent miss of the same database is replaced, not released
+            previous = self._entries.pop(database_id, None)
+            if previous is not None:
+                self.resident_bytes -= previous[1]
+
+            if size > self.budget_bytes:
+                evicted.append(database_id)
+            else:
+                while self._entries and (self.resident_bytes + size > self.budget_bytes
+                                         or len(self._entries) >= self.max_entries):
+                    evicted_id, (_, evicted_size) = self._entries.popitem(last=False)
+                    self.resident_bytes -= evicted_size
+                    self.evictions += 1
+                    evicted.append(evicted_id)
+
+                self._entries[database_id] = (handle, size)
+                self.resident_bytes += size
+        self._evicted(evicted)
+
+
+    def _evicted(self, database_ids: list):
+        if self._on_evict is None:
+            return
+        for database_id in database_ids:
+            try:
+                self._on_evict(database_id)
+            except Exception as e:
+                print(f"Could not release the evicted handle of {database_id}: {e}")
@@ -0,0 +1,105 @@
+from dataclasses import dataclass, field
+import os
+
+@dataclass
+class RetrievalConfig: 
+    embedding_model: str = field(default="paraphrase-multilingual-mpnet-base-v2")
+    embedding_backend: str = field(default="torch")
+    embedding_cache_dir: str = field(default=os.path.join("RADAgent", "models"))
+    embedding_batch_size: int = field(default=32)
+    onnx_intra_op_threads: int = field(default=0)
+    ingest_executor: str = field(default="threads")
+    ingest_workers: int = field(default=2)
+    ingest_batch_size: int = field(default=64)
+    ingest_write_batch_size: int = field(default=1000)
+    collection_cache_budget_mb: int = field(default=512)
+    collection_cache_max_entries: int = field(default=16)
+    collection_cache_warm_up: bool = field(default=True)
+    query_embedding_cache_size: int = field(default=2048)
+    search_workers: int = field(default=4)
+    lexical_cache_budget_mb: int = field(default=128)
+    hybrid_candidate_factor: int = field(default=4)
+    default_retrieval_mode: str = field(default="dense")
+    quantization: str = field(default="none")
+    quantized_rescore_candidates: int = field(default=50)
+    parse_workers: int = field(default=2)
+    parse_pages_per_task: int = field(default=50)
+    parse_timeout_seconds: int = field(default=120)
+    parse_memory_limit_mb: int = field(default=2048)
+    chunk_embedding_cache_mb: int = field(default=1024)
+    chunk_embedding_cache_path: str = field(default=os.path.join("RADAgent", "embedding_cache.db"))
+    ingest_queue_workers: int = field(default=1)
+    ingest_queue_max_depth: int = field(default=32)
+    ingest_queue_max_priority: int = field(default=10)
+    reclaim_interval_seconds: int = field(default=60)
+    reclaim_temp_grace_seconds: int = field(default=600)
+    similarity_threshold: float = field(default=0.3)
+    retrieval_min_k: int = field(default=1)
+    retrieval_score_gap: float = field(default=0.1)
+    result_cache_entries: int = field(default=1024)
+    result_cache_similarity: float = field(default=0.95)
+    result_cache_ttl_seconds: int = field(default=600)
+    context_merge: bool = field(default=True)
+    context_merge_min_overlap: int = field(default=20)
+    max_top_k: int = field(default=50)
+    batch_max_items: int = field(default=64)
+    
+    def __post_init__(self):
+        file_path = os.path.join('RADAgent','configFiles', 'retrievalInfo.txt')
+        config = dict()
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    key, value = line.strip().split(':', 1)
+                    config[key] = value
+                
+        
+        self.embedding_model = config.get('embedding_model', self.embedding_model)
+        self.embedding_backend = config.get('embedding_backend', self.embedding_backend)
+        self.embedding_cache_dir = config.get('embedding_cache_dir', self.embedding_cache_dir)
+        self.embedding_batch_size = int(config.get('embedding_batch_size', self.embedding_batch_size))
+        self.onnx_intra_op_threads = int(config.get('onnx_intra_op_threads', self.onnx_intra_op_threads))
+        self.ingest_executor = config.get('ingest_executor', self.ingest_executor)
+        self.ingest_workers = int(config.get('ingest_workers', self.ingest_workers))
+        self.ingest_batch_size = int(config.get('ingest_batch_size', self.ingest_batch_size))
+        self.ingest_write_batch_size = int(config.get('ingest_write_batch_size', self.ingest_write_batch_size))
+        self.collection_cache_budget_mb = int(config.get('collection_cache_budget_mb', self.collection_cache_budget_mb))
+        self.collection_cache_max_entries = int(config.get('collection_cache_max_entries', self.collection_cache_max_entries))
+        self.collection_cache_warm_up = self._to_bool(config.get('collection_cache_warm_up', self.collection_cache_warm_up))
+        self.query_embedding_cache_size = int(config.get('query_embedding_cache_size', self.query_embedding_cache_size))
+        self.search_workers = int(config.get('search_workers', self.search_workers))
+        self.lexical_cache_budget_mb = int(config.get('lexical_cache_budget_mb', self.lexical_cache_budget_mb))
+        self.hybrid_candidate_factor = int(config.get('hybrid_candidate_factor', self.hybrid_candidate_factor))
+        self.default_retrieval_mode = config.get('default_retrieval_mode', self.default_retrieval_mode)
+        self.quantization = config.get('quantization', self.quantization)
+        self.quantized_rescore_candidates = int(config.get('quantized_rescore_candidates', self.quantized_rescore_candidates))
+        self.parse_workers = int(config.get('parse_workers', self.parse_workers))
+        self.parse_pages_per_task = int(config.get('parse_pages_per_task', self.parse_pages_per_task))
+        self.parse_timeout_seconds = int(config.get('parse_timeout_seconds', self.parse_timeout_seconds))
+        self.parse_memory_limit_mb = int(config.get('parse_memory_limit_mb', self.parse_memory_limit_mb))
+        self.chunk_embedding_cache_mb = int(config.get('chunk_embedding_cache_mb', self.chunk_embedding_cache_mb))
+        self.chunk_embedding_cache_path = config.get('chunk_embedding_cache_path', self.chunk_embedding_cache_path)
+        self.ingest_queue_workers = int(config.get('ingest_queue_workers', self.ingest_queue_workers))
+        self.ingest_queue_max_depth = int(config.get('ingest_queue_max_depth', self.ingest_queue_max_depth))
+        self.ingest_queue_max_priority = int(config.get('ingest_queue_max_priority', self.ingest_queue_max_priority))
+        self.reclaim_interval_seconds = int(config.get('reclaim_interval_seconds', self.reclaim_interval_seconds))
+        self.reclaim_temp_grace_seconds = int(config.get('reclaim_temp_grace_seconds', self.reclaim_temp_grace_seconds))
+        self.similarity_threshold = float(config.get('similarity_threshold', self.similarity_threshold))
+        self.retrieval_min_k = int(config.get('retrieval_min_k', self.retrieval_min_k))
+        self.retrieval_score_gap = float(config.get('retrieval_score_gap', self.retrieval_score_gap))
+        self.result_cache_entries = int(config.get('result_cache_entries', self.result_cache_entries))
+        self.result_cache_similarity = float(config.get('result_cache_similarity', self.result_cache_similarity))
+        self.result_cache_ttl_seconds = int(config.get('result_cache_ttl_seconds', self.result_cache_ttl_seconds))
+        self.context_merge = self._to_bool(config.get('context_merge', self.context_merge))
+        self.context_merge_min_overlap = int(config.get('context_merge_min_overlap', self.context_merge_min_overlap))
+        self.max_top_k = int(config.get('max_top_k', self.max_top_k))
+        self.batch_max_items = int(config.get('batch_max_items', self.batch_max_items))
+        
+        
+    @staticmethod
+    def _to_bool(value) -> bool:
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,166 @@
+from langchain_core.documents import Document
+
+import threading
+import json
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+
+class ContextMerger:
+    """
+        Stitches the retrieved chunks that overlap and drops duplicated passages before the context is sent.
+
+        The splitter repeats up to `chunk_overlap` characters of a chunk at the start of the next one of the same
+        page. When both are retrieved, the response would carry that text twice. For the chunks of the same
+        database, file and page:
+            - A chunk whose text ends with the start of another (at least `min_overlap` characters) is joined
+              with it into one passage, without repeating the common text.
+            - A chunk contained in another one is dropped.
+        Passages with the same text (the same manual uploaded to several databases) are dropped everywhere.
+
+        Passages keep the position of their most relevant chunk, its metadata and the highest score, and
+        report how many chunks they joined in the "merged_chunks" metadata.
+
+        The bytes and tokens of the serialized context before and after merging are counted for the metrics.
+        Tokens are counted with tiktoken when it is installed and estimated as characters / 4 otherwise.
+    """
+
+    def __init__(self, min_overlap: int = 20):
+        self.min_overlap = min_overlap
+        self.lock = threading.Lock()
+        self.responses = 0
+        self.chunks_in = 0
+        self.passages_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+
+    def merge(self, documents: list) -> list:
+        """
+        Args:
+            documents (List[Document]): The retrieved chunks, ordered by relevance.
+
+        Returns:
+            List[Document]: The passages, ordered by the relevance of their best chunk.
+        """
+        if not documents:
+            return documents
+
+        #[rank, text, metadata, chunks] of every passage, merged in place
+        passages = [[rank, document.page_content, dict(document.metadata), 1] for rank, document in enumerate(documents)]
+
+        groups = {}
+        for passage in passages:
+            metadata = passage[2]
+            groups.setdefault((metadata.get("database_id"), metadata.get("file"), metadata.get("page_number")), []).append(passage)
+
+        merged = []
+        for group in groups.values():
+            merged.extend(self._merge_group(group))
+
+        unique = {}
+        for passage in sorted(merged, key=lambda passage: passage[0]):
+            unique.setdefault(" ".join(passage[1].split()), passage)
+
+        result = []
+        for rank, text, metadata, chunks in unique.values():
+            if chunks > 1:
+                metadata["merged_chunks"] = chunks
+            result.append(Document(id=documents[rank].id, page_content=text, metadata=metadata))
+
+        self._record(documents, result)
+        return result
+
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "responses": self.responses,
+                "chunks_in": self.chunks_in,
+                "passages_out": self.passages_out,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "average_bytes_saved": ((self.bytes_in - self.bytes_out) / self.responses) if self.responses else 0.0,
+                "average_tokens_saved": ((self.tokens_in - self.tokens_out) / self.responses) if self.responses else 0.0,
+                "tokenizer": "tiktoken" if _ENCODING is not None else "chars/4",
+            }
+
+
+    def _merge_group(self, group: list) -> list:
+        changed = True
+        while changed and len(group) > 1:
+            changed = False
+            for first in group:
+                for second in group:
+                    if first is second:
+                        continue
+                    if second[1] in first[1]:
+                        self._absorb(first, second, first[1])
+                    else:
+                        overlap = self._overlap(first[1], second[1])
+                        if overlap is None:
+                            continue
+                        self._absorb(first, second, first[1] + second[1][overlap:])
+                    group.remove(second)
+                    changed = True
+                    break
+                if changed:
+                    break
+        return group
+
+
+    def _absorb(self, passage: list, other: list, text: str):
+        passage[0] = min(passage[0], other[0])
+        passage[1] = text
+        passage[3] += other[3]
+        if "score" in other[2] and "score" in passage[2]:
+            passage[2]["score"] = max(passage[2]["score"], other[2]["score"])
+
+
+    def _overlap(self, first: str, second: str):
+        """
+        Length of the longest end of `first` that starts `second`, if it is at least `min_overlap` characters.
+        """
+        probe = second[:self.min_overlap]
+        if len(probe) < self.min_overlap:
+            return None
+        start = first.find(probe, max(0, len(first) - len(second)))
+        while start != -1:
+            if second.startswith(first[start:]):
+                return len(first) - start
+            start = first.find(probe, start + 1)
+        return None
+
+
+    def _record(self, documents: list, passages: list):
+        before = self._serialize(documents)
+        after = self._serialize(passages)
+        with self.lock:
+            self.responses += 1
+            self.chunks_in += len(documents)
+            self.passages_out += len(passages)
+            self.bytes_in += len(before.encode("utf-8"))
+            self.bytes_out += len(after.encode("utf-8"))
+            self.tokens_in += self._count_tokens(before)
+            self.tokens_out += self._count_tokens(after)
+
+
+    @staticmethod
+    def _serialize(documents: list) -> str:
+        #What the agents encrypt and send
+        return json.dumps([{"page_content": document.page_content, "metadata": document.metadata} for document in documents])
+
+
+    @staticmethod
+    def _count_tokens(text: str) -> int:
+        if _ENCODING is not None:
+            return len(_ENCODING.encode(text))
+        return len(text) // 4
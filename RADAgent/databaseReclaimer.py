@@ -0,0 +1,150 @@
+from statusDatabaseManager import StatusEnum, JobStateEnum
+
+import threading
+import shutil
+import time
+import os
+
+
+class DatabaseReclaimer:
+    """
+        Background thread that removes from disk what deleted databases and finished uploads leave behind.
+
+        Every `reclaim_interval_seconds`, and as soon as a database is deleted, it removes:
+            - The directories of databases marked deleted that no search or ingestion job holds
+              (see `ReaderRegistry`). Databases still held are retried on the next pass.
+            - The upload folders of `RADAgent/.temp` that no queued or running ingestion job uses, once
+              they are older than `reclaim_temp_grace_seconds` (the grace covers an upload being saved).
+
+        At startup `reconcile` also removes database directories without a status row and the staging
+        directories of interrupted index rebuilds. Ready, processing and failed databases are never touched.
+    """
+
+    def __init__(self, database_manager, status_database, config, temp_route: str = os.path.join("RADAgent", ".temp")):
+        self.database_manager = database_manager
+        self.status_database = status_database
+        self.temp_route = temp_route
+        self.interval = config.reclaim_interval_seconds
+        self.temp_grace = config.reclaim_temp_grace_seconds
+        self.wake_up = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stats = {
+            "bytes_reclaimed": 0,
+            "databases_reclaimed": 0,
+            "temp_folders_reclaimed": 0,
+            "databases_held": 0,
+            "last_run": None,
+        }
+        status_database.add_listener(self._on_status_change)
+
+
+    def start(self):
+        """Reconciles the disk with the status table and starts the background thread. Calling it again does nothing."""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._work, name="reclaimer", daemon=True)
+        self.reconcile()
+        self.thread.start()
+
+
+    def reconcile(self):
+        """
+        Full pass run at startup: also removes database directories the status table does not know and
+        leftovers of interrupted index rebuilds.
+        """
+        known = {database_id for database_id, _ in self.status_database.get_all_entries()}
+        route = self.database_manager.route
+        if os.path.isdir(route):
+            for database_name in os.listdir(route):
+                path = os.path.join(route, database_name)
+                if not os.path.isdir(path):
+                    continue
+                if database_name not in known:
+                    self._remove(path, "databases_reclaimed")
+                elif os.path.isdir(os.path.join(path, ".rebuild")) and not self.database_manager.readers.is_held(database_name):
+                    self._remove(os.path.join(path, ".rebuild"), None)
+        self.reclaim()
+
+
+    def reclaim(self):
+        """One pass over deleted databases and orphaned upload folders."""
+        held = 0
+        route = self.database_manager.route
+        for database_name, status in self.status_database.get_all_entries():
+            path = os.path.join(route, database_name)
+            if status != StatusEnum.deleted or not os.path.isdir(path):
+                continue
+            if self.database_manager.readers.is_held(database_name):
+                held += 1
+                continue
+            self.database_manager.release_database(database_name)
+            self._remove(path, "databases_reclaimed")
+            self.database_manager.readers.remove_lock(database_name)
+
+        if os.path.isdir(self.temp_route):
+            in_use = {os.path.normpath(job["container_path"])
+                      for job in self.status_database.get_jobs([JobStateEnum.queued, JobStateEnum.running])
+                      if job["container_path"]}
+            now = time.time()
+            for folder in os.listdir(self.temp_route):
+                path = os.path.join(self.temp_route, folder)
+                if os.path.normpath(path) in in_use or now - self._last_modified(path) < self.temp_grace:
+                    continue
+                self._remove(path, "temp_folders_reclaimed")
+
+        with self.lock:
+            self.stats["databases_held"] = held
+            self.stats["last_run"] = time.time()
+
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+
+    @staticmethod
+    def _last_modified(path: str) -> float:
+        #Appending to a file does not change the mtime of its folder, a streamed upload only touches the file
+        newest = os.path.getmtime(path)
+        for root, _, files in os.walk(path):
+            for name in [os.path.join(root, file) for file in files]:
+                try:
+                    newest = max(newest, os.path.getmtime(name))
+                except OSError:
+                    #Removed meanwhile
+                    pass
+        return newest
+
+
+    def _remove(self, path: str, counter):
+        size = self.database_manager.utils.directory_size(path) if os.path.isdir(path) else os.path.getsize(path)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            #Files still open on some platforms, retried on the next pass
+            print(f"Could not reclaim {path}: {e}")
+            return
+        with self.lock:
+            self.stats["bytes_reclaimed"] += size
+            if counter is not None:
+                self.stats[counter] += 1
+
+
+    def _on_status_change(self, database_name: str, new_status: str):
+        if new_status == StatusEnum.deleted:
+            self.wake_up.set()
+
+
+    def _work(self):
+        while True:
+            self.wake_up.wait(self.interval)
+            self.wake_up.clear()
+            try:
+                self.reclaim()
+            except Exception as e:
+                print(f"Reclaimer pass failed: {e}")
@@ -1,26 +1,107 @@
 from statusDatabaseManager import StatusEnum, StatusDatabaseManager
+from collectionCache import CollectionCache
+from embeddingCache import QueryEmbeddingCache
+from chunkEmbeddingCache import ChunkEmbeddingCache
+from lexicalIndex import LexicalIndex, LexicalIndexBuilder
+from quantizedStore import QuantizedStore, QuantizedStoreBuilder
+from metrics import LatencyStats
+from embeddingBackends import build_embedding_model
+from embeddingPool import EmbeddingPool
+from pdfParser import PdfParsePool
+from progressTracker import ProgressTracker
+from readerRegistry import ReaderRegistry
+from scoreCutoff import ScoreCutoff
+from resultCache import SemanticResultCache
+from contextMerger import ContextMerger
+from configClasses.retrievalConfig import RetrievalConfig
+from utils import Utils
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores.utils import filter_complex_metadata
 
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import ExitStack
+from collections import deque
+import numpy as np
+import threading
+import shutil
+import time
+import uuid
 import os
 
 
 class DatabasesManager:
 
-    def __init__(self): 
-        self.route = os.path.join(os.getcwd(), "RADAgent" ,"databases")
-        self.embedding_model = HuggingFaceEmbeddings(model_name="paraphrase-multilingual-mpnet-base-v2")
-        self.status_database = StatusDatabaseManager()
+    RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+    RRF_K = 60
+    REBUILD_DIRECTORY = ".rebuild"
+
+    def __init__(self, preload_for_fork: bool = False): 
         """
-            Im having some issues deleting directories and databases
-            Delete all directories at start could be a possible solution
+        Args:
+            preload_for_fork (bool, optional): Whether the agent forks worker processes that share the
+                                               embedding model (see `build_embedding_model`). Defaults to False.
         """
+        self.route = os.path.join(os.getcwd(), "RADAgent" ,"databases")
+        self.config = RetrievalConfig()
+        self.embedding_model = build_embedding_model(self.config, preload_for_fork)
+        self.status_database = StatusDatabaseManager()
+        self.utils = Utils()
+        self.collection_cache = CollectionCache(
+            loader=self._open_vector_store,
+            size_estimator=self._estimate_resident_size,
+            budget_bytes=self.config.collection_cache_budget_mb * 1024 * 1024,
+            max_entries=self.config.collection_cache_max_entries,
+            on_evict=self._close_chroma_system
+        )
+        self.query_embedding_cache = QueryEmbeddingCache(
+            encoder=self.embedding_model.embed_query,
+            batch_encoder=self.embedding_model.embed_documents,
+            max_entries=self.config.query_embedding_cache_size
+        )
+        self.lexical_cache = CollectionCache(
+            loader=self._open_lexical_index,
+            size_estimator=self._estimate_lexical_size,
+            budget_bytes=self.config.lexical_cache_budget_mb * 1024 * 1024,
+            max_entries=self.config.collection_cache_max_entries
+        )
+        self.quantized_cache = CollectionCache(
+            loader=self._open_quantized_store,
+            size_estimator=self._estimate_quantized_size,
+            budget_bytes=self.config.collection_cache_budget_mb * 1024 * 1024,
+            max_entries=self.config.collection_cache_max_entries
+        )
+        self.chunk_embedding_cache = None
+        if self.config.chunk_embedding_cache_mb > 0:
+            self.chunk_embedding_cache = ChunkEmbeddingCache(
+                path=self.config.chunk_embedding_cache_path,
+                model_id="{}:{}".format(self.config.embedding_model, self.config.embedding_backend),
+                max_bytes=self.config.chunk_embedding_cache_mb * 1024 * 1024
+            )
+        self.result_cache = SemanticResultCache(
+            max_entries=self.config.result_cache_entries,
+            min_similarity=self.config.result_cache_similarity,
+            ttl_seconds=self.config.result_cache_ttl_seconds
+        )
+        self.context_merger = ContextMerger(min_overlap=self.config.context_merge_min_overlap)
+        self.retrieval_latency = LatencyStats()
+        self.score_cutoff = ScoreCutoff(
+            min_k=self.config.retrieval_min_k,
+            threshold=self.config.similarity_threshold,
+            gap=self.config.retrieval_score_gap
+        )
+        self.readers = ReaderRegistry()
+        self.chroma_lock = threading.Lock()
+        self.embedding_pool = None
+        self.embedding_pool_lock = threading.Lock()
+        self.ingestion_history = deque(maxlen=20)
+        self.search_executor = ThreadPoolExecutor(max_workers=self.config.search_workers, thread_name_prefix="search")
+        self.warm_up_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warm-up")
+        StatusDatabaseManager.add_listener(self._on_status_change)
+        StatusDatabaseManager.add_remote_listener(self._on_remote_status_change)
+        #Directories of deleted databases are removed in background by DatabaseReclaimer
 
     def create_database(self, container_path:str, database_name:str):
         """
@@ -47,88 +128,288 @@ class DatabasesManager:
             Raises:
                 ValueError: If the container path does not exist or if a database with the same name already exists.
         """
-        try:
+        with self.readers.hold(database_name):
+            building = False
+            try:
             
-            if (not (os.path.exists(container_path))): 
-                raise ValueError("Folder does not exist")
+                if (not (os.path.exists(container_path))): 
+                    raise ValueError("Folder does not exist")
             
-            files = os.listdir(self.route)
+                files = os.listdir(self.route)
             
-            if database_name in files: 
-                raise ValueError("Database already exists")
+                if database_name in files: 
+                    raise ValueError("Database already exists")
 
-            split_documents = self._prepare_data(container_path)
+                building = True
+                progress = ProgressTracker(self.status_database, database_name)
+                split_documents = self._prepare_data(container_path, database_name, progress)
             
-            self._save_embeddings(database_name=database_name, split_documents=split_documents)
+                self._save_embeddings(database_name=database_name, split_documents=split_documents, progress=progress)
             
-        except Exception as e:
-            self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.error)
+            except Exception as e:
+                #A database deleted meanwhile stays deleted, and what was written of it is dropped
+                if (not self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.error,
+                                                                 current_status=StatusEnum.processing) and building):
+                    self._discard_database(database_name)
         
           
         
-    def _prepare_data(self, container_path): 
+    def _prepare_data(self, container_path, database_name=None, progress=None): 
         """
         Loads PDF documents from the specified directory, splits the content of each page into smaller chunks,
-        and organizes them into a list of `Document` objects with metadata.
+        and yields them one by one as `Document` objects with metadata.
 
-        This method scans the given directory for PDF files, loads each PDF file using the `PyPDFLoader`,
-        and splits the content of each page into smaller chunks using the `RecursiveCharacterTextSplitter`.
-        Each chunk is stored in a `Document` object, which contains both the chunked text and relevant metadata
-        such as the file name and page number. The final structure is a list where each element corresponds 
-        to a chunk of text from a specific page in a PDF document.
+        This method scans the given directory for PDF files and parses them on a `PdfParsePool`. The pool extracts
+        the text of the files, and of page ranges of large files, in parallel worker processes and splits it
+        using the `RecursiveCharacterTextSplitter`. Each chunk is yielded in a `Document` object, which contains
+        both the chunked text and relevant metadata such as the file name and page number.
 
         - Each `Document` object contains the chunked text as well as metadata with the file name and page number.
+        - The chunks come back in the original (file, page_number) order, whatever order the workers finish in.
+        - Every parse task runs under a time and memory limit. A file that exceeds them or fails is skipped
+        instead of stalling the whole build.
 
         Args:
             container_path (str): The path to the directory containing the PDF files.
+            database_name (str, optional): The database being built. When given, the pages, chunks, parse
+                                           seconds and status of every file are stored in the status database
+                                           once all the files are parsed.
+            progress (ProgressTracker, optional): Receives the files and pages parsed and the parse and split times.
 
         Returns:
-            List[Document]: A list of `Document` objects, where each object represents a chunk of text from a specific 
-                            page of a PDF document. Each `Document` object contains:
+            Iterator[Document]: A generator of `Document` objects, where each object represents a chunk of text from
+                            a specific page of a PDF document. Each `Document` object contains:
                             - `page_content` (str): The chunk of text extracted from the page.
                             - `metadata` (dict): Metadata about the chunk, including:
                                 - "file" (str): The name of the PDF file.
                                 - "page_number" (int): The page number from which the chunk is extracted.
 
         Notes:
-            - For large PDF files or a large number of PDF files, consider using a lazy loader to avoid 
-            excessive memory usage. With a lazy loader, the PDF content is loaded incrementally and processed
-            in chunks.
+            - Nothing is loaded until the generator is consumed, and only a bounded window of parsed page ranges
+            is held in memory. Together with the bounded batches of `_ingest_documents`, the peak memory of an
+            ingestion depends on the batch size and not on the size of the corpus.
             
             - The content of each page is split into smaller chunks using `RecursiveCharacterTextSplitter`, 
             which allows control over the size of the chunks and overlap between them. The chunk size 
             and overlap are based on the text splitter's configuration, not the page size.
     """
         files = os.listdir(container_path)
-        text_splitter = RecursiveCharacterTextSplitter(
+        parse_pool = PdfParsePool(
+            self.config,
             chunk_size=1000,
             chunk_overlap=100,
-            separators=["\n\n", "\n", ".", " "]  
+            separators=["\n\n", "\n", ".", " "]
         )
-        split_documents = []
-
-
-        for file in files:
-            path = os.path.join(container_path, file)
-            loader = PyPDFLoader(path)
-            documents = loader.load()
-        
-            for page_number, document in enumerate(documents, start=1): 
-                chunks = text_splitter.split_text(document.page_content) 
-                for chunk in chunks:
-                    split_documents.append(
-                        Document(
-                            page_content=chunk,
-                            metadata={         
-                                "file": os.path.basename(path),
-                                "page_number": page_number  
-                            }
-                        )
-                    )
-        return split_documents
+
+        paths = [os.path.join(container_path, file) for file in files]
+        for file, page_number, chunk in parse_pool.parse(paths, progress):
+            yield Document(
+                page_content=chunk,
+                metadata={         
+                    "file": file,
+                    "page_number": page_number  
+                }
+            )
+        
+        if database_name is not None:
+            self.status_database.add_file_parse_stats(database_name, parse_pool.file_stats)
     
     
-    def _save_embeddings(self, database_name, split_documents):
+    def add_files(self, container_path: str, database_name: str):
+        """
+            Adds the PDF files of a container path to an existing database.
+
+            Only the new files are parsed and embedded: their chunks are appended to the collection of the
+            database, and files with the name of a file already in the database replace it. The chunks of the
+            previous version are only deleted once the new ones are written, so a file that fails to parse
+            keeps its previous version and gets the error in its parse stats. The lexical index and the
+            quantized store are then rebuilt from the chunks and embeddings stored in the collection, which
+            needs neither the PDFs nor the embedding model.
+
+            The database is "processing" during the update and "ready" again once it is complete. If the
+            update fails it is "ready" with its previous files, unless the indexes could not be rebuilt ("error").
+            A database deleted meanwhile stays deleted.
+
+            Args:
+                container_path (str): The path to the directory containing the documents to add.
+                database_name (str): The database to update.
+
+            Raises:
+                ValueError: If the container path or the database does not exist, or the database is not ready.
+        """
+        with self.readers.hold(database_name):
+            path = os.path.join(self.route, database_name)
+            
+            if (not (os.path.exists(container_path))): 
+                raise ValueError("Folder does not exist")
+            
+            if (not (os.path.exists(path))):
+                raise ValueError("Database does not exist")
+            
+            if not self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.processing,
+                                                            current_status=StatusEnum.ready):
+                raise ValueError("Database {} is not ready".format(database_name))
+            vector_store = self._chroma(path)
+            
+            files = os.listdir(container_path)
+            previous_ids = set(self._chunk_ids(vector_store, files))
+            
+            try:
+                start = time.perf_counter()
+                progress = ProgressTracker(self.status_database, database_name)
+                split_documents = self._prepare_data(container_path, database_name, progress)
+                ingestion = self._ingest_documents(
+                    path, vector_store, (filter_complex_metadata([document])[0] for document in split_documents),
+                    build_indexes=False, progress=progress
+                )
+            except Exception as e:
+                #The chunks written so far are dropped, the previous version of every file stays
+                written = [chunk_id for chunk_id in self._chunk_ids(vector_store, files) if chunk_id not in previous_ids]
+                if written:
+                    vector_store._collection.delete(ids=written)
+                self.status_database.add_file_parse_stats(database_name, {
+                    file: {"status": "error", "error": "{}: {}".format(type(e).__name__, e)} for file in files
+                })
+                self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.ready,
+                                                         current_status=StatusEnum.processing)
+                raise
+            
+            #Files uploaded again replace their previous version, unless the new one failed to parse
+            failed = {stats["file"] for stats in self.status_database.get_file_parse_stats(database_name)
+                      if stats["file"] in files and stats["status"] != "ok"}
+            stale = []
+            for chunk_id, file in self._chunk_ids(vector_store, files).items():
+                if (file in failed) != (chunk_id in previous_ids):
+                    #The previous version of a parsed file, or what was written of a file that failed
+                    stale.append(chunk_id)
+            if stale:
+                vector_store._collection.delete(ids=stale)
+            
+            try:
+                self._rebuild_indexes(database_name, vector_store, progress)
+            except Exception as e:
+                self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.error,
+                                                         current_status=StatusEnum.processing)
+                raise
+            self._record_ingestion(database_name, ingestion, time.perf_counter() - start)
+            progress.flush()
+            
+            self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.ready,
+                                                     current_status=StatusEnum.processing)
+
+
+    def _chunk_ids(self, vector_store, files: list) -> dict:
+        #The chunk ids of the given files in a collection, with their file
+        if not files:
+            return {}
+        result = vector_store._collection.get(where={"file": {"$in": list(files)}}, include=["metadatas"])
+        return {chunk_id: (metadata or {}).get("file") for chunk_id, metadata in zip(result["ids"], result["metadatas"])}
+
+
+    def remove_files(self, database_name: str, files: list):
+        """
+            Removes every chunk of the given files from an existing database.
+
+            The chunks are deleted from the collection by their "file" metadata, then the lexical index and
+            the quantized store are rebuilt from the remaining chunks. The database is "processing" during the
+            update and "ready" again once it is complete, or "error" if it fails. A database that is not ready
+            when the job starts is left as it is.
+
+            Args:
+                database_name (str): The database to update.
+                files (List[str]): The names of the files to remove.
+
+            Raises:
+                ValueError: If the database does not exist.
+        """
+        with self.readers.hold(database_name):
+            try:
+                path = os.path.join(self.route, database_name)
+            
+                if (not (os.path.exists(path))):
+                    raise ValueError("Database does not exist")
+            
+                if not self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.processing,
+                                                                current_status=StatusEnum.ready):
+                    raise ValueError("Database {} is not ready".format(database_name))
+                vector_store = self._chroma(path)
+            
+                if files:
+                    vector_store._collection.delete(where={"file": {"$in": list(files)}})
+                self.status_database.delete_file_parse_stats(database_name, files)
+                progress = ProgressTracker(self.status_database, database_name)
+                self._rebuild_indexes(database_name, vector_store, progress)
+                progress.flush()
+            
+                self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.ready,
+                                                         current_status=StatusEnum.processing)
+            
+            except Exception as e:
+                #A database deleted meanwhile stays deleted
+                self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.error,
+                                                         current_status=StatusEnum.processing)
+
+
+    def _rebuild_indexes(self, database_name: str, vector_store, progress=None):
+        """
+        Rebuilds the lexical index and, if the database has or should have one, the quantized store of a database
+        from the chunks and embeddings stored in its collection.
+
+        The indexes are built in a staging directory and swapped in when complete, so searches running on the
+        memory-mapped files of the previous indexes are not affected. The caches are then invalidated.
+        The time spent is added to the persist time of `progress`, if given.
+        """
+        start = time.perf_counter()
+        path = os.path.join(self.route, database_name)
+        staging_path = os.path.join(path, self.REBUILD_DIRECTORY)
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(staging_path)
+        
+        quantization = self.config.quantization
+        if QuantizedStore.exists(path):
+            quantization = QuantizedStore.get_disk_stats(path)["quantization"]
+        
+        lexical_index = LexicalIndexBuilder(staging_path)
+        quantized_store = None
+        if quantization in QuantizedStore.QUANTIZATIONS:
+            quantized_store = QuantizedStoreBuilder(staging_path, quantization)
+        
+        include = ["documents", "metadatas"] + (["embeddings"] if quantized_store is not None else [])
+        offset = 0
+        while True:
+            result = vector_store._collection.get(include=include, limit=self.config.ingest_write_batch_size, offset=offset)
+            if not result["ids"]:
+                break
+            for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+                lexical_index.add(chunk_id, text, metadata or {})
+            if quantized_store is not None:
+                quantized_store.add(result["ids"], result["embeddings"])
+            offset += len(result["ids"])
+        
+        lexical_index.finalize()
+        directories = [LexicalIndex.DIRECTORY]
+        if quantized_store is not None:
+            quantized_store.finalize()
+            directories.append(QuantizedStore.DIRECTORY)
+        
+        for directory in directories:
+            current = os.path.join(path, directory)
+            if os.path.exists(current):
+                os.rename(current, os.path.join(staging_path, directory + ".old"))
+            os.rename(os.path.join(staging_path, directory), current)
+        
+        self.collection_cache.invalidate(database_name)
+        self.lexical_cache.invalidate(database_name)
+        self.quantized_cache.invalidate(database_name)
+        self.result_cache.invalidate(database_name)
+        #Open readers keep the files of the previous indexes until they are closed
+        shutil.rmtree(staging_path, ignore_errors=True)
+        if progress is not None:
+            progress.add(persist_seconds=time.perf_counter() - start)
+            progress.set(bytes_written=self.utils.directory_size(path))
+
+
+    def _save_embeddings(self, database_name, split_documents, progress=None):
         """
         Saves or loads embeddings for the specified database using the provided documents.
 
@@ -138,73 +419,841 @@ class DatabasesManager:
 
         - The method checks if the directory for storing embeddings already exists.
         - If the directory exists, it loads the embeddings from this directory using `Chroma`.
-        - If the directory does not exist, it creates a new embeddings store from the provided documents
-        using `Chroma.from_documents`, then saves it to the specified path.
+        - If the directory does not exist, it creates a new collection in the specified path and fills it with
+        `_ingest_documents`, which embeds the documents in batches on the embedding pool and writes them to the
+        collection in bulk.
+        - Next to the Chroma files it builds the BM25 `LexicalIndex` of the same chunks, sharing their ids,
+        and, if a quantization is configured, the `QuantizedStore` of their embeddings. Only then the database
+        is marked as ready, if it is still processing. A database deleted or reclaimed during the build raises
+        a `ValueError` instead, and `create_database` removes the directory written for it.
 
         Args:
             database_name (str): The name of the database, which is used to determine the directory path
                                 for storing the embeddings.
-            split_documents (List[Document]): A list of documents to be used for creating embeddings.
-                                            The documents should be pre-processed and split as needed.
+            split_documents (Iterable[Document]): The documents to be used for creating embeddings, usually the
+                                            generator returned by `_prepare_data`. They are consumed lazily.
+            progress (ProgressTracker, optional): Receives the chunks produced, embedded and written, the bytes
+                                                  written and the embed and persist times.
     """
         
         path =  os.path.join(self.route, database_name)
         vector_store = path
                
         if os.path.exists(vector_store):
-            vector_store_loaded = Chroma(persist_directory=vector_store, embedding_function=self.embedding_model)
+            vector_store_loaded = self._chroma(vector_store)
         else:
-            vector_store = Chroma.from_documents(
-                documents=filter_complex_metadata(split_documents),
-                embedding=self.embedding_model,
-                persist_directory = path
-            )
-            self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.ready)
+            vector_store = self._chroma(path)
             
+            start = time.perf_counter()
+            ingestion = self._ingest_documents(path, vector_store, (filter_complex_metadata([document])[0] for document in split_documents),
+                                               progress=progress)
+            self._record_ingestion(database_name, ingestion, time.perf_counter() - start)
+            if progress is not None:
+                progress.flush()
             
-    def get_context(self, database_name: str, query_text: str, top_k: int = 5, similarity_threshold: float = 0.7):
+            if not self.status_database.update_entry_status(database_id=database_name, new_status=StatusEnum.ready,
+                                                            current_status=StatusEnum.processing):
+                raise ValueError("Database {} is no longer processing".format(database_name))
+            
+            
+    def _ingest_documents(self, path: str, vector_store, documents, build_indexes: bool = True, progress=None) -> dict:
+        """
+        Embeds documents in batches on the embedding pool and writes them to a collection and to the
+        lexical index and quantized store of the database.
+
+        Up to `EmbeddingPool.max_in_flight` batches are embedded at the same time. Finished batches are
+        consumed in submission order and buffered until `ingest_write_batch_size` chunks can be written
+        to the collection in one bulk insert.
+
+        Every batch is first looked up in the `ChunkEmbeddingCache`, and only the chunks never embedded
+        before with the current model go to the embedding pool. Their vectors are then added to the cache.
+
+        Args:
+            path (str): The directory of the database.
+            vector_store (Chroma): The collection to fill.
+            documents (Iterable[Document]): The chunks to ingest.
+            build_indexes (bool, optional): Whether to build the lexical index and quantized store from the
+                                            ingested chunks. Incremental updates write the collection only and
+                                            rebuild them afterwards with `_rebuild_indexes`. Defaults to True.
+            progress (ProgressTracker, optional): Receives the chunks produced, embedded and written, the bytes
+                                                  written and the embed and persist times.
+
+        Returns:
+            dict: The number of chunks ingested ("chunks") and the hits and misses of the chunk embedding
+                  cache ("cache_hits", "cache_misses").
+        """
+        embedding_pool = self._get_embedding_pool()
+        lexical_index = None
+        quantized_store = None
+        if build_indexes:
+            lexical_index = LexicalIndexBuilder(path)
+            if self.config.quantization in QuantizedStore.QUANTIZATIONS:
+                quantized_store = QuantizedStoreBuilder(path, self.config.quantization)
+        
+        write_buffer = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+        pending = deque()
+        batch = []
+        stats = {"chunks": 0, "cache_hits": 0, "cache_misses": 0}
+        
+        def submit(batch):
+            ids = [uuid.uuid4().hex for _ in batch]
+            if lexical_index is not None:
+                for chunk_id, document in zip(ids, batch):
+                    lexical_index.add(chunk_id, document.page_content, document.metadata)
+            texts = [document.page_content for document in batch]
+            
+            #Without the cache the text itself is the key, so repeated texts are still embedded once
+            keys, cached = texts, {}
+            if self.chunk_embedding_cache is not None:
+                keys = [self.chunk_embedding_cache.key(text) for text in texts]
+                cached = self.chunk_embedding_cache.get_many(keys)
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in cached:
+                    missing.setdefault(key, text)
+            hits = sum(1 for key in keys if key in cached)
+            stats["cache_hits"] += hits
+            stats["cache_misses"] += len(keys) - hits
+            
+            if missing:
+                future = embedding_pool.submit_timed(list(missing.values()))
+            else:
+                future = Future()
+                future.set_result(([], 0.0))
+            pending.append((ids, batch, keys, cached, list(missing), future))
+            if progress is not None:
+                progress.add(chunks_produced=len(batch))
+        
+        def collect():
+            ids, batch, keys, cached, missing_keys, future = pending.popleft()
+            new_embeddings, embed_seconds = future.result()
+            if progress is not None:
+                progress.add(chunks_embedded=len(batch), embed_seconds=embed_seconds)
+            if self.chunk_embedding_cache is not None:
+                self.chunk_embedding_cache.put_many(missing_keys, new_embeddings)
+            new_embeddings = dict(zip(missing_keys, new_embeddings))
+            embeddings = [cached[key] if key in cached else new_embeddings[key] for key in keys]
+            if quantized_store is not None:
+                quantized_store.add(ids, embeddings)
+            write_buffer["ids"].extend(ids)
+            write_buffer["embeddings"].extend(embeddings)
+            write_buffer["documents"].extend(document.page_content for document in batch)
+            write_buffer["metadatas"].extend(document.metadata for document in batch)
+            if len(write_buffer["ids"]) >= self.config.ingest_write_batch_size:
+                flush()
+        
+        def flush():
+            start = time.perf_counter()
+            written = len(write_buffer["ids"])
+            self._flush_writes(vector_store, write_buffer)
+            if progress is not None:
+                progress.add(chunks_written=written, persist_seconds=time.perf_counter() - start)
+                progress.set(bytes_written=self.utils.directory_size(path))
+        
+        for document in documents:
+            batch.append(document)
+            stats["chunks"] += 1
+            if len(batch) >= embedding_pool.batch_size:
+                submit(batch)
+                batch = []
+                while len(pending) >= embedding_pool.max_in_flight():
+                    collect()
+        if batch:
+            submit(batch)
+        while pending:
+            collect()
+        flush()
+        
+        start = time.perf_counter()
+        if lexical_index is not None:
+            lexical_index.finalize()
+        if quantized_store is not None:
+            quantized_store.finalize()
+        if progress is not None:
+            progress.add(persist_seconds=time.perf_counter() - start)
+            progress.set(bytes_written=self.utils.directory_size(path))
+        return stats
+
+
+    def _flush_writes(self, vector_store, write_buffer: dict):
+        if not write_buffer["ids"]:
+            return
+        vector_store._collection.add(
+            ids=write_buffer["ids"],
+            embeddings=write_buffer["embeddings"],
+            documents=write_buffer["documents"],
+            metadatas=write_buffer["metadatas"]
+        )
+        for values in write_buffer.values():
+            values.clear()
+
+
+    def _get_embedding_pool(self) -> EmbeddingPool:
+        #Created on the first ingestion, the process executor loads one model per worker
+        with self.embedding_pool_lock:
+            if self.embedding_pool is None:
+                self.embedding_pool = EmbeddingPool(self.config, self.embedding_model)
+            return self.embedding_pool
+
+
+    def _record_ingestion(self, database_name: str, ingestion: dict, seconds: float):
+        chunks = ingestion["chunks"]
+        lookups = ingestion["cache_hits"] + ingestion["cache_misses"]
+        stats = {
+            "chunks": chunks,
+            "seconds": seconds,
+            "chunks_per_second": (chunks / seconds) if seconds > 0 else 0.0,
+            "embedding_cache_hits": ingestion["cache_hits"],
+            "embedding_cache_misses": ingestion["cache_misses"],
+            "embedding_cache_hit_rate": (ingestion["cache_hits"] / lookups) if lookups else 0.0,
+        }
+        self.status_database.add_ingestion_stats(database_name, stats)
+        entry = {"database_id": database_name, **stats, "files": self.status_database.get_file_parse_stats(database_name)}
+        self.ingestion_history.append(entry)
+
+
+    def get_database_progress(self, database_name: str):
+        """
+        Returns the status of a database with the progress of its last ingestion job: files and pages parsed,
+        chunks produced, embedded and written, bytes written, per-stage seconds, throughput and ETA.
+
+        Returns:
+            dict: "status" and "progress" (None for databases built before progress was tracked).
+        """
+        status = self.status_database.get_database_status(database_id=database_name)
+        progress = self.status_database.get_ingestion_progress(database_name)
+        return {
+            "database_id": database_name,
+            "status": status,
+            "progress": ProgressTracker.describe(progress, status) if progress is not None else None
+        }
+
+
+    def get_ingestion_stats(self) -> list:
+        """
+        Returns the chunk count, duration, throughput, embedding cache hit rate and per-file parse stats of the
+        most recent ingestions.
+        """
+        return list(self.ingestion_history)
+
+
+    def get_context(self, database_name: str, query_text: str, top_k: int = 5, similarity_threshold: float = None,
+                    retrieval_mode: str = "dense"):
         """
         Performs retrieval-augmented search on the specified database using the provided query text.
 
         This method retrieves documents from a database based on a query text. It uses an existing embeddings
         store to perform the search and return relevant documents based on similarity.
 
-        - The method initializes the `Chroma` retriever with embeddings stored in the specified directory.
-        - It then creates a retriever object configured to use "mmr" (Maximum Marginal Relevance) for the search,
-        with the number of top documents to retrieve specified by `top_k`.
-        - The retriever is used to find and return documents that are relevant to the provided query text.
+        - The `Chroma` collection is taken from the collection cache, so it is only opened on a miss.
+        - The query embedding is taken from the query embedding cache, so repeated questions do not run
+        the embedding model again.
+        - The collection is searched by that vector for the `top_k` most similar documents, and the `ScoreCutoff`
+        keeps the ones above the similarity threshold and before the largest drop of similarity, so fewer
+        than `top_k` documents are returned when the tail is not relevant.
+
+        The `retrieval_mode` selects how the search is done:
+        - "dense": vector search only (default).
+        - "lexical": BM25 search over the `LexicalIndex` of the database. It needs neither the embedding model
+        nor the collection, which makes it the fast path for exact identifiers.
+        - "hybrid": dense and lexical candidates fused with reciprocal-rank fusion.
+        Databases created before the lexical index existed fall back to "dense".
 
         Args:
             database_name (str): The name of the database to retrieve embeddings from.
             query_text (str): The text of the query used to search for relevant documents.
-            top_k (int, optional): The number of top documents to retrieve. Defaults to 5.
-            similarity_threshold (float, optional): The minimum similarity score required for documents to be
-                                                    considered relevant. Defaults to 0.7.
+            top_k (int, optional): The maximum number of documents to retrieve. Defaults to 5.
+            similarity_threshold (float, optional): The minimum cosine similarity required for documents to be
+                                                    considered relevant in "dense" mode. Defaults to the
+                                                    `similarity_threshold` of the configuration.
+            retrieval_mode (str, optional): "dense", "lexical" or "hybrid". Defaults to "dense".
 
         Returns:
-            List[Document]: A list of retrieved documents that match the query text, ordered by relevance.
+            List[Document]: A list of retrieved documents that match the query text, ordered by relevance. Each
+                            document carries its score in the "score" metadata: the cosine similarity in
+                            "dense" mode, the BM25 score in "lexical" mode and the fused rank score in "hybrid" mode.
     """
         
+        #Held before the status check, so the reclaimer can not remove the files during the search
+        with self.readers.hold(database_name):
+            try:
+                database_status = self.status_database.get_database_status(database_id=database_name)
         
-        path = os.path.join(self.route, database_name)    
-        
-        try:
-            database_status = self.status_database.get_database_status(database_id=database_name)
+                if (database_status != StatusEnum.ready):
+                    return None     
+            
+                if retrieval_mode not in self.RETRIEVAL_MODES:
+                    raise ValueError("Unknown retrieval mode {}".format(retrieval_mode))
+            
+                if retrieval_mode != "dense" and not self._has_lexical_index(database_name):
+                    retrieval_mode = "dense"
+            
+                start = time.perf_counter()
+            
+                if retrieval_mode == "lexical":
+                    scored_documents = self._lexical_search(database_name, query_text, top_k)
+                elif retrieval_mode == "hybrid":
+                    candidates = top_k * self.config.hybrid_candidate_factor
+                    scored_documents = self._reciprocal_rank_fusion(
+                        [self._dense_search(database_name, query_text, candidates),
+                         self._lexical_search(database_name, query_text, candidates)],
+                        top_k
+                    )
+                else:
+                    #Only cosine similarities are comparable between queries, BM25 and fused scores are not
+                    scored_documents = self.score_cutoff.apply(self._dense_search(database_name, query_text, top_k),
+                                                               similarity_threshold)
+            
+                self.retrieval_latency.record(retrieval_mode, time.perf_counter() - start)
+            
+                retrieved_docs = self._with_scores(scored_documents[:top_k])
+            
+                return retrieved_docs
         
-            if (database_status != StatusEnum.ready):
-                return None     
+            except Exception as e:
+                raise RuntimeError("Error: cannot get context from {}. Original error: {}".format(database_name, e))
+
+
+    def check_top_k(self, top_k) -> int:
+        """
+        Returns the number of documents to retrieve, 5 if None. Larger values than `max_top_k` of the
+        configuration are lowered to it.
+
+        Raises:
+            ValueError: If `top_k` is not a positive integer.
+        """
+        if top_k is None:
+            return 5
+        if isinstance(top_k, bool) or not isinstance(top_k, int):
+            raise ValueError("top_k must be an integer")
+        if top_k < 1:
+            raise ValueError("top_k must be positive")
+        return min(top_k, self.config.max_top_k)
+
+
+    def get_context_batch(self, items: list):
+        """
+        Performs several retrievals at once, amortizing the model and collection overhead.
+
+        All the queries are embedded in one batched forward pass (cached embeddings are reused), then the
+        queries of every collection are searched together, in one query of the collection or one pass over its
+        quantized codes. A failing item does not fail the batch: its result carries an error instead of documents.
+
+        Args:
+            items (List[dict]): Retrieval requests, each one with:
+                                - "query" (str): The text of the query.
+                                - "database_id" (str): The database to search.
+                                - "top_k" (int, optional): The maximum number of documents to retrieve, up to
+                                  `max_top_k` of the configuration. Defaults to 5.
+                                - "similarity_threshold" (float, optional): As in `get_context`.
+
+        Returns:
+            List[dict]: One result per item, in the same order. Each result has either a "documents" key with
+                        the list of retrieved `Document` objects or an "error" key with the reason.
+        """
+        with ExitStack() as holds:
+            for database_name in dict.fromkeys(item.get("database_id") for item in items):
+                holds.enter_context(self.readers.hold(database_name))
+            return self._get_context_batch(items)
+
+
+    def _get_context_batch(self, items: list):
+        results = [None] * len(items)
+        pending = []
+
+        for position, item in enumerate(items):
+            database_name = item.get("database_id")
+            try:
+                database_status = self.status_database.get_database_status(database_id=database_name)
+            except Exception:
+                database_status = None
+
+            if database_status == StatusEnum.ready:
+                pending.append(position)
+            elif database_status == StatusEnum.processing:
+                results[position] = {"error": "Processing Database"}
+            elif database_status == StatusEnum.deleted:
+                results[position] = {"error": "Deleted Database"}
+            else:
+                results[position] = {"error": "Unknown Database"}
+
+        if not pending:
+            return results
+
+        embeddings = self.query_embedding_cache.get_many([items[position]["query"] for position in pending])
+
+        groups = {}
+        for position, embedding in zip(pending, embeddings):
+            try:
+                top_k = self.check_top_k(items[position].get("top_k"))
+            except ValueError:
+                results[position] = {"error": "Invalid top_k"}
+                continue
+            groups.setdefault(items[position]["database_id"], []).append((position, embedding, top_k))
+
+        for database_name, group in groups.items():
+            try:
+                searched = self._search_by_vectors(database_name, [embedding for _, embedding, _ in group],
+                                                   [top_k for _, _, top_k in group])
+            except Exception as e:
+                for position, _, _ in group:
+                    results[position] = {"error": "Retrieval failed"}
+                continue
+            for (position, _, _), scored_documents in zip(group, searched):
+                try:
+                    scored_documents = self.score_cutoff.apply(scored_documents, items[position].get("similarity_threshold"))
+                    results[position] = {"documents": self._with_scores(scored_documents)}
+                except Exception as e:
+                    results[position] = {"error": "Retrieval failed"}
+
+        return results
+
+
+    def get_context_multi(self, database_names: list, query_text: str, top_k: int = 5, similarity_threshold: float = None,
+                          retrieval_mode: str = "dense"):
+        """
+        Performs a retrieval over several databases at once and merges the results by score.
+
+        The query is embedded once, then every ready database is searched concurrently on the search
+        executor, so the latency stays close to the one of the slowest single search instead of the sum
+        of all of them. Databases that are not ready are skipped.
+
+        In "dense" mode the hits are merged by cosine similarity. BM25 scores of different databases are not
+        comparable, so in "lexical" and "hybrid" mode the rankings of every database (its dense and lexical
+        candidates in "hybrid" mode) are fused with reciprocal-rank fusion instead, as `get_context` does.
+
+        Args:
+            database_names (List[str]): The names of the databases to search.
+            query_text (str): The text of the query used to search for relevant documents.
+            top_k (int, optional): The maximum number of documents of the merged result. Defaults to 5.
+            similarity_threshold (float, optional): As in `get_context`, only used in "dense" mode.
+            retrieval_mode (str, optional): As in `get_context`. Defaults to "dense".
+
+        Returns:
+            List[Document]: Up to `top_k` documents ordered by relevance among all the databases, cut by the
+                            `ScoreCutoff` in "dense" mode. Each document carries the database it came from in
+                            its "database_id" metadata and its score in "score".
+        """
+        with ExitStack() as holds:
+            for database_name in dict.fromkeys(database_names):
+                holds.enter_context(self.readers.hold(database_name))
+            try:
+                if retrieval_mode not in self.RETRIEVAL_MODES:
+                    raise ValueError("Unknown retrieval mode {}".format(retrieval_mode))
             
-            vector_store_loaded = Chroma(persist_directory=path, embedding_function=self.embedding_model)
+                ready_databases = [database_name for database_name in dict.fromkeys(database_names)
+                                   if self.status_database.get_database_status(database_id=database_name) == StatusEnum.ready]
+                if not ready_databases:
+                    return []
             
-            retriever = vector_store_loaded.as_retriever(search_type="similarity", search_kwargs={"k": top_k})
+                modes = {database_name: retrieval_mode if retrieval_mode == "dense" or self._has_lexical_index(database_name)
+                         else "dense" for database_name in ready_databases}
+                #Only the lexical searches go without the embedding model
+                query_embedding = None
+                if any(mode != "lexical" for mode in modes.values()):
+                    query_embedding = self.query_embedding_cache.get(query_text)
+                candidates = top_k * self.config.hybrid_candidate_factor if retrieval_mode == "hybrid" else top_k
             
-            retrieved_docs = retriever.invoke(query_text)
+                def search(database_name):
+                    rankings = []
+                    if modes[database_name] != "lexical":
+                        rankings.append(self._search_by_vector(database_name, query_embedding, candidates))
+                    if modes[database_name] != "dense":
+                        rankings.append(self._lexical_search(database_name, query_text, candidates))
+                    for scored_documents in rankings:
+                        for document, _ in scored_documents:
+                            document.metadata["database_id"] = database_name
+                    return rankings
             
-            return retrieved_docs
+                futures = [self.search_executor.submit(search, database_name) for database_name in ready_databases]
+                rankings = [ranking for future in futures for ranking in future.result()]
+            
+                if retrieval_mode == "dense":
+                    merged = [scored for ranking in rankings for scored in ranking]
+                    merged.sort(key=lambda scored: scored[1], reverse=True)
+                    scored_documents = self.score_cutoff.apply(merged[:top_k], similarity_threshold)
+                else:
+                    scored_documents = self._reciprocal_rank_fusion(rankings, top_k)
+            
+                return self._with_scores(scored_documents)
         
-        except Exception as e:
-            raise RuntimeError("Error: cannot get context from {}. Original error: {}".format(database_name, e))
-    
+            except Exception as e:
+                raise RuntimeError("Error: cannot get context from {}. Original error: {}".format(database_names, e))
 
+
+    def _with_scores(self, scored_documents: list):
+        #The metadata of the documents is a copy made for every search, it can be annotated
+        for document, score in scored_documents:
+            document.metadata["score"] = float(score)
+        return [document for document, _ in scored_documents]
+
+
+    def _dense_search(self, database_name: str, query_text: str, k: int):
+        query_embedding = self.query_embedding_cache.get(query_text)
+        return self._search_by_vector(database_name, query_embedding, k)
+
+
+    def _search_by_vector(self, database_name: str, query_embedding, k: int):
+        return self._search_by_vectors(database_name, [query_embedding], [k])[0]
+
+
+    def _search_by_vectors(self, database_name: str, query_embeddings: list, ks: list):
+        """
+        Vector search of several queries on a database. Databases with a `QuantizedStore` are searched on
+        their codes and rescored exactly, without touching the HNSW index of the collection; the others are
+        searched in Chroma. Queries close enough to a recent query of the same database are served from the
+        `SemanticResultCache`, the others are searched together in one query of the collection or one pass
+        over the codes.
+
+        Returns:
+            List[List[Tuple[Document, float]]]: The hits of every query ordered by decreasing cosine similarity.
+        """
+        results = [None] * len(query_embeddings)
+        missing = []
+        #Read before searching, the hits of a search that overlaps an update are not cached
+        generation = self.result_cache.generation(database_name)
+        for position, (query_embedding, k) in enumerate(zip(query_embeddings, ks)):
+            cached = self.result_cache.get(database_name, query_embedding, k)
+            if cached is None:
+                missing.append(position)
+            else:
+                #New documents every time, the callers annotate their metadata
+                results[position] = [(Document(id=chunk_id, page_content=text, metadata=dict(metadata)), score)
+                                     for chunk_id, text, metadata, score in cached]
+        if not missing:
+            return results
+        
+        missing_embeddings = [query_embeddings[position] for position in missing]
+        missing_ks = [ks[position] for position in missing]
+        if self.quantized_cache.contains(database_name) or QuantizedStore.exists(os.path.join(self.route, database_name)):
+            quantized_store = self.quantized_cache.get(database_name)
+            hits = quantized_store.search_many(missing_embeddings, missing_ks, self.config.quantized_rescore_candidates)
+            searched = self._fetch_documents(database_name, hits)
+        else:
+            vector_store_loaded = self.collection_cache.get(database_name)
+            searched = self._search_with_scores(vector_store_loaded, missing_embeddings, missing_ks)
         
+        for position, scored_documents in zip(missing, searched):
+            self.result_cache.put(database_name, query_embeddings[position], ks[position],
+                                  [(document.id, document.page_content, dict(document.metadata), score)
+                                   for document, score in scored_documents], generation=generation)
+            results[position] = scored_documents
+        return results
+
+
+    def _fetch_documents(self, database_name: str, hit_lists: list):
+        """
+        Turns lists of (chunk id, score) pairs into lists of (Document, score) pairs, reading the chunks from
+        the lexical index when there is one and from the collection otherwise, in one read for all the lists.
+        """
+        chunk_ids = list(dict.fromkeys(chunk_id for hits in hit_lists for chunk_id, _ in hits))
+        if not chunk_ids:
+            return [[] for _ in hit_lists]
         
+        if self._has_lexical_index(database_name):
+            lexical_index = self.lexical_cache.get(database_name)
+            chunks = {chunk_id: lexical_index.get_document(chunk_id) for chunk_id in chunk_ids}
+        else:
+            vector_store_loaded = self.collection_cache.get(database_name)
+            result = vector_store_loaded._collection.get(ids=chunk_ids, include=["documents", "metadatas"])
+            chunks = {chunk_id: (text, metadata) for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])}
+        #A new Document for every hit, the callers annotate their metadata
+        return [[(Document(id=chunk_id, page_content=chunks[chunk_id][0], metadata=dict(chunks[chunk_id][1] or {})), score)
+                 for chunk_id, score in hits if chunk_id in chunks]
+                for hits in hit_lists]
+
+
+    def _lexical_search(self, database_name: str, query_text: str, k: int):
+        """
+        Searches the BM25 index of a database. The documents are read from the index itself.
+
+        Returns:
+            List[Tuple[Document, float]]: The hits ordered by decreasing BM25 score.
+        """
+        lexical_index = self.lexical_cache.get(database_name)
+        scored_documents = []
+        for chunk_id, score in lexical_index.search(query_text, k):
+            text, metadata = lexical_index.get_document(chunk_id)
+            scored_documents.append((Document(id=chunk_id, page_content=text, metadata=metadata), score))
+        return scored_documents
+
+
+    def _reciprocal_rank_fusion(self, rankings: list, k: int):
+        """
+        Fuses several rankings of (Document, score) with reciprocal-rank fusion: every document scores
+        the sum of 1 / (RRF_K + rank) over the rankings it appears in.
+
+        Returns:
+            List[Tuple[Document, float]]: Up to `k` documents ordered by decreasing fused score.
+        """
+        fused = {}
+        for ranking in rankings:
+            for rank, (document, _) in enumerate(ranking, start=1):
+                key = document.id or document.page_content
+                entry = fused.setdefault(key, [document, 0.0])
+                entry[1] += 1.0 / (self.RRF_K + rank)
+        ordered = sorted(fused.values(), key=lambda entry: entry[1], reverse=True)
+        return [(document, score) for document, score in ordered[:k]]
+
+
+    def _has_lexical_index(self, database_name: str) -> bool:
+        return self.lexical_cache.contains(database_name) or LexicalIndex.exists(os.path.join(self.route, database_name))
+
+
+    def _search_with_scores(self, vector_store, query_embeddings: list, ks: list):
+        """
+        Searches a collection with several query vectors at once and scores every hit with its cosine
+        similarity to its query.
+
+        Chroma only returns distances in the space of the collection (L2 by default), which are not
+        comparable between queries, so the stored embeddings are fetched with the hits and the cosine
+        similarity is computed here.
+
+        Returns:
+            List[List[Tuple[Document, float]]]: Up to `ks[i]` hits of every query ordered by decreasing similarity.
+        """
+        result = vector_store._collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=max(ks),
+            include=["documents", "metadatas", "embeddings"]
+        )
+        
+        results = []
+        for position, (query_embedding, k) in enumerate(zip(query_embeddings, ks)):
+            documents = result["documents"][position]
+            if not documents:
+                results.append([])
+                continue
+            
+            ids = result["ids"][position]
+            metadatas = result["metadatas"][position]
+            embeddings = np.asarray(result["embeddings"][position], dtype=np.float32)
+            query = np.asarray(query_embedding, dtype=np.float32)
+            
+            norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query)
+            scores = (embeddings @ query) / np.where(norms == 0, 1.0, norms)
+            
+            scored_documents = [
+                (Document(id=chunk_id, page_content=text, metadata=dict(metadata or {})), float(score))
+                for chunk_id, text, metadata, score in zip(ids, documents, metadatas, scores)
+            ]
+            scored_documents.sort(key=lambda scored: scored[1], reverse=True)
+            results.append(scored_documents[:k])
+        return results
+
+
+    def warm_up(self, database_name: str) -> bool:
+        """
+        Preloads the collection of a ready database into the collection cache so the first
+        retrieval does not pay for opening it.
+
+        Args:
+            database_name (str): The name of the database to preload.
+
+        Returns:
+            bool: True if the collection was loaded, False if it was already cached or is not ready.
+        """
+        with self.readers.hold(database_name):
+            if self.status_database.get_database_status(database_id=database_name) != StatusEnum.ready:
+                return False
+            return self.collection_cache.warm_up(database_name)
+
+
+    def get_cache_stats(self) -> dict:
+        """
+        Returns hit/miss and resident-size counters of the retrieval caches.
+        """
+        return {
+            "collections": self.collection_cache.get_stats(),
+            "query_embeddings": self.query_embedding_cache.get_stats(),
+            "lexical_indexes": self.lexical_cache.get_stats(),
+            "quantized_stores": self.quantized_cache.get_stats(),
+            "retrieval_results": self.result_cache.get_stats(),
+            "chunk_embeddings": self.chunk_embedding_cache.get_stats() if self.chunk_embedding_cache is not None else None
+        }
+
+
+    def get_quantization_stats(self) -> dict:
+        """
+        Returns, for every database with a `QuantizedStore` on disk, the size of its float vectors and of
+        the codes actually held in memory.
+        """
+        stats = {}
+        if not os.path.exists(self.route):
+            return stats
+        for database_name in os.listdir(self.route):
+            database_path = os.path.join(self.route, database_name)
+            if QuantizedStore.exists(database_path):
+                stats[database_name] = QuantizedStore.get_disk_stats(database_path)
+        return stats
+
+
+    def merge_context(self, documents: list) -> list:
+        """
+        Joins the overlapping chunks of the same page and drops duplicated passages of a retrieved context,
+        if `context_merge` is enabled. See `ContextMerger`.
+        """
+        if not self.config.context_merge or not documents:
+            return documents
+        return self.context_merger.merge(documents)
+
+
+    def get_context_merge_stats(self) -> dict:
+        """
+        Returns the chunks, bytes and tokens of the contexts before and after merging.
+        """
+        return self.context_merger.get_stats()
+
+
+    def get_cutoff_stats(self) -> dict:
+        """
+        Returns the candidates and returned chunks of the adaptive top-k of the dense searches.
+        """
+        return self.score_cutoff.get_stats()
+
+
+    def get_latency_stats(self) -> dict:
+        """
+        Returns the retrieval latency of each retrieval mode.
+        """
+        return self.retrieval_latency.get_stats()
+
+
+    def _on_status_change(self, database_name: str, new_status: str):
+        """
+        Keeps the caches in sync with the status table: deleted databases are dropped, cached results
+        are dropped on any change and, if enabled, databases that just became ready are preloaded in the
+        background. The listeners run in the thread that reports the change, which can be a request waiting
+        for the status of its database (see `StatusDatabaseManager.follow_other_processes`).
+        """
+        #Results of a database being updated or rebuilt are stale
+        self.result_cache.invalidate(database_name)
+        if new_status == StatusEnum.deleted:
+            self.collection_cache.invalidate(database_name)
+            self.lexical_cache.invalidate(database_name)
+            self.quantized_cache.invalidate(database_name)
+        elif new_status == StatusEnum.ready and self.config.collection_cache_warm_up:
+            self.warm_up_executor.submit(self.warm_up, database_name)
+
+
+    def _on_remote_status_change(self, database_name: str, new_status: str):
+        """
+        Another worker process finished changing the files of a database (see `StatusDatabaseManager.follow_other_processes`):
+        the handles of this process, Chroma keeps the HNSW segment in memory, are dropped so the next search
+        opens the new files.
+        """
+        #Searches only run on ready databases, none is using the handles once the update finished
+        if new_status != StatusEnum.processing:
+            self.release_database(database_name)
+
+
+    def release_database(self, database_name: str):
+        """
+        Drops every open handle of a database before its directory is removed: the cached stores and the
+        Chroma client of its directory, which keeps the SQLite file and the HNSW segment open.
+        """
+        self.collection_cache.invalidate(database_name)
+        self.lexical_cache.invalidate(database_name)
+        self.quantized_cache.invalidate(database_name)
+        self.result_cache.invalidate(database_name)
+        self._close_chroma_system(database_name, files_changed=True)
+
+
+    def _discard_database(self, database_name: str):
+        #The directory of a build whose database was deleted or reclaimed meanwhile
+        self.release_database(database_name)
+        shutil.rmtree(os.path.join(self.route, database_name), ignore_errors=True)
+
+
+    def _close_chroma_system(self, database_name: str, files_changed: bool = False):
+        """
+        Stops the Chroma system of a database directory once no search of this process uses it. The `Chroma`
+        handles only wrap it, the system keeps the SQLite file and the HNSW segment loaded until it is stopped.
+
+        Evicted handles (`files_changed` False) keep the system if the database is cached again meanwhile,
+        as the new handle reuses it. Otherwise it is dropped right away so the next search opens the new files.
+        """
+        path = os.path.join(self.route, database_name)
+        if files_changed:
+            system = self._pop_chroma_system(path)
+            if system is not None:
+                self.readers.when_released(database_name, lambda: self._stop_chroma_system(database_name, system))
+            return
+
+        def close_unused():
+            if self.collection_cache.contains(database_name):
+                return
+            system = self._pop_chroma_system(path)
+            if system is not None:
+                self._stop_chroma_system(database_name, system)
+
+        self.readers.when_released(database_name, close_unused)
+
+
+    def _pop_chroma_system(self, path: str):
+        try:
+            from chromadb.api.shared_system_client import SharedSystemClient
+            with self.chroma_lock:
+                return SharedSystemClient._identifier_to_system.pop(path, None)
+        except Exception as e:
+            #Internal API of chromadb, the files are removed anyway
+            print(f"Could not find the Chroma client of {path}: {e}")
+            return None
+
+
+    @staticmethod
+    def _stop_chroma_system(database_name: str, system):
+        try:
+            system.stop()
+        except Exception as e:
+            print(f"Could not release the Chroma client of {database_name}: {e}")
+
+
+    def _open_vector_store(self, database_name: str):
+        path = os.path.join(self.route, database_name)
+        if not os.path.exists(path):
+            raise ValueError("Database {} does not exist".format(database_name))
+        return self._chroma(path)
+
+
+    def _chroma(self, path: str):
+        #chromadb registers the system of a directory before starting it, a concurrent open would get it stopped
+        with self.chroma_lock:
+            return Chroma(persist_directory=path, embedding_function=self.embedding_model)
+
+
+    def _estimate_resident_size(self, database_name: str) -> int:
+        #The HNSW segment and the SQLite pages are loaded from disk, their size on disk is a good estimate.
+        #The lexical index, the quantized store and a rebuild in progress share the directory but not the budget
+        path = os.path.join(self.route, database_name)
+        size = 0
+        for name in os.listdir(path):
+            if name in (LexicalIndex.DIRECTORY, QuantizedStore.DIRECTORY, self.REBUILD_DIRECTORY):
+                continue
+            current = os.path.join(path, name)
+            size += self.utils.directory_size(current) if os.path.isdir(current) else os.path.getsize(current)
+        return size
+
+
+    def _open_lexical_index(self, database_name: str):
+        return LexicalIndex.load(os.path.join(self.route, database_name))
+
+
+    def _estimate_lexical_size(self, database_name: str) -> int:
+        #Postings and texts are memory-mapped, only the vocabulary and the chunk metadata are resident
+        path = os.path.join(self.route, database_name, LexicalIndex.DIRECTORY)
+        return (os.path.getsize(os.path.join(path, "vocabulary.json"))
+                + os.path.getsize(os.path.join(path, "documents.json")))
+
+
+    def _open_quantized_store(self, database_name: str):
+        return QuantizedStore.load(os.path.join(self.route, database_name))
+
+
+    def _estimate_quantized_size(self, database_name: str) -> int:
+        #The float vectors are memory-mapped, only the codes are resident
+        path = os.path.join(self.route, database_name, QuantizedStore.DIRECTORY)
+        size = os.path.getsize(os.path.join(path, "codes.npy"))
+        if os.path.exists(os.path.join(path, "scale.npy")):
+            size += os.path.getsize(os.path.join(path, "scale.npy"))
+        return size
@@ -0,0 +1,167 @@
+from langchain_core.embeddings import Embeddings
+
+import numpy as np
+import os
+
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def build_embedding_model(config, preload_for_fork: bool = False):
+    """
+    Builds the embedding model selected by `config.embedding_backend`.
+
+    - "torch": `HuggingFaceEmbeddings` (sentence-transformers on PyTorch fp32), the original backend.
+    - "onnx": the same model exported to ONNX and run with ONNX Runtime.
+    - "onnx-int8": the ONNX model with its weights dynamically quantized to int8.
+
+    All backends return vectors of the same model, so existing databases stay valid when switching.
+
+    With `preload_for_fork` the model is loaded to be shared by the worker processes of `PreforkServer`.
+    The thread pools of the runtimes do not survive a fork, so none is started before it: PyTorch is
+    limited to one thread until `set_worker_threads` sizes it in every worker, and ONNX Runtime, whose
+    threads start with the session, runs on one thread per worker.
+
+    Args:
+        config (RetrievalConfig): The RAD agent configuration.
+        preload_for_fork (bool, optional): Whether the process forks workers after loading the model.
+                                           Defaults to False.
+
+    Returns:
+        Embeddings: A LangChain embeddings object.
+    """
+    backend = config.embedding_backend
+    if backend not in BACKENDS:
+        raise ValueError("Unknown embedding backend {}".format(backend))
+
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        if preload_for_fork:
+            import torch
+            torch.set_num_threads(1)
+        return HuggingFaceEmbeddings(model_name=config.embedding_model)
+
+    return OnnxEmbeddings(
+        model_name=config.embedding_model,
+        cache_dir=config.embedding_cache_dir,
+        quantize=(backend == "onnx-int8"),
+        batch_size=config.embedding_batch_size,
+        intra_op_threads=1 if preload_for_fork else config.onnx_intra_op_threads
+    )
+
+
+def set_worker_threads(config, workers: int):
+    """
+    Gives the model of a worker process forked by `PreforkServer` its share of the cores. Only PyTorch
+    can be resized once the model is loaded.
+
+    Args:
+        config (RetrievalConfig): The RAD agent configuration.
+        workers (int): The number of worker processes.
+    """
+    if config.embedding_backend == "torch":
+        import torch
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+        Sentence-transformers model run with ONNX Runtime on CPU.
+
+        On first use the transformer of the sentence-transformers model is exported to ONNX (and
+        optionally quantized to int8) into `cache_dir/<model name>/`, together with its tokenizer;
+        later starts only load the cached files. The pooling of the original model (mean of the
+        token embeddings weighted by the attention mask) is applied on the outputs, so the vectors
+        match the PyTorch backend.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str, quantize: bool = False, batch_size: int = 32,
+                 max_length: int = 128, intra_op_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.directory = os.path.join(cache_dir, model_name.replace("/", "__"))
+
+        model_path = self._export(quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.directory)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+
+    def embed_documents(self, texts):
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            embeddings.extend(self._encode(texts[start:start + self.batch_size]))
+        return embeddings
+
+
+    def embed_query(self, text):
+        return self._encode([text])[0]
+
+
+    def _encode(self, texts):
+        encoded = self.tokenizer(list(texts), padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        inputs = {name: encoded[name].astype(np.int64) for name in ("input_ids", "attention_mask", "token_type_ids")
+                  if name in self._input_names and name in encoded}
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled.astype(np.float32).tolist()
+
+
+    def _export(self, quantize: bool) -> str:
+        """
+        Exports the model to ONNX (and quantizes it) unless it is already cached.
+
+        Returns:
+            str: The path of the model file to load.
+        """
+        fp32_path = os.path.join(self.directory, "model.onnx")
+        int8_path = os.path.join(self.directory, "model.int8.onnx")
+
+        if not os.path.exists(fp32_path):
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            os.makedirs(self.directory, exist_ok=True)
+            sentence_model = SentenceTransformer(self.model_name, device="cpu")
+            transformer = sentence_model[0].auto_model.eval()
+            tokenizer = sentence_model.tokenizer
+            tokenizer.save_pretrained(self.directory)
+            self.max_length = sentence_model.max_seq_length or self.max_length
+
+            sample = tokenizer(["export"], return_tensors="pt")
+            with torch.no_grad():
+                torch.onnx.export(
+                    transformer,
+                    (sample["input_ids"], sample["attention_mask"]),
+                    fp32_path + ".tmp",
+                    input_names=["input_ids", "attention_mask"],
+                    output_names=["last_hidden_state"],
+                    dynamic_axes={
+                        "input_ids": {0: "batch", 1: "sequence"},
+                        "attention_mask": {0: "batch", 1: "sequence"},
+                        "last_hidden_state": {0: "batch", 1: "sequence"},
+                    },
+                    opset_version=14
+                )
+            os.replace(fp32_path + ".tmp", fp32_path)
+
+        if not quantize:
+            return fp32_path
+
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QInt8)
+            os.replace(int8_path + ".tmp", int8_path)
+        return int8_path
@@ -0,0 +1,117 @@
+from collections import OrderedDict
+import threading
+import unicodedata
+import time
+
+
+class QueryEmbeddingCache:
+    """
+        Bounded LRU cache of query embeddings keyed by the normalized query text.
+
+        The embedding model is shared by every database, so a single cache serves all of them.
+        Besides hit/miss counters it keeps the average time of an encode, which is used to report
+        how much model time the hits have saved.
+    """
+
+    def __init__(self, encoder, batch_encoder=None, max_entries: int = 2048):
+        """
+        Args:
+            encoder (Callable[[str], List[float]]): Computes the embedding of a query on a miss.
+            batch_encoder (Callable[[List[str]], List[List[float]]], optional): Computes the embeddings
+                                of several queries in one forward pass. Defaults to calling `encoder` once per query.
+            max_entries (int, optional): Maximum number of cached embeddings. Defaults to 2048.
+        """
+        self._encoder = encoder
+        self._batch_encoder = batch_encoder or (lambda texts: [encoder(text) for text in texts])
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalizes a query so retyped questions share an entry: unicode NFKC and collapsed whitespace.
+        Case is kept because the tokenizer of the model is case sensitive.
+        """
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+    def get(self, text: str):
+        """
+        Returns the embedding of `text`, running the encoder only on a miss.
+        """
+        key = self.normalize(text)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+        start = time.perf_counter()
+        embedding = self._encoder(key)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.misses += 1
+            self.encode_seconds += elapsed
+            self._put(key, embedding)
+        return embedding
+
+
+    def get_many(self, texts):
+        """
+        Returns the embeddings of `texts` in order. All the misses are encoded together in one batch.
+        """
+        keys = [self.normalize(text) for text in texts]
+        embeddings = {}
+        with self._lock:
+            for key in keys:
+                embedding = self._entries.get(key)
+                if embedding is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    embeddings[key] = embedding
+
+        missing = list(dict.fromkeys(key for key in keys if key not in embeddings))
+        if missing:
+            start = time.perf_counter()
+            encoded = self._batch_encoder(missing)
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.misses += len(missing)
+                self.encode_seconds += elapsed
+                for key, embedding in zip(missing, encoded):
+                    embeddings[key] = embedding
+                    self._put(key, embedding)
+
+        return [embeddings[key] for key in keys]
+
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            average_encode = (self.encode_seconds / self.misses) if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "average_encode_seconds": average_encode,
+                "saved_encode_seconds": average_encode * self.hits,
+            }
+
+
+    def _put(self, key, embedding):
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
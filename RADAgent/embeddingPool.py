@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import time
+import os
+
+
+_worker_model = None
+
+
+def _init_worker(config, threads_per_worker: int):
+    """Builds one embedding model per worker process."""
+    global _worker_model
+    from embeddingBackends import build_embedding_model
+
+    if config.embedding_backend == "torch":
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    else:
+        config.onnx_intra_op_threads = threads_per_worker
+    _worker_model = build_embedding_model(config)
+
+
+def _embed_in_worker(texts):
+    return _worker_model.embed_documents(texts)
+
+
+def _timed(function, texts):
+    start = time.perf_counter()
+    embeddings = function(texts)
+    return embeddings, time.perf_counter() - start
+
+
+def _embed_in_worker_timed(texts):
+    return _timed(_embed_in_worker, texts)
+
+
+
+class EmbeddingPool:
+    """
+        Worker pool that embeds batches of chunk texts during ingestion.
+
+        Two executors are available, selected with `ingest_executor`:
+            - "threads": the batches run on threads of this process and share its model. PyTorch and
+              ONNX Runtime release the GIL during inference, so the batches overlap and every batch also
+              uses the intra-op threads of the runtime.
+            - "processes": every worker process loads its own copy of the model and is limited to its
+              share of the cores, which avoids contention between batches at the cost of memory.
+    """
+
+    EXECUTORS = ("threads", "processes")
+
+    def __init__(self, config, embedding_model):
+        if config.ingest_executor not in self.EXECUTORS:
+            raise ValueError("Unknown ingest executor {}".format(config.ingest_executor))
+
+        self.workers = max(1, config.ingest_workers)
+        self.batch_size = max(1, config.ingest_batch_size)
+        self.mode = config.ingest_executor
+        self._embedding_model = embedding_model
+
+        if self.mode == "processes":
+            threads_per_worker = max(1, (os.cpu_count() or 1) // self.workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(config, threads_per_worker)
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+
+
+    def submit(self, texts):
+        """
+        Schedules the embedding of one batch of texts.
+
+        Returns:
+            Future: Resolves to the list of embeddings, in the order of `texts`.
+        """
+        if self.mode == "processes":
+            return self._executor.submit(_embed_in_worker, list(texts))
+        return self._executor.submit(self._embedding_model.embed_documents, list(texts))
+
+
+    def submit_timed(self, texts):
+        """
+        Same as `submit`, also measuring how long the worker spent embedding the batch.
+
+        Returns:
+            Future: Resolves to a tuple with the list of embeddings and the seconds spent embedding them.
+        """
+        if self.mode == "processes":
+            return self._executor.submit(_embed_in_worker_timed, list(texts))
+        return self._executor.submit(_timed, self._embedding_model.embed_documents, list(texts))
+
+
+    def max_in_flight(self) -> int:
+        """Number of batches to keep submitted so every worker always has the next batch ready."""
+        return self.workers * 2
+
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
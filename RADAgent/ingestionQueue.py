@@ -0,0 +1,212 @@
+from statusDatabaseManager import StatusEnum, JobStateEnum
+
+import threading
+import shutil
+import json
+import time
+import os
+
+
+class QueueFullError(Exception):
+    pass
+
+
+
+class IngestionQueue:
+    """
+        Persistent queue of ingestion jobs run by a fixed number of worker threads.
+
+        Jobs are rows of the `IngestionJob` table of the status database, so they survive a restart: jobs
+        still queued are run and jobs that were running are run again. Every kind of job can be repeated
+        safely (a partially created database is removed first, and added or removed files replace their
+        previous chunks).
+
+        The next job is chosen by:
+            1. Priority, higher first.
+            2. Fairness between users: the user with fewer running jobs, then the one served least recently.
+            3. Age, oldest first.
+        A database never has two jobs running at the same time.
+
+        At most `ingest_queue_max_depth` jobs can wait. Beyond that `submit` raises `QueueFullError`, so
+        the caller can answer busy instead of piling up work.
+
+        With the workers of `PreforkServer` only one process runs the jobs. The others clear `run_jobs`, so
+        `submit` only adds the job to the table, and the workers look for jobs queued by other processes every
+        `POLL_SECONDS`.
+    """
+
+    KINDS = ("create", "add", "remove")
+    POLL_SECONDS = 1.0
+
+    def __init__(self, database_manager, status_database, config):
+        self.database_manager = database_manager
+        self.status_database = status_database
+        self.workers = max(1, config.ingest_queue_workers)
+        self.max_depth = config.ingest_queue_max_depth
+        self.max_priority = config.ingest_queue_max_priority
+        self.condition = threading.Condition()
+        self.threads = []
+        self.running = {}
+        self.last_served = {}
+        self.served = 0
+        self.run_jobs = True
+
+
+    def start(self):
+        """Resumes the jobs left by a previous run and starts the workers. Calling it again does nothing."""
+        with self.condition:
+            if self.threads:
+                return
+            for job in self.status_database.get_jobs([JobStateEnum.running]):
+                if job["kind"] == "create":
+                    shutil.rmtree(os.path.join(self.database_manager.route, job["database_id"]), ignore_errors=True)
+                else:
+                    #Updates only start on ready databases, the interrupted one left it processing
+                    self.status_database.update_entry_status(job["database_id"], StatusEnum.ready,
+                                                             current_status=StatusEnum.processing)
+                self.status_database.update_job(job["id"], state=JobStateEnum.queued, started_at=None)
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name="ingest-{}".format(number), daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+
+    def check_priority(self, priority) -> int:
+        """
+        Returns the priority of a job, 0 if None. Priorities are integers from -`ingest_queue_max_priority`
+        to `ingest_queue_max_priority`, so the fairness between users still orders most jobs.
+
+        Raises:
+            ValueError: If the priority is not an integer in that range.
+        """
+        if priority is None:
+            return 0
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            raise ValueError("The priority must be an integer")
+        if abs(priority) > self.max_priority:
+            raise ValueError("The priority must be between -{0} and {0}".format(self.max_priority))
+        return priority
+
+
+    def is_full(self) -> bool:
+        return len(self.status_database.get_jobs([JobStateEnum.queued])) >= self.max_depth
+
+
+    def submit(self, kind: str, database_id: str, user: str = "anonymous", priority: int = 0,
+               container_path: str = None, files: list = None) -> int:
+        """
+        Queues an ingestion job.
+
+        Args:
+            kind (str): "create" (new database from `container_path`), "add" (files of `container_path`
+                        to an existing database) or "remove" (`files` from an existing database).
+            database_id (str): The database the job builds or updates.
+            user (str, optional): The user the job belongs to, for fairness. Defaults to "anonymous".
+            priority (int, optional): Higher runs first, see `check_priority`. Defaults to 0.
+            container_path (str, optional): The folder with the PDFs of "create" and "add" jobs.
+            files (List[str], optional): The file names of "remove" jobs.
+
+        Returns:
+            int: The id of the job.
+
+        Raises:
+            ValueError: If the kind or the priority are not valid.
+            QueueFullError: If `ingest_queue_max_depth` jobs are already waiting.
+        """
+        if kind not in self.KINDS:
+            raise ValueError("Unknown job kind {}".format(kind))
+        priority = self.check_priority(priority)
+
+        if self.run_jobs:
+            self.start()
+        with self.condition:
+            if self.is_full():
+                raise QueueFullError("{} ingestion jobs are already queued".format(self.max_depth))
+            job_id = self.status_database.add_job(
+                database_id=database_id,
+                kind=kind,
+                user=user or "anonymous",
+                priority=priority,
+                container_path=container_path,
+                files=json.dumps(files) if files is not None else None,
+                state=JobStateEnum.queued,
+                created_at=time.time()
+            )
+            self.condition.notify()
+        return job_id
+
+
+    def get_stats(self) -> dict:
+        #From the table, the jobs may run in another process
+        running = self.status_database.get_jobs([JobStateEnum.running])
+        queued = self.status_database.get_jobs([JobStateEnum.queued])
+        by_user = {}
+        for job in queued:
+            by_user.setdefault(job["user"], {"queued": 0, "running": 0})["queued"] += 1
+        for job in running:
+            by_user.setdefault(job["user"], {"queued": 0, "running": 0})["running"] += 1
+        return {
+            "workers": self.workers,
+            "max_depth": self.max_depth,
+            "queued": len(queued),
+            "running": len(running),
+            "oldest_wait_seconds": (time.time() - queued[0]["created_at"]) if queued else 0.0,
+            "users": by_user,
+        }
+
+
+    def _work(self):
+        while True:
+            with self.condition:
+                job = self._next_job()
+                while job is None:
+                    self.condition.wait(self.POLL_SECONDS)
+                    job = self._next_job()
+                self.running[job["id"]] = job
+                self.served += 1
+                self.last_served[job["user"]] = self.served
+                self.status_database.update_job(job["id"], state=JobStateEnum.running, started_at=time.time())
+
+            state = JobStateEnum.failed
+            try:
+                self._run(job)
+                if self.status_database.get_database_status(job["database_id"]) != StatusEnum.error:
+                    state = JobStateEnum.done
+            except Exception as e:
+                print(f"Ingestion job {job['id']} failed: {e}")
+            
+            with self.condition:
+                self.running.pop(job["id"], None)
+                try:
+                    self.status_database.update_job(job["id"], state=state, finished_at=time.time())
+                except Exception as e:
+                    print(f"Ingestion job {job['id']} could not be updated: {e}")
+                self.condition.notify_all()
+
+
+    def _next_job(self):
+        busy_databases = {job["database_id"] for job in self.running.values()}
+        candidates = [job for job in self.status_database.get_jobs([JobStateEnum.queued])
+                      if job["database_id"] not in busy_databases]
+        if not candidates:
+            return None
+
+        running_by_user = {}
+        for job in self.running.values():
+            running_by_user[job["user"]] = running_by_user.get(job["user"], 0) + 1
+
+        return min(candidates, key=lambda job: (
+            -job["priority"],
+            running_by_user.get(job["user"], 0),
+            self.last_served.get(job["user"], 0),
+            job["id"]
+        ))
+
+
+    def _run(self, job: dict):
+        if job["kind"] == "create":
+            self.database_manager.create_database(job["container_path"], job["database_id"])
+        elif job["kind"] == "add":
+            self.database_manager.add_files(job["container_path"], job["database_id"])
+        else:
+            self.database_manager.remove_files(job["database_id"], json.loads(job["files"] or "[]"))
@@ -0,0 +1,212 @@
+from array import array
+import numpy as np
+import unicodedata
+import json
+import math
+import mmap
+import os
+import re
+
+
+class LexicalIndex:
+    """
+        Compact BM25 inverted index of the chunks of one database.
+
+        The index is written once at ingest time next to the Chroma files and memory-mapped on load:
+        only the vocabulary is read into memory, the postings, the document lengths and the chunk
+        texts stay on disk and are paged in by the OS on demand. Because the chunk texts and metadata
+        are stored in the index, a lexical search does not need the embedding model nor the collection.
+
+        Files of an index directory:
+            - vocabulary.json: term -> [start, end) slice of the postings arrays.
+            - postings_docs.npy / postings_tf.npy: document position and term frequency of each posting.
+            - doc_lengths.npy: number of tokens of each chunk.
+            - texts.bin / text_offsets.npy: UTF-8 chunk texts and their offsets.
+            - documents.json: chunk ids and metadata.
+    """
+
+    DIRECTORY = "lexical_index"
+    TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        with open(os.path.join(path, "vocabulary.json"), "r", encoding="utf-8") as file:
+            self.vocabulary = json.load(file)
+        with open(os.path.join(path, "documents.json"), "r", encoding="utf-8") as file:
+            documents = json.load(file)
+        self.ids = documents["ids"]
+        self.metadatas = documents["metadatas"]
+
+        self.postings_docs = np.load(os.path.join(path, "postings_docs.npy"), mmap_mode="r")
+        self.postings_tf = np.load(os.path.join(path, "postings_tf.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode="r")
+        self.text_offsets = np.load(os.path.join(path, "text_offsets.npy"), mmap_mode="r")
+
+        self._texts_file = open(os.path.join(path, "texts.bin"), "rb")
+        if os.path.getsize(self._texts_file.name) > 0:
+            self._texts = mmap.mmap(self._texts_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._texts = b""
+
+        self.num_documents = len(self.ids)
+        self.average_length = float(np.mean(self.doc_lengths)) if self.num_documents else 0.0
+
+
+    @classmethod
+    def tokenize(cls, text: str) -> list:
+        """
+        Splits a text into lowercase, accent-free terms. Compound identifiers such as "BOE-A-2024-20588"
+        or "3.2.1" are kept whole and their parts are emitted as terms too.
+        """
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(character for character in text if not unicodedata.combining(character))
+        terms = []
+        for match in cls.TOKEN_PATTERN.finditer(text):
+            token = match.group(0)
+            terms.append(token)
+            if not token.isalnum():
+                terms.extend(part for part in re.split(r"[-./]", token) if part)
+        return terms
+
+
+    @classmethod
+    def exists(cls, database_path: str) -> bool:
+        return os.path.exists(os.path.join(database_path, cls.DIRECTORY, "vocabulary.json"))
+
+
+    @classmethod
+    def load(cls, database_path: str):
+        return cls(os.path.join(database_path, cls.DIRECTORY))
+
+
+    def search(self, query_text: str, k: int = 5) -> list:
+        """
+        Scores every chunk that shares a term with the query with BM25.
+
+        Returns:
+            List[Tuple[str, float]]: Up to `k` (chunk id, score) pairs ordered by decreasing score.
+        """
+        if self.num_documents == 0:
+            return []
+
+        scores = np.zeros(self.num_documents, dtype=np.float32)
+        for term in set(self.tokenize(query_text)):
+            span = self.vocabulary.get(term)
+            if span is None:
+                continue
+            start, end = span
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end].astype(np.float32)
+            document_frequency = end - start
+            idf = math.log(1.0 + (self.num_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+            lengths = self.doc_lengths[docs].astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * lengths / self.average_length)
+            scores[docs] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+
+        candidates = np.flatnonzero(scores)
+        if candidates.size == 0:
+            return []
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.ids[position], float(scores[position])) for position in candidates]
+
+
+    def get_document(self, chunk_id: str):
+        """
+        Returns the text and metadata of a chunk.
+
+        Returns:
+            Tuple[str, dict]: The chunk text and a copy of its metadata.
+        """
+        position = self._positions()[chunk_id]
+        start, end = int(self.text_offsets[position]), int(self.text_offsets[position + 1])
+        return self._texts[start:end].decode("utf-8"), dict(self.metadatas[position])
+
+
+    def _positions(self) -> dict:
+        positions = getattr(self, "_id_positions", None)
+        if positions is None:
+            positions = {chunk_id: position for position, chunk_id in enumerate(self.ids)}
+            self._id_positions = positions
+        return positions
+
+
+
+class LexicalIndexBuilder:
+    """
+        Builds a `LexicalIndex` incrementally. Chunk texts are streamed to disk as they are added; the
+        postings are kept until `finalize` in flat typed arrays (10 bytes per posting) instead of Python
+        lists of tuples, so they stay small next to the texts and the embeddings of the corpus.
+    """
+
+    def __init__(self, database_path: str):
+        self.path = os.path.join(database_path, LexicalIndex.DIRECTORY)
+        os.makedirs(self.path, exist_ok=True)
+
+        self._terms = {}
+        self._posting_terms = array("i")
+        self._posting_docs = array("i")
+        self._posting_tfs = array("H")
+        self._doc_lengths = array("i")
+        self._text_offsets = array("q", [0])
+        self._ids = []
+        self._metadatas = []
+        self._texts_file = open(os.path.join(self.path, "texts.bin"), "wb")
+
+
+    def add(self, chunk_id: str, text: str, metadata: dict):
+        position = len(self._ids)
+        terms = LexicalIndex.tokenize(text)
+
+        frequencies = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        for term, frequency in frequencies.items():
+            term_id = self._terms.setdefault(term, len(self._terms))
+            self._posting_terms.append(term_id)
+            self._posting_docs.append(position)
+            self._posting_tfs.append(min(frequency, 65535))
+
+        encoded = text.encode("utf-8")
+        self._texts_file.write(encoded)
+        self._text_offsets.append(self._text_offsets[-1] + len(encoded))
+        self._doc_lengths.append(len(terms))
+        self._ids.append(chunk_id)
+        self._metadatas.append(metadata)
+
+
+    def finalize(self):
+        """
+        Writes the postings, lengths, offsets and vocabulary to disk.
+        """
+        self._texts_file.close()
+
+        posting_terms = np.frombuffer(self._posting_terms, dtype=np.int32)
+        order = np.argsort(posting_terms, kind="stable")
+        counts = np.bincount(posting_terms, minlength=len(self._terms))
+        ends = np.cumsum(counts)
+
+        vocabulary = {}
+        for term, term_id in self._terms.items():
+            end = int(ends[term_id])
+            vocabulary[term] = [end - int(counts[term_id]), end]
+
+        np.save(os.path.join(self.path, "postings_docs.npy"), np.frombuffer(self._posting_docs, dtype=np.int32)[order])
+        np.save(os.path.join(self.path, "postings_tf.npy"), np.frombuffer(self._posting_tfs, dtype=np.uint16)[order])
+        np.save(os.path.join(self.path, "doc_lengths.npy"), np.frombuffer(self._doc_lengths, dtype=np.int32))
+        np.save(os.path.join(self.path, "text_offsets.npy"), np.frombuffer(self._text_offsets, dtype=np.int64))
+
+        with open(os.path.join(self.path, "documents.json"), "w", encoding="utf-8") as file:
+            json.dump({"ids": self._ids, "metadatas": self._metadatas}, file, ensure_ascii=False)
+        #The vocabulary is written last, its presence marks a complete index
+        with open(os.path.join(self.path, "vocabulary.json"), "w", encoding="utf-8") as file:
+            json.dump(vocabulary, file, ensure_ascii=False)
+
+        self._terms = {}
+        self._posting_terms = array("i")
+        self._posting_docs = array("i")
+        self._posting_tfs = array("H")
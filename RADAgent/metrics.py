@@ -0,0 +1,50 @@
+from collections import deque
+import threading
+
+
+class LatencyStats:
+    """
+        Thread-safe latency counters grouped by name (for example a retrieval mode).
+
+        Keeps the count, the total time and a window of the most recent samples, from which the
+        percentiles are computed.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = {"count": 0, "total": 0.0, "samples": deque(maxlen=self.window)}
+                self._series[name] = series
+            series["count"] += 1
+            series["total"] += seconds
+            series["samples"].append(seconds)
+
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = {}
+            for name, series in self._series.items():
+                samples = sorted(series["samples"])
+                stats[name] = {
+                    "count": series["count"],
+                    "average_ms": 1000 * series["total"] / series["count"],
+                    "p50_ms": 1000 * self._percentile(samples, 0.50),
+                    "p95_ms": 1000 * self._percentile(samples, 0.95),
+                    "p99_ms": 1000 * self._percentile(samples, 0.99),
+                }
+            return stats
+
+
+    @staticmethod
+    def _percentile(samples, fraction):
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))
+        return samples[index]
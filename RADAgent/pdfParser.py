@@ -0,0 +1,248 @@
+from collections import deque
+import multiprocessing
+import importlib
+import time
+import os
+
+
+#Imported by every worker before it takes tasks
+PRELOADED_MODULES = ("pypdf", "langchain.text_splitter")
+
+
+def _init_worker(memory_limit_mb: int, ready):
+    """
+    Limits the address space of the worker so a pathological PDF fails with MemoryError, and loads the parsing
+    libraries before taking tasks so their import time is not counted against the time limit of a task.
+    """
+    if memory_limit_mb > 0:
+        try:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            #Not available on every platform, the time limit still applies
+            pass
+    for module in PRELOADED_MODULES:
+        importlib.import_module(module)
+    ready.release()
+
+
+def _count_pages(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def _parse_pages(path: str, first_page: int, last_page: int, chunk_size: int, chunk_overlap: int, separators: list):
+    """
+    Extracts and splits the text of the pages `first_page`..`last_page` (1-based, inclusive) of one PDF.
+
+    Returns:
+        Tuple[List[Tuple[int, List[str]]], float, float]: The chunks of every page with its page number, and the
+                                                          seconds spent extracting and splitting the text.
+    """
+    from pypdf import PdfReader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=separators
+    )
+    extract_seconds = 0.0
+    split_seconds = 0.0
+    start = time.perf_counter()
+    reader = PdfReader(path)
+    pages = []
+    for page_number in range(first_page, last_page + 1):
+        text = reader.pages[page_number - 1].extract_text()
+        split_start = time.perf_counter()
+        extract_seconds += split_start - start
+        chunks = text_splitter.split_text(text)
+        start = time.perf_counter()
+        split_seconds += start - split_start
+        pages.append((page_number, chunks))
+    return pages, extract_seconds, split_seconds
+
+
+
+class ParseTimeout(Exception):
+    pass
+
+
+
+class PdfParsePool:
+    """
+        Process pool that extracts the text of PDF files in parallel.
+
+        Every file is split in tasks of at most `parse_pages_per_task` pages, so large files are parsed by several
+        workers at once. Each task runs under a time limit (`parse_timeout_seconds`) and every worker under a memory
+        limit (`parse_memory_limit_mb`). A worker can not be interrupted, so when a task exceeds its time the pool
+        is terminated and started again and the other tasks in flight are resubmitted.
+
+        Results are yielded in the original (file, page_number) order whatever order the workers finish in.
+        A file that fails or times out is skipped and reported in `file_stats`, the rest of the build goes on.
+    """
+
+    def __init__(self, config, chunk_size: int, chunk_overlap: int, separators: list):
+        self.workers = max(1, config.parse_workers)
+        self.pages_per_task = max(1, config.parse_pages_per_task)
+        self.timeout = config.parse_timeout_seconds
+        self.memory_limit_mb = config.parse_memory_limit_mb
+        self.splitter_args = (chunk_size, chunk_overlap, list(separators))
+        self._context = multiprocessing.get_context("spawn")
+        self._pool = None
+        #Stats of every file of the last parse: pages, chunks, seconds, status and error
+        self.file_stats = {}
+
+
+    def parse(self, paths: list, progress=None):
+        """
+        Parses the given PDF files.
+
+        Args:
+            paths (List[str]): The files to parse, in the order the chunks must come back.
+            progress (ProgressTracker, optional): Receives the files and pages parsed and the parse and split seconds.
+
+        Returns:
+            Iterator[Tuple[str, int, str]]: The file name, page number and text of every chunk, in order.
+        """
+        self.file_stats = {
+            os.path.basename(path): {"pages": 0, "chunks": 0, "seconds": 0.0, "status": "ok", "error": None}
+            for path in paths
+        }
+        if progress is not None:
+            progress.set(files_total=len(paths))
+        try:
+            self._start_pool()
+            page_counts = {}
+            for path, result in self._run_ordered([(_count_pages, (path,)) for path in paths]):
+                if self._record_failure(path, result):
+                    if progress is not None:
+                        progress.add(files_parsed=1)
+                    continue
+                page_counts[path] = result
+                self.file_stats[os.path.basename(path)]["pages"] = result
+                if progress is not None and result == 0:
+                    progress.add(files_parsed=1)
+            if progress is not None:
+                progress.set(pages_total=sum(page_counts.values()))
+
+            tasks = (
+                (_parse_pages, (path, first, min(first + self.pages_per_task - 1, page_counts[path])) + self.splitter_args)
+                for path in paths if path in page_counts
+                for first in range(1, page_counts[path] + 1, self.pages_per_task)
+            )
+            failed = set()
+            for path, result in self._run_ordered(tasks):
+                if path in failed:
+                    continue
+                if self._record_failure(path, result):
+                    failed.add(path)
+                    if progress is not None:
+                        progress.add(files_parsed=1)
+                    continue
+                pages, extract_seconds, split_seconds = result
+                stats = self.file_stats[os.path.basename(path)]
+                stats["seconds"] += extract_seconds + split_seconds
+                if progress is not None:
+                    last_page = pages[-1][0] if pages else page_counts[path]
+                    progress.add(pages_parsed=len(pages), parse_seconds=extract_seconds, split_seconds=split_seconds,
+                                 files_parsed=1 if last_page >= page_counts[path] else 0)
+                for page_number, chunks in pages:
+                    stats["chunks"] += len(chunks)
+                    for chunk in chunks:
+                        yield os.path.basename(path), page_number, chunk
+        finally:
+            self._stop_pool()
+
+
+    def _record_failure(self, path: str, result) -> bool:
+        if not isinstance(result, Exception):
+            return False
+        stats = self.file_stats[os.path.basename(path)]
+        stats["status"] = "timeout" if isinstance(result, ParseTimeout) else "error"
+        stats["error"] = "{}: {}".format(type(result).__name__, result)
+        print(f"Skipping {path}: {stats['error']}")
+        return True
+
+
+    def _run_ordered(self, tasks):
+        """
+        Runs `(function, args)` tasks on the pool and yields `(path, result)` in task order. `path` is the first
+        argument of the task, and `result` is the exception instead when the task failed or timed out.
+        """
+        tasks = iter(tasks)
+        pending = deque()
+        exhausted = False
+
+        while True:
+            running = sum(1 for entry in pending if not entry["result"].ready())
+            #Only submit when a worker is free, so the time of a task is counted from its start
+            while not exhausted and running < self.workers and len(pending) < self.workers * 4:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                pending.append(self._submit(task))
+                running += 1
+
+            if not pending:
+                return
+
+            while pending and (pending[0]["result"].ready() or pending[0].get("error") is not None):
+                entry = pending.popleft()
+                path = entry["task"][1][0]
+                if entry.get("error") is not None:
+                    yield path, entry["error"]
+                    continue
+                try:
+                    yield path, entry["result"].get()
+                except Exception as e:
+                    yield path, e
+
+            if pending and not pending[0]["result"].ready():
+                pending[0]["result"].wait(0.05)
+            self._expire(pending)
+
+
+    def _submit(self, task) -> dict:
+        function, args = task
+        return {"task": task, "result": self._pool.apply_async(function, args), "started": time.monotonic()}
+
+
+    def _expire(self, pending: deque):
+        if self.timeout <= 0:
+            return
+        now = time.monotonic()
+        expired = [entry for entry in pending
+                   if entry.get("error") is None and not entry["result"].ready() and now - entry["started"] > self.timeout]
+        if not expired:
+            return
+
+        for entry in expired:
+            entry["error"] = ParseTimeout("no result after {} seconds".format(self.timeout))
+
+        #Terminating the pool is the only way to stop the stuck workers, the healthy tasks in flight run again
+        self._stop_pool()
+        self._start_pool()
+        for position, entry in enumerate(pending):
+            if entry.get("error") is None and not entry["result"].ready():
+                pending[position] = self._submit(entry["task"])
+
+
+    def _start_pool(self):
+        ready = self._context.Semaphore(0)
+        self._pool = self._context.Pool(
+            processes=self.workers,
+            initializer=_init_worker,
+            initargs=(self.memory_limit_mb, ready)
+        )
+        for _ in range(self.workers):
+            ready.acquire(timeout=60)
+
+
+    def _stop_pool(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,104 @@
+import threading
+import time
+
+
+class ProgressTracker:
+    """
+        Counters of one ingestion job, written to the `IngestionProgress` table of the status database.
+
+        The stages of an ingestion overlap (pages are parsed while earlier chunks are embedded), so every stage
+        has its own counters and elapsed time instead of a single current stage:
+            - parse / split: seconds the parse workers spent extracting and splitting text, summed over workers.
+            - embed: seconds the embedding workers spent on the batches, summed over workers.
+            - persist: seconds spent writing the collection and the indexes.
+
+        Counters are updated in memory and flushed at most every `flush_interval` seconds, so tracking does
+        not add a write to the status database per chunk.
+    """
+
+    COUNTERS = ("files_total", "files_parsed", "pages_total", "pages_parsed", "chunks_produced", "chunks_embedded",
+                "chunks_written", "bytes_written", "parse_seconds", "split_seconds", "embed_seconds", "persist_seconds")
+
+    def __init__(self, status_database, database_id: str, flush_interval: float = 1.0):
+        self.status_database = status_database
+        self.database_id = database_id
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.values = {counter: 0 for counter in self.COUNTERS}
+        self.values["started_at"] = time.time()
+        self.last_flush = 0.0
+        self.flush()
+
+
+    def add(self, **deltas):
+        """Increments counters."""
+        with self.lock:
+            for counter, delta in deltas.items():
+                self.values[counter] += delta
+        self._maybe_flush()
+
+
+    def set(self, **values):
+        """Overwrites counters."""
+        with self.lock:
+            self.values.update(values)
+        self._maybe_flush()
+
+
+    def flush(self):
+        with self.lock:
+            self.values["updated_at"] = time.time()
+            values = dict(self.values)
+            self.last_flush = time.monotonic()
+        self.status_database.set_ingestion_progress(self.database_id, values)
+
+
+    def _maybe_flush(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+
+    @staticmethod
+    def describe(progress: dict, status: str) -> dict:
+        """
+        Adds the elapsed time, throughput, estimated total of chunks and ETA to a stored progress row.
+
+        The total of chunks is only known once every page is parsed. Until then it is extrapolated from the
+        chunks per page parsed so far.
+
+        Args:
+            progress (dict): The row returned by `StatusDatabaseManager.get_ingestion_progress`.
+            status (str): The status of the database. Only "processing" databases get an ETA.
+
+        Returns:
+            dict: The row with "elapsed_seconds", "chunks_per_second", "pages_per_second",
+                  "estimated_chunks_total", "percent" and "eta_seconds".
+        """
+        described = dict(progress)
+        end = time.time() if status == "processing" else progress["updated_at"]
+        elapsed = max(end - progress["started_at"], 0.0)
+        described["elapsed_seconds"] = elapsed
+        described["chunks_per_second"] = (progress["chunks_written"] / elapsed) if elapsed > 0 else 0.0
+        described["pages_per_second"] = (progress["pages_parsed"] / elapsed) if elapsed > 0 else 0.0
+
+        parsed = progress["files_parsed"] >= progress["files_total"] and progress["pages_parsed"] >= progress["pages_total"]
+        if parsed:
+            estimated_total = progress["chunks_produced"]
+        elif progress["pages_parsed"] > 0:
+            estimated_total = int(round(progress["chunks_produced"] * progress["pages_total"] / progress["pages_parsed"]))
+        else:
+            estimated_total = None
+        described["estimated_chunks_total"] = estimated_total
+
+        if status != "processing":
+            described["percent"] = 100.0 if status == "ready" else None
+            described["eta_seconds"] = 0.0 if status == "ready" else None
+        elif estimated_total:
+            described["percent"] = min(100.0 * progress["chunks_written"] / estimated_total, 100.0)
+            remaining = max(estimated_total - progress["chunks_written"], 0)
+            rate = described["chunks_per_second"]
+            described["eta_seconds"] = (remaining / rate) if rate > 0 else None
+        else:
+            described["percent"] = 0.0
+            described["eta_seconds"] = None
+        return described
@@ -0,0 +1,203 @@
+import numpy as np
+import json
+import os
+
+
+class QuantizedStore:
+    """
+        Quantized copy of the embeddings of one database, used for a coarse candidate search that is
+        followed by an exact rescoring of a small candidate set.
+
+        Two quantizations are supported:
+            - "int8": every dimension scaled to [-127, 127] with a per-dimension scale (4x smaller).
+            - "binary": one sign bit per dimension, compared with the Hamming distance (32x smaller).
+
+        Only the codes are held in memory. The L2-normalized float32 vectors stay on disk in
+        `vectors.f32` and are memory-mapped, so the rescoring only pages in the rows of the candidates.
+
+        Files of a store directory:
+            - store.json: quantization, dimension and chunk ids.
+            - codes.npy: int8 codes or packed sign bits.
+            - scale.npy: per-dimension scale (int8 only).
+            - vectors.f32: raw normalized float32 vectors, row i belongs to ids[i].
+    """
+
+    DIRECTORY = "quantized_index"
+    QUANTIZATIONS = ("int8", "binary")
+
+    #Number of set bits of every byte value, used to compute Hamming distances on packed bits
+    _POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "store.json"), "r", encoding="utf-8") as file:
+            info = json.load(file)
+        self.quantization = info["quantization"]
+        self.dimension = info["dimension"]
+        self.ids = info["ids"]
+
+        self.codes = np.load(os.path.join(path, "codes.npy"))
+        self.scale = np.load(os.path.join(path, "scale.npy")) if self.quantization == "int8" else None
+        self.vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r",
+                                 shape=(len(self.ids), self.dimension)) if self.ids else np.zeros((0, self.dimension), dtype=np.float32)
+
+
+    @classmethod
+    def exists(cls, database_path: str) -> bool:
+        return os.path.exists(os.path.join(database_path, cls.DIRECTORY, "store.json"))
+
+
+    @classmethod
+    def load(cls, database_path: str):
+        return cls(os.path.join(database_path, cls.DIRECTORY))
+
+
+    @classmethod
+    def get_disk_stats(cls, database_path: str) -> dict:
+        """
+        Same figures as `get_stats`, computed from the files so the store does not need to be loaded.
+        """
+        path = os.path.join(database_path, cls.DIRECTORY)
+        with open(os.path.join(path, "store.json"), "r", encoding="utf-8") as file:
+            info = json.load(file)
+        float_bytes = os.path.getsize(os.path.join(path, "vectors.f32"))
+        code_bytes = os.path.getsize(os.path.join(path, "codes.npy"))
+        if os.path.exists(os.path.join(path, "scale.npy")):
+            code_bytes += os.path.getsize(os.path.join(path, "scale.npy"))
+        return {
+            "quantization": info["quantization"],
+            "vectors": len(info["ids"]),
+            "dimension": info["dimension"],
+            "float_bytes": float_bytes,
+            "resident_bytes": code_bytes,
+            "reduction": (float_bytes / code_bytes) if code_bytes else 0.0,
+        }
+
+
+    def search(self, query_embedding, k: int = 5, candidates: int = 50) -> list:
+        """
+        Finds the `candidates` nearest codes to the query, then rescores them with the exact cosine
+        similarity of the float vectors.
+
+        Returns:
+            List[Tuple[str, float]]: Up to `k` (chunk id, cosine similarity) pairs ordered by decreasing similarity.
+        """
+        return self.search_many([query_embedding], [k], candidates)[0]
+
+
+    def search_many(self, query_embeddings: list, ks: list, candidates: int = 50) -> list:
+        """
+        `search` for several queries: the coarse scores of all of them are computed in one pass over the codes,
+        a matrix product for int8.
+
+        Returns:
+            List[List[Tuple[str, float]]]: The hits of every query, as returned by `search`.
+        """
+        count = len(self.ids)
+        if count == 0:
+            return [[] for _ in query_embeddings]
+
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1.0)
+
+        if self.quantization == "int8":
+            coarse = self.codes.astype(np.float32) @ (queries * self.scale).T
+        else:
+            query_bits = np.packbits(queries > 0, axis=1)
+            #Fewer differing bits is better, negate so that bigger is better as with int8
+            coarse = np.stack([-self._POPCOUNT[np.bitwise_xor(self.codes, bits)].sum(axis=1, dtype=np.int32)
+                               for bits in query_bits], axis=1)
+
+        results = []
+        for column, k in enumerate(ks):
+            selected_count = min(max(candidates, k), count)
+            if selected_count < count:
+                selected = np.argpartition(-coarse[:, column], selected_count - 1)[:selected_count]
+            else:
+                selected = np.arange(count)
+            selected.sort()
+
+            exact = np.asarray(self.vectors[selected]) @ queries[column]
+            order = np.argsort(-exact, kind="stable")[:k]
+            results.append([(self.ids[selected[position]], float(exact[position])) for position in order])
+        return results
+
+
+    def get_stats(self) -> dict:
+        float_bytes = len(self.ids) * self.dimension * 4
+        code_bytes = int(self.codes.nbytes) + (int(self.scale.nbytes) if self.scale is not None else 0)
+        return {
+            "quantization": self.quantization,
+            "vectors": len(self.ids),
+            "dimension": self.dimension,
+            "float_bytes": float_bytes,
+            "resident_bytes": code_bytes,
+            "reduction": (float_bytes / code_bytes) if code_bytes else 0.0,
+        }
+
+
+
+class QuantizedStoreBuilder:
+    """
+        Builds a `QuantizedStore` incrementally: vectors are normalized and appended to disk as they
+        are added, and the codes are computed block by block from the memory-mapped file in `finalize`.
+    """
+
+    BLOCK = 4096
+
+    def __init__(self, database_path: str, quantization: str):
+        if quantization not in QuantizedStore.QUANTIZATIONS:
+            raise ValueError("Unknown quantization {}".format(quantization))
+        self.path = os.path.join(database_path, QuantizedStore.DIRECTORY)
+        os.makedirs(self.path, exist_ok=True)
+
+        self.quantization = quantization
+        self.dimension = None
+        self._ids = []
+        self._vectors_file = open(os.path.join(self.path, "vectors.f32"), "wb")
+
+
+    def add(self, ids: list, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.size == 0:
+            return
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        self._vectors_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self._ids.extend(ids)
+
+
+    def finalize(self):
+        self._vectors_file.close()
+        dimension = self.dimension or 0
+        count = len(self._ids)
+
+        if count:
+            vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode="r", shape=(count, dimension))
+        else:
+            vectors = np.zeros((0, dimension), dtype=np.float32)
+
+        if self.quantization == "int8":
+            max_abs = np.zeros(dimension, dtype=np.float32)
+            for start in range(0, count, self.BLOCK):
+                max_abs = np.maximum(max_abs, np.abs(vectors[start:start + self.BLOCK]).max(axis=0))
+            scale = np.where(max_abs == 0, 1.0, max_abs / 127.0).astype(np.float32)
+
+            codes = np.empty((count, dimension), dtype=np.int8)
+            for start in range(0, count, self.BLOCK):
+                block = vectors[start:start + self.BLOCK] / scale
+                codes[start:start + self.BLOCK] = np.clip(np.rint(block), -127, 127).astype(np.int8)
+            np.save(os.path.join(self.path, "scale.npy"), scale)
+        else:
+            codes = np.empty((count, (dimension + 7) // 8), dtype=np.uint8)
+            for start in range(0, count, self.BLOCK):
+                codes[start:start + self.BLOCK] = np.packbits(vectors[start:start + self.BLOCK] > 0, axis=1)
+
+        np.save(os.path.join(self.path, "codes.npy"), codes)
+        #store.json is written last, its presence marks a complete store
+        with open(os.path.join(self.path, "store.json"), "w", encoding="utf-8") as file:
+            json.dump({"quantization": self.quantization, "dimension": dimension, "ids": self._ids}, file)
@@ -0,0 +1,118 @@
+from contextlib import contextmanager
+import threading
+import os
+
+
+class ReaderRegistry:
+    """
+        Counts the searches and ingestion jobs using the files of every database, so its directory is only
+        removed when nobody holds it.
+
+        Users take the hold before checking the status of the database. The reclaimer only removes databases
+        already marked deleted, so a search that starts after the check of the reclaimer sees the deleted status
+        and never touches the files.
+
+        When several processes share the databases, the workers of `PreforkServer`, `share_between_processes`
+        makes every hold also take a shared lock on a file of the database, and `is_held` sees the holds of
+        every process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.readers = {}
+        self.released_callbacks = {}
+        self.lock_route = None
+
+
+    def share_between_processes(self, lock_route: str):
+        """
+        Makes the holds visible to other processes, with `fcntl.flock` on `<lock_route>/<database>.lock`.
+        """
+        os.makedirs(lock_route, exist_ok=True)
+        self.lock_route = lock_route
+
+
+    @contextmanager
+    def hold(self, database_name: str):
+        with self.lock:
+            self.readers[database_name] = self.readers.get(database_name, 0) + 1
+        lock_file = None
+        try:
+            if self.lock_route is not None:
+                lock_file = self._lock_file(database_name, shared=True)
+            yield
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+            callbacks = []
+            with self.lock:
+                self.readers[database_name] -= 1
+                if self.readers[database_name] == 0:
+                    del self.readers[database_name]
+                    callbacks = self.released_callbacks.pop(database_name, [])
+            for callback in callbacks:
+                self._call(database_name, callback)
+
+
+    def when_released(self, database_name: str, callback):
+        """
+        Calls `callback()` once no search or ingestion job of this process holds the database: now if none
+        does, otherwise when the last hold is released.
+        """
+        with self.lock:
+            if self.readers.get(database_name, 0) > 0:
+                self.released_callbacks.setdefault(database_name, []).append(callback)
+                return
+        self._call(database_name, callback)
+
+
+    def count(self, database_name: str) -> int:
+        with self.lock:
+            return self.readers.get(database_name, 0)
+
+
+    def is_held(self, database_name: str) -> bool:
+        """
+        Whether any search or ingestion job holds the database, in this process or, if shared, in any other.
+        """
+        if self.count(database_name) > 0:
+            return True
+        if self.lock_route is None:
+            return False
+        try:
+            lock_file = self._lock_file(database_name, shared=False)
+        except BlockingIOError:
+            return True
+        lock_file.close()
+        return False
+
+
+    def remove_lock(self, database_name: str):
+        """Removes the lock file of a database whose directory was removed."""
+        if self.lock_route is None:
+            return
+        try:
+            os.remove(os.path.join(self.lock_route, database_name + ".lock"))
+        except FileNotFoundError:
+            pass
+
+
+    def _lock_file(self, database_name: str, shared: bool):
+        import fcntl
+
+        lock_file = open(os.path.join(self.lock_route, database_name + ".lock"), "a")
+        try:
+            #Holds wait for a check of `is_held`, which never waits for a hold
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BaseException:
+            lock_file.close()
+            raise
+        return lock_file
+
+
+    @staticmethod
+    def _call(database_name: str, callback):
+        try:
+            callback()
+        except Exception as e:
+            print(f"Release callback failed for {database_name}: {e}")
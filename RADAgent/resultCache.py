@@ -0,0 +1,198 @@
+from collections import OrderedDict
+import numpy as np
+import itertools
+import threading
+import time
+
+
+class SemanticResultCache:
+    """
+        Cache of the hits of vector searches, per database, served to queries whose embedding is close to the
+        embedding of a cached query.
+
+        Paraphrases of the same question have embeddings with a cosine similarity close to 1, so a new query
+        within `min_similarity` of a cached one of the same database and `k` gets the cached hits without
+        searching the collection. The scores of the hits are the ones computed for the cached query.
+
+        Entries expire after `ttl_seconds` and the least recently used ones are evicted beyond `max_entries`
+        (shared by every database). The entries of a database are dropped when its status changes or its
+        indexes are rebuilt. Every invalidation moves the database to a new generation, and the hits of a search
+        that started in an older one are not stored, so a search that overlaps an update can not cache the
+        previous contents again.
+
+        The similarity of every query to its nearest cached query is kept in a histogram, hits and misses
+        alike, so the threshold can be tuned from the metrics: a lower threshold would have turned into hits
+        the misses of the buckets above it.
+    """
+
+    HISTOGRAM_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.925, 0.95, 0.975, 0.99, 1.0)
+
+    def __init__(self, max_entries: int = 1024, min_similarity: float = 0.95, ttl_seconds: float = 600):
+        """
+        Args:
+            max_entries (int, optional): Maximum number of cached searches of all the databases. Defaults to 1024.
+            min_similarity (float, optional): Minimum cosine similarity between the embeddings of the new and
+                                              the cached query to serve a hit. Defaults to 0.95.
+            ttl_seconds (float, optional): Seconds an entry is served after it was stored. Defaults to 600.
+        """
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = OrderedDict()
+        self._by_database = {}
+        self._matrices = {}
+        self._generations = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.histogram = [0] * (len(self.HISTOGRAM_BUCKETS) + 1)
+
+
+    def get(self, database_id: str, query_embedding, k: int):
+        """
+        Returns the cached hits of the nearest cached query of `database_id` and `k`, or None on a miss.
+        """
+        if self.max_entries <= 0:
+            return None
+        query = self._normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            self._expire(database_id, now)
+            entry_ids, matrix = self._matrix(database_id, k)
+            best_similarity = None
+            best_entry = None
+            if entry_ids:
+                similarities = matrix @ query
+                position = int(np.argmax(similarities))
+                best_similarity = float(similarities[position])
+                best_entry = entry_ids[position]
+            self._record(best_similarity)
+
+            if best_similarity is None or best_similarity < self.min_similarity:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_entry)
+            return self._entries[best_entry]["hits"]
+
+
+    def generation(self, database_id: str) -> int:
+        """
+        Returns the number of invalidations of a database, read before a search to `put` its hits.
+        """
+        with self._lock:
+            return self._generations.get(database_id, 0)
+
+
+    def put(self, database_id: str, query_embedding, k: int, hits: list, generation: int = None):
+        """
+        Stores the hits of a search.
+
+        Args:
+            hits (List[Tuple[str, str, dict, float]]): Chunk id, text, metadata and score of every hit.
+            generation (int, optional): The `generation` of the database when the search started. The hits are
+                                        dropped if it was invalidated since.
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generations.get(database_id, 0):
+                return
+            entry_id = next(self._ids)
+            self._entries[entry_id] = {
+                "database_id": database_id,
+                "k": k,
+                "embedding": self._normalize(query_embedding),
+                "hits": hits,
+                "stored_at": time.time()
+            }
+            self._by_database.setdefault(database_id, set()).add(entry_id)
+            self._matrices.pop(database_id, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+
+    def invalidate(self, database_id: str):
+        """
+        Drops every entry of a database.
+        """
+        with self._lock:
+            self._generations[database_id] = self._generations.get(database_id, 0) + 1
+            entry_ids = self._by_database.pop(database_id, set())
+            for entry_id in entry_ids:
+                self._entries.pop(entry_id, None)
+            self._matrices.pop(database_id, None)
+            if entry_ids:
+                self.invalidations += 1
+
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            labels = ["<{}".format(self.HISTOGRAM_BUCKETS[0])]
+            labels += ["{}-{}".format(low, high) for low, high in zip(self.HISTOGRAM_BUCKETS, self.HISTOGRAM_BUCKETS[1:])]
+            labels += [">={}".format(self.HISTOGRAM_BUCKETS[-1])]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "min_similarity": self.min_similarity,
+                "ttl_seconds": self.ttl_seconds,
+                "nearest_similarity_histogram": dict(zip(labels, self.histogram)),
+            }
+
+
+    def _matrix(self, database_id: str, k: int):
+        #Stacked embeddings of the entries of a database and k, rebuilt only after the entries change
+        matrices = self._matrices.setdefault(database_id, {})
+        if k not in matrices:
+            entry_ids = [entry_id for entry_id in self._by_database.get(database_id, ()) if self._entries[entry_id]["k"] == k]
+            matrix = np.stack([self._entries[entry_id]["embedding"] for entry_id in entry_ids]) if entry_ids else None
+            matrices[k] = (entry_ids, matrix)
+        return matrices[k]
+
+
+    def _expire(self, database_id: str, now: float):
+        expired = [entry_id for entry_id in self._by_database.get(database_id, ())
+                   if now - self._entries[entry_id]["stored_at"] > self.ttl_seconds]
+        for entry_id in expired:
+            self._remove(entry_id)
+            self.expirations += 1
+
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        entry_ids = self._by_database.get(entry["database_id"])
+        if entry_ids is not None:
+            entry_ids.discard(entry_id)
+            if not entry_ids:
+                del self._by_database[entry["database_id"]]
+        self._matrices.pop(entry["database_id"], None)
+
+
+    def _record(self, similarity):
+        if similarity is None:
+            return
+        bucket = 0
+        while bucket < len(self.HISTOGRAM_BUCKETS) and similarity >= self.HISTOGRAM_BUCKETS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
@@ -3,27 +3,43 @@ from statusDatabaseManager import StatusEnum, StatusDatabaseManager
 from flask import Flask, render_template, request, jsonify, redirect, url_for, make_response
 from cryptoManager import CryptoManager
 from databasesManager import DatabasesManager
+from ingestionQueue import IngestionQueue, QueueFullError
+from databaseReclaimer import DatabaseReclaimer
+from embeddingBackends import set_worker_threads
+from preforkServer import PreforkServer
+from configClasses.serverConfig import ServerConfig
 from utils import Utils
 
 import os 
 import uuid
-import threading
 import json
+import shutil
 
 class RetrievalAndDatabaseAgent: 
     
     def __init__(self): 
         self.app = Flask(__name__)
         self.setup_routes()
-        self.database_manager = DatabasesManager()
+        self.serverConfig = ServerConfig()
+        #In prefork mode the embedding model is loaded once, before forking, and shared by the workers
+        self.database_manager = DatabasesManager(preload_for_fork=self.serverConfig.serving_mode == "prefork")
         self.status_database = StatusDatabaseManager()
+        self.ingestion_queue = IngestionQueue(self.database_manager, self.status_database, self.database_manager.config)
+        self.reclaimer = DatabaseReclaimer(self.database_manager, self.status_database, self.database_manager.config)
         self.utils = Utils()
         
     
     def setup_routes(self):
         self.app.add_url_rule('/createvectordatabase', 'createvectordatabase', self.create_vector_database, methods=['POST'])
+        self.app.add_url_rule('/createvectordatabasestream', 'createvectordatabasestream', self.create_vector_database_stream, methods=['POST'])
         self.app.add_url_rule('/deletevectordatabase', 'deletevectordatabase', self.delete_vector_database, methods=['POST'])
+        self.app.add_url_rule('/addfilestovectordatabase', 'addfilestovectordatabase', self.add_files_to_vector_database, methods=['POST'])
+        self.app.add_url_rule('/removefilesfromvectordatabase', 'removefilesfromvectordatabase', self.remove_files_from_vector_database, methods=['POST'])
         self.app.add_url_rule('/getretrievalcontext', 'getretrievalcontext', self.get_retrieval_context, methods=['POST'])
+        self.app.add_url_rule('/getretrievalcontextmulti', 'getretrievalcontextmulti', self.get_retrieval_context_multi, methods=['POST'])
+        self.app.add_url_rule('/getretrievalcontextbatch', 'getretrievalcontextbatch', self.get_retrieval_context_batch, methods=['POST'])
+        self.app.add_url_rule('/getdatabasestatus', 'getdatabasestatus', self.get_database_status, methods=['POST'])
+        self.app.add_url_rule('/getmetrics', 'getmetrics', self.get_metrics, methods=['GET'])
          
     def create_vector_database(self):
         """
@@ -34,11 +50,15 @@ class RetrievalAndDatabaseAgent:
         is as follows:
 
         - `files`: List of files to be uploaded (array of strings, where each string is a file name).
+        - `user` (optional): The user the database belongs to, used to share the ingestion workers fairly.
+        - `priority` (optional): Priority of the ingestion job, higher runs first. An integer from 
+        -`ingest_queue_max_priority` to `ingest_queue_max_priority` (retrievalInfo.txt). Defaults to 0.
 
         The function decrypts the `cipherData`, verifies the presence of required fields, creates a new folder 
-        for the files, and saves the uploaded files. It then starts a background thread to create the database 
+        for the files, and saves the uploaded files. It then queues an ingestion job to create the database 
         while immediately responding with the unique database identifier. If any required fields are missing, 
-        an error message is returned.
+        an error message is returned. If the ingestion queue is full, the upload is refused with 429 so the 
+        client can retry later.
 
         ---
         parameters:
@@ -74,6 +94,14 @@ class RetrievalAndDatabaseAgent:
                 type: array
                 items:
                     type: string
+        429:
+            description: The ingestion queue is full.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Busy"
         500:
             description: Internal server error occurred during processing.
             schema:
@@ -102,32 +130,126 @@ class RetrievalAndDatabaseAgent:
 
             files = data ["files"]
             
+            try:
+                priority = self.ingestion_queue.check_priority(data.get("priority"))
+            except ValueError:
+                return self._invalid_priority_response()
+            
+            if self.ingestion_queue.is_full():
+                return self._busy_response()
+            
             folder_name = str(uuid.uuid4())
             folder_path = os.path.join("RADAgent",".temp",folder_name)
             os.makedirs(folder_path)
             
             self.utils.save_pdfs(container=folder_path, files=files)
             
-            self.status_database.add_entry(database_id=folder_name, status_value=StatusEnum.processing)
-            thread = threading.Thread(target=self.database_manager.create_database, args=(folder_path, folder_name))
-            thread.start()
-            
-            data = {
-                "database_id": folder_name
-            }
+            return self._submit_new_database(folder_name, folder_path, data.get("user"), priority)
+        
+        except Exception as e: 
+            return jsonify({"message": "Error in RAD Agent"}), 500    
+    
+    
+    def create_vector_database_stream(self):
+        """
+        Create a vector database from files uploaded as a binary stream.
+
+        Same as `/createvectordatabase`, but the body is a stream of `CryptoManager.encrypt_stream` records 
+        instead of JSON with the files as hex. The frames are:
+
+        - A metadata frame with the JSON of `user` (optional) and `priority` (optional).
+        - For every file, a frame with the JSON of its `title` followed by frames with its bytes.
+
+        Every frame is authenticated and written to disk as it arrives, so the agent never holds more than a 
+        record of the upload in memory. A stream that fails authentication or is truncated is discarded.
+
+        ---
+        parameters:
+        - name: body
+            in: body
+            required: true
+            description: Encrypted binary stream (application/octet-stream) with the metadata and the files.
+
+        responses:
+        200:
+            description: Vector database creation initiated successfully.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted identifier for the new database.
+        400:
+            description: The stream does not start with the metadata, has an invalid priority, has no files or fails 
+                         authentication.
+        429:
+            description: The ingestion queue is full.
+        500:
+            description: Internal server error occurred during processing.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Error in RAD Agent"
+        """
+        try:
+            if self.ingestion_queue.is_full():
+                #Read the upload to the end so the client gets the response
+                for _ in iter(lambda: request.stream.read(1024 * 1024), b""):
+                    pass
+                return self._busy_response()
             
-            json_data = json.dumps(data)
+            frames = CryptoManager.decrypt_stream(request.stream)
+            folder_name = str(uuid.uuid4())
+            folder_path = os.path.join("RADAgent",".temp",folder_name)
+            os.makedirs(folder_path)
             
-            cipherData = CryptoManager.encrypt_text(json_data)
-            data_to_send = {"cipherData": cipherData}
+            try:
+                frame_type, payload = next(frames, (None, None))
+                if frame_type != self.utils.FRAME_METADATA:
+                    raise ValueError("Stream without metadata")
+                data = json.loads(payload)
+                priority = self.ingestion_queue.check_priority(data.get("priority"))
+                titles = self.utils.save_pdf_frames(container=folder_path, frames=frames)
+                if not titles:
+                    raise ValueError("Stream without files")
+            except Exception as e:
+                shutil.rmtree(folder_path, ignore_errors=True)
+                print(f"Rejected upload stream: {e!r}")
+                return jsonify({"message": "Invalid upload stream"}), 400
             
-            response = data_to_send, 200
-            return response
+            return self._submit_new_database(folder_name, folder_path, data.get("user"), priority)
         
         except Exception as e: 
             return jsonify({"message": "Error in RAD Agent"}), 500    
     
     
+    def _submit_new_database(self, folder_name, folder_path, user, priority):
+        self.status_database.add_entry(database_id=folder_name, status_value=StatusEnum.processing)
+        try:
+            self.ingestion_queue.submit("create", folder_name, user=user, priority=priority, container_path=folder_path)
+        except QueueFullError:
+            self.status_database.update_entry_status(database_id=folder_name, new_status=StatusEnum.error)
+            return self._busy_response()
+        except Exception:
+            #No job will build the database, it must not stay processing
+            self.status_database.update_entry_status(database_id=folder_name, new_status=StatusEnum.error)
+            raise
+        
+        data = {
+            "database_id": folder_name
+        }
+        
+        json_data = json.dumps(data)
+        
+        cipherData = CryptoManager.encrypt_text(json_data)
+        data_to_send = {"cipherData": cipherData}
+        
+        response = data_to_send, 200
+        return response
+    
+    
     def delete_vector_database(self): 
         """
         Delete a vector database based on the provided database identifier.
@@ -211,6 +333,238 @@ class RetrievalAndDatabaseAgent:
         except Exception as e: 
             return jsonify({"message": "Error in RAD Agent"}), 500  
     
+    def add_files_to_vector_database(self):
+        """
+        Add files to an existing vector database.
+
+        This endpoint receives encrypted data in the `cipherData` field, which contains the identifier of the 
+        database and the files to add. The expected structure of the decrypted JSON is as follows:
+
+        - `database_id`: Identifier of the database to update (string).
+        - `files`: List of files to be added (array of objects with `title` and hex `content`, as in 
+        `/createvectordatabase`).
+        - `user` and `priority` (optional): As in `/createvectordatabase`.
+
+        Only the new files are parsed and embedded. A file with the name of a file already in the database 
+        replaces it. The update is queued as an ingestion job, the database is "processing" while it runs.
+
+        ---
+        parameters:
+        - name: cipherData
+            in: body
+            required: true
+            description: Encrypted JSON string that contains the database identifier and the files.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted data representing the database identifier and the files.
+
+        responses:
+        200:
+            description: Update of the database initiated successfully.
+            schema:
+            type: object
+            properties:
+                OK:
+                type: string
+                example: "OK"
+        400:
+            description: Missing required fields in the JSON request.
+            schema:
+            type: object
+            properties:
+                error:
+                type: string
+                example: "Faltan argumentos en el JSON"
+                missing_fields:
+                type: array
+                items:
+                    type: string
+        409:
+            description: The database is not ready to be updated.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Database is not ready"
+        429:
+            description: The ingestion queue is full.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Busy"
+        500:
+            description: Internal server error occurred during processing.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Error in RAD Agent"
+        """
+        try:
+            encrypted_data = request.get_json()
+
+            if isinstance(encrypted_data, str):
+                encrypted_data = json.loads(encrypted_data)
+
+            cipher_text = encrypted_data.get('cipherData')
+            decrypted_data = CryptoManager.decrypt_text(cipher_text)
+            data = json.loads(decrypted_data)
+            
+            required_fields = ['database_id', 'files']
+            missing_fields = [field for field in required_fields if data.get(field) is None]
+
+            if missing_fields:
+                return jsonify({"error": "Faltan argumentos en el JSON", "missing_fields": missing_fields}), 400
+
+            database_id = data["database_id"]
+            files = data["files"]
+            
+            try:
+                priority = self.ingestion_queue.check_priority(data.get("priority"))
+            except ValueError:
+                return self._invalid_priority_response()
+            
+            if not self.status_database.entry_exists(database_id) or self.status_database.get_database_status(database_id) != StatusEnum.ready:
+                return jsonify({"message": "Database is not ready"}), 409
+            
+            if self.ingestion_queue.is_full():
+                return self._busy_response()
+            
+            folder_name = str(uuid.uuid4())
+            folder_path = os.path.join("RADAgent",".temp",folder_name)
+            os.makedirs(folder_path)
+            
+            self.utils.save_pdfs(container=folder_path, files=files)
+            
+            self.ingestion_queue.submit("add", database_id, user=data.get("user"), priority=priority,
+                                        container_path=folder_path)
+            
+            return make_response(jsonify({"OK": "OK"}), 200)
+        
+        except QueueFullError:
+            return self._busy_response()
+        except Exception as e: 
+            return jsonify({"message": "Error in RAD Agent"}), 500
+    
+    
+    def remove_files_from_vector_database(self):
+        """
+        Remove files from an existing vector database.
+
+        This endpoint receives encrypted data in the `cipherData` field, which contains the identifier of the 
+        database and the names of the files to remove. The expected structure of the decrypted JSON is as follows:
+
+        - `database_id`: Identifier of the database to update (string).
+        - `files`: Names of the files to remove (array of strings).
+        - `user` and `priority` (optional): As in `/createvectordatabase`.
+
+        Every chunk of those files is deleted from the database. The update is queued as an ingestion job, the 
+        database is "processing" while it runs.
+
+        ---
+        parameters:
+        - name: cipherData
+            in: body
+            required: true
+            description: Encrypted JSON string that contains the database identifier and the file names.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted data representing the database identifier and the file names.
+
+        responses:
+        200:
+            description: Update of the database initiated successfully.
+            schema:
+            type: object
+            properties:
+                OK:
+                type: string
+                example: "OK"
+        400:
+            description: Missing required fields in the JSON request.
+            schema:
+            type: object
+            properties:
+                error:
+                type: string
+                example: "Faltan argumentos en el JSON"
+                missing_fields:
+                type: array
+                items:
+                    type: string
+        409:
+            description: The database is not ready to be updated.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Database is not ready"
+        429:
+            description: The ingestion queue is full.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Busy"
+        500:
+            description: Internal server error occurred during processing.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Error in RAD Agent"
+        """
+        try:
+            encrypted_data = request.get_json()
+
+            if isinstance(encrypted_data, str):
+                encrypted_data = json.loads(encrypted_data)
+
+            cipher_text = encrypted_data.get('cipherData')
+            decrypted_data = CryptoManager.decrypt_text(cipher_text)
+            data = json.loads(decrypted_data)
+            
+            required_fields = ['database_id', 'files']
+            missing_fields = [field for field in required_fields if data.get(field) is None]
+
+            if missing_fields:
+                return jsonify({"error": "Faltan argumentos en el JSON", "missing_fields": missing_fields}), 400
+
+            database_id = data["database_id"]
+            files = data["files"]
+            
+            try:
+                priority = self.ingestion_queue.check_priority(data.get("priority"))
+            except ValueError:
+                return self._invalid_priority_response()
+            
+            if not self.status_database.entry_exists(database_id) or self.status_database.get_database_status(database_id) != StatusEnum.ready:
+                return jsonify({"message": "Database is not ready"}), 409
+            
+            self.ingestion_queue.submit("remove", database_id, user=data.get("user"), priority=priority,
+                                        files=files)
+            
+            return make_response(jsonify({"OK": "OK"}), 200)
+        
+        except QueueFullError:
+            return self._busy_response()
+        except Exception as e: 
+            return jsonify({"message": "Error in RAD Agent"}), 500
+    
+    
     def get_retrieval_context(self):
         """
         Retrieve context for a given message from a specified database.
@@ -221,6 +575,18 @@ class RetrievalAndDatabaseAgent:
 
         - `last_message`: The last message from the user (string).
         - `database`: Identifier for the database from which to retrieve context (string).
+        - `retrieval_mode`: `dense`, `lexical` or `hybrid` (string, optional, defaults to the configured mode).
+        - `top_k`: Maximum number of documents to retrieve (positive integer, optional, defaults to 5, capped at `max_top_k`).
+        - `similarity_threshold`: Minimum cosine similarity of the documents in `dense` mode (number, optional, 
+        defaults to the configured threshold).
+
+        In `dense` mode fewer than `top_k` documents are returned when the rest are below the threshold or 
+        after a large drop of similarity. Every document carries its score in the `score` metadata. Chunks 
+        of the same page that overlap are joined into one passage and duplicated passages are dropped, so 
+        the overlap of the splitter is not sent twice.
+
+        Clients that send the `X-Envelope: 2` header get the context as an envelope v2 (`CryptoManager.seal`) 
+        and can send the request as one too.
 
         The function decrypts the `cipherData`, verifies the presence of required fields, checks the status 
         of the specified database, and retrieves the relevant context if the database is ready. If the 
@@ -250,7 +616,7 @@ class RetrievalAndDatabaseAgent:
                 type: string
                 description: The encrypted context data retrieved from the database.
         400:
-            description: Missing required fields in the JSON request.
+            description: Missing required fields in the JSON request, or a `top_k` that is not a positive integer.
             schema:
             type: object
             properties:
@@ -279,15 +645,7 @@ class RetrievalAndDatabaseAgent:
                 example: "Error in RAD Agent"
         """
         try: 
-            encrypted_data = request.get_json()
-
-            if isinstance(encrypted_data, str):
-                encrypted_data = json.loads(encrypted_data)
-
-            cipher_text = encrypted_data.get('cipherData')
-            decrypted_data = CryptoManager.decrypt_text(cipher_text)
-            
-            data = json.loads(decrypted_data)
+            data, version = CryptoManager.load_request(request)
             
             required_fields = ['last_message' ,'database']
             missing_fields = [field for field in required_fields if data.get(field) is None]
@@ -297,6 +655,15 @@ class RetrievalAndDatabaseAgent:
 
             message = data.get('last_message')
             database = data.get('database')
+            retrieval_mode = data.get('retrieval_mode') or self.database_manager.config.default_retrieval_mode
+            
+            if retrieval_mode not in DatabasesManager.RETRIEVAL_MODES:
+                return jsonify({"error": "Modo de recuperación no válido", "retrieval_modes": list(DatabasesManager.RETRIEVAL_MODES)}), 400
+            
+            try:
+                top_k = self.database_manager.check_top_k(data.get('top_k'))
+            except ValueError:
+                return self._invalid_top_k_response()
             
             database_status = self.status_database.get_database_status(database_id=database)
             
@@ -307,18 +674,415 @@ class RetrievalAndDatabaseAgent:
                     response = make_response(jsonify({"Error": "Processing Database"}), 503)
                 return response
             
-            context = self.database_manager.get_context(database_name=database, query_text=message)
-            context_json = json.dumps([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in context])
-            cipherData = CryptoManager.encrypt_text(context_json)
-            response = make_response(jsonify({"cipherData": cipherData}), 200)
-            return response
+            similarity_threshold = data.get('similarity_threshold')
+            similarity_threshold = float(similarity_threshold) if similarity_threshold is not None else None
+            
+            context = self.database_manager.get_context(database_name=database, query_text=message, top_k=top_k,
+                                                        similarity_threshold=similarity_threshold, retrieval_mode=retrieval_mode)
+            context = self.database_manager.merge_context(context)
+            context = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in context]
+            return CryptoManager.dump_response(context, version)
+        
+        except Exception as e: 
+            return jsonify({"message": "Error in RAD Agent"}), 500
+    
+    
+    def get_retrieval_context_multi(self):
+        """
+        Retrieve context for a given message from several databases at once.
+
+        This endpoint receives encrypted data in the `cipherData` field, which contains the last message 
+        and the identifiers of every database to search. The expected structure of the decrypted JSON 
+        is as follows:
+
+        - `last_message`: The last message from the user (string).
+        - `databases`: Identifiers for the databases from which to retrieve context (array of strings).
+        - `retrieval_mode`: `dense`, `lexical` or `hybrid` (string, optional, defaults to the configured mode).
+        - `top_k`: Maximum number of documents of the merged result (positive integer, optional, defaults to 5, capped at 
+        `max_top_k`).
+        - `similarity_threshold`: Minimum cosine similarity of the documents (number, optional, defaults to the 
+        configured threshold).
+
+        The message is embedded once and the databases are searched concurrently. The hits are merged 
+        into one list of `top_k` documents, by similarity in `dense` mode and by reciprocal-rank fusion of the 
+        rankings of every database in `lexical` and `hybrid` mode; databases that are not ready are skipped. 
+        The context is encrypted and sent back in the same format as `/getretrievalcontext`.
+
+        ---
+        parameters:
+        - name: cipherData
+            in: body
+            required: true
+            description: Encrypted JSON string that contains the last message and the database identifiers.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted data representing the last message and the database identifiers.
+
+        responses:
+        200:
+            description: Context retrieved successfully.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted merged context data.
+        400:
+            description: Missing required fields in the JSON request, or a `top_k` that is not a positive integer.
+            schema:
+            type: object
+            properties:
+                error:
+                type: string
+                example: "Faltan argumentos en el JSON"
+                missing_fields:
+                type: array
+                items:
+                    type: string
+        500:
+            description: Internal server error occurred during processing.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Error in RAD Agent"
+        """
+        try: 
+            data, version = CryptoManager.load_request(request)
+            
+            required_fields = ['last_message' ,'databases']
+            missing_fields = [field for field in required_fields if data.get(field) is None]
+
+            if missing_fields:
+                return jsonify({"error": "Faltan argumentos en el JSON", "missing_fields": missing_fields}), 400
+
+            message = data.get('last_message')
+            databases = data.get('databases')
+            retrieval_mode = data.get('retrieval_mode') or self.database_manager.config.default_retrieval_mode
+            
+            if retrieval_mode not in DatabasesManager.RETRIEVAL_MODES:
+                return jsonify({"error": "Modo de recuperación no válido", "retrieval_modes": list(DatabasesManager.RETRIEVAL_MODES)}), 400
+            
+            try:
+                top_k = self.database_manager.check_top_k(data.get('top_k'))
+            except ValueError:
+                return self._invalid_top_k_response()
+            
+            similarity_threshold = data.get('similarity_threshold')
+            similarity_threshold = float(similarity_threshold) if similarity_threshold is not None else None
+            
+            context = self.database_manager.get_context_multi(database_names=databases, query_text=message, top_k=top_k,
+                                                              similarity_threshold=similarity_threshold,
+                                                              retrieval_mode=retrieval_mode)
+            context = self.database_manager.merge_context(context)
+            context = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in context]
+            return CryptoManager.dump_response(context, version)
+        
+        except Exception as e: 
+            return jsonify({"message": "Error in RAD Agent"}), 500
+    
+    
+    def get_retrieval_context_batch(self):
+        """
+        Retrieve context for several queries, possibly against several databases, in one request.
+
+        This endpoint receives encrypted data in the `cipherData` field with a list of retrieval requests. 
+        The expected structure of the decrypted JSON is as follows:
+
+        - `items`: List of retrieval requests (array of objects), each one with:
+            - `query`: The text to retrieve context for (string).
+            - `database_id`: Identifier for the database to search (string).
+            - `top_k`: Maximum number of documents to retrieve (positive integer, optional, defaults to 5, capped at `max_top_k`).
+            - `similarity_threshold`: Minimum cosine similarity of the documents (number, optional).
+
+        Up to `batch_max_items` items (retrievalInfo.txt). All the queries are embedded in one batched forward 
+        pass and the queries of every database are searched together. The results are returned in the order of 
+        the items inside one encrypted response. An item whose database is not ready gets an `error` instead of 
+        a `context`; it does not fail the whole batch.
+        Requests and responses can be envelopes v2, like in `/getretrievalcontext`.
+
+        ---
+        parameters:
+        - name: cipherData
+            in: body
+            required: true
+            description: Encrypted JSON string that contains the list of retrieval requests.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted data representing the list of retrieval requests.
+
+        responses:
+        200:
+            description: Batch processed. 
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted JSON with a `results` array, one entry per item with either a 
+                             `context` list or an `error` string.
+        400:
+            description: Missing or malformed fields in the JSON request, a `top_k` that is not a positive integer, 
+                         or more than `batch_max_items` items.
+            schema:
+            type: object
+            properties:
+                error:
+                type: string
+                example: "Faltan argumentos en el JSON"
+                missing_fields:
+                type: array
+                items:
+                    type: string
+        500:
+            description: Internal server error occurred during processing.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Error in RAD Agent"
+        """
+        try: 
+            data, version = CryptoManager.load_request(request)
+            
+            required_fields = ['items']
+            missing_fields = [field for field in required_fields if data.get(field) is None]
+
+            if missing_fields:
+                return jsonify({"error": "Faltan argumentos en el JSON", "missing_fields": missing_fields}), 400
+
+            items = data.get('items')
+            
+            if (not isinstance(items, list)) or any((not isinstance(item, dict)) or item.get("query") is None or item.get("database_id") is None for item in items):
+                return jsonify({"error": "Cada elemento necesita query y database_id"}), 400
+            
+            if len(items) > self.database_manager.config.batch_max_items:
+                return jsonify({"error": "Demasiados elementos", "max_items": self.database_manager.config.batch_max_items}), 400
+            
+            try:
+                for item in items:
+                    self.database_manager.check_top_k(item.get("top_k"))
+            except ValueError:
+                return self._invalid_top_k_response()
+            
+            batch = self.database_manager.get_context_batch(items)
+            
+            results = []
+            for result in batch:
+                if "error" in result:
+                    results.append({"error": result["error"]})
+                else:
+                    documents = self.database_manager.merge_context(result["documents"])
+                    results.append({"context": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]})
+            
+            return CryptoManager.dump_response({"results": results}, version)
         
         except Exception as e: 
             return jsonify({"message": "Error in RAD Agent"}), 500
     
     
+    def get_database_status(self):
+        """
+        Return the status of a vector database and the progress of its last ingestion job.
+
+        This endpoint receives encrypted data in the `cipherData` field. The expected structure of the decrypted 
+        JSON is as follows:
+
+        - `database_id`: Identifier of the database (string).
+
+        The encrypted response contains the status of the database and, if its ingestion was tracked, the files
+        and pages parsed, the chunks produced, embedded and written, the bytes written, the seconds spent in the
+        parse, split, embed and persist stages, the throughput and the estimated time left.
+
+        ---
+        parameters:
+        - name: cipherData
+            in: body
+            required: true
+            description: Encrypted JSON string that contains the database identifier.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted data representing the database identifier.
+
+        responses:
+        200:
+            description: Status and progress of the database.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted status and progress.
+        400:
+            description: Missing required fields in the JSON request.
+            schema:
+            type: object
+            properties:
+                error:
+                type: string
+                example: "Faltan argumentos en el JSON"
+                missing_fields:
+                type: array
+                items:
+                    type: string
+        404:
+            description: The database does not exist.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Unknown Database"
+        500:
+            description: Internal server error occurred during processing.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Error in RAD Agent"
+        """
+        try:
+            encrypted_data = request.get_json()
+
+            if isinstance(encrypted_data, str):
+                encrypted_data = json.loads(encrypted_data)
+
+            cipher_text = encrypted_data.get('cipherData')
+            decrypted_data = CryptoManager.decrypt_text(cipher_text)
+            data = json.loads(decrypted_data)
+            
+            required_fields = ['database_id']
+            missing_fields = [field for field in required_fields if data.get(field) is None]
+
+            if missing_fields:
+                return jsonify({"error": "Faltan argumentos en el JSON", "missing_fields": missing_fields}), 400
+
+            database_id = data["database_id"]
+            
+            if not self.status_database.entry_exists(database_id):
+                return jsonify({"message": "Unknown Database"}), 404
+            
+            json_data = json.dumps(self.database_manager.get_database_progress(database_id))
+            
+            cipherData = CryptoManager.encrypt_text(json_data)
+            return {"cipherData": cipherData}, 200
+        
+        except Exception as e: 
+            return jsonify({"message": "Error in RAD Agent"}), 500
+    
+    
+    def get_metrics(self):
+        """
+        Return the RAD agent counters used to size caches and budgets.
+
+        The response only contains counters and sizes, never user content, so it is not encrypted.
+
+        ---
+        responses:
+        200:
+            description: Current metrics of the agent.
+            schema:
+            type: object
+            properties:
+                caches:
+                type: object
+                description: Hit/miss counters and resident sizes of the retrieval caches, and the similarity of the queries to their nearest cached query.
+                retrieval_latency:
+                type: object
+                description: Count, average and percentiles of the retrieval latency per retrieval mode.
+                quantization:
+                type: object
+                description: Float and resident code sizes of every quantized database.
+                ingestion:
+                type: array
+                description: Chunks, seconds, chunks per second and per-file parse times of the most recent ingestions.
+                ingestion_queue:
+                type: object
+                description: Workers, depth limit, queued and running jobs, per user, and the wait of the oldest job.
+                context_merging:
+                type: object
+                description: Chunks, bytes and tokens of the contexts before and after joining overlapping chunks.
+                adaptive_top_k:
+                type: object
+                description: Candidates and returned chunks of the dense searches, and why the others were dropped.
+                reclaimer:
+                type: object
+                description: Bytes, deleted databases and upload folders removed from disk, and deleted databases still in use.
+                server:
+                type: object
+                description: Serving mode, number of workers and pid of the worker that answered. With several workers the other counters are those of this worker.
+        500:
+            description: Internal server error occurred during processing.
+        """
+        try:
+            metrics = {
+                "caches": self.database_manager.get_cache_stats(),
+                "retrieval_latency": self.database_manager.get_latency_stats(),
+                "quantization": self.database_manager.get_quantization_stats(),
+                "ingestion": self.database_manager.get_ingestion_stats(),
+                "context_merging": self.database_manager.get_context_merge_stats(),
+                "adaptive_top_k": self.database_manager.get_cutoff_stats(),
+                "ingestion_queue": self.ingestion_queue.get_stats(),
+                "reclaimer": self.reclaimer.get_stats(),
+                "server": {"serving_mode": self.serverConfig.serving_mode, "workers": self.serverConfig.workers, "pid": os.getpid()}
+            }
+            return make_response(jsonify(metrics), 200)
+        
+        except Exception as e: 
+            return jsonify({"message": "Error in RAD Agent"}), 500
+    
+    
+    def _invalid_priority_response(self):
+        return jsonify({"error": "Prioridad no válida", "max_priority": self.ingestion_queue.max_priority}), 400
+    
+    
+    def _invalid_top_k_response(self):
+        return jsonify({"error": "top_k no válido", "max_top_k": self.database_manager.config.max_top_k}), 400
+    
+    
+    def _busy_response(self):
+        response = make_response(jsonify({"message": "Busy"}), 429)
+        response.headers["Retry-After"] = "30"
+        return response
+    
+    
     def run(self):
-        self.app.run(port=5007, debug=True)
+        if self.serverConfig.serving_mode == "prefork":
+            PreforkServer(self.app, self.serverConfig, post_fork=self._post_fork).serve_forever()
+        elif self.serverConfig.serving_mode == "dev":
+            #The reloader builds the agent in its watcher process too, only the serving process runs ingestion jobs
+            if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+                self.ingestion_queue.start()
+                self.reclaimer.start()
+            self.app.run(port=self.serverConfig.port, debug=True)
+        else:
+            raise ValueError("Unknown serving mode {}".format(self.serverConfig.serving_mode))
+
+
+    def _post_fork(self, worker: int):
+        workers = self.serverConfig.workers
+        set_worker_threads(self.database_manager.config, workers)
+        if workers > 1:
+            StatusDatabaseManager.follow_other_processes()
+            self.database_manager.readers.share_between_processes(os.path.join("RADAgent", ".readers"))
+        #The queue and the reclaimer own the jobs and the disk, they run in the first worker only
+        if worker == 0:
+            self.ingestion_queue.start()
+            self.reclaimer.start()
+        else:
+            self.ingestion_queue.run_jobs = False
         
         
 if __name__ == '__main__':
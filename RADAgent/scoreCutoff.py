@@ -0,0 +1,72 @@
+import threading
+
+
+class ScoreCutoff:
+    """
+        Chooses how many of the hits of a search are worth returning, between `min_k` and the `top_k` asked for.
+
+        Hits are ordered by decreasing cosine similarity. The result keeps:
+            1. The hits with a similarity of at least `threshold`, and never fewer than `min_k`.
+            2. Of those, the ones before the largest drop of similarity between two consecutive hits (the
+               elbow), if that drop is at least `gap`. A query with one clearly relevant passage and a tail of
+               loosely related ones returns just the passage.
+
+        Every chunk left out is a chunk not encrypted, sent and given to the language model as prompt tokens.
+        The counters of candidates and returned chunks are reported with the metrics of the agent.
+    """
+
+    def __init__(self, min_k: int = 1, threshold: float = 0.0, gap: float = 0.0):
+        self.min_k = max(1, min_k)
+        self.threshold = threshold
+        self.gap = gap
+        self.lock = threading.Lock()
+        self.searches = 0
+        self.candidates = 0
+        self.returned = 0
+        self.below_threshold = 0
+        self.after_elbow = 0
+
+
+    def apply(self, scored_documents: list, threshold: float = None) -> list:
+        """
+        Args:
+            scored_documents (List[Tuple[Document, float]]): The hits, ordered by decreasing cosine similarity.
+            threshold (float, optional): Overrides the configured threshold for this search.
+
+        Returns:
+            List[Tuple[Document, float]]: The first hits of `scored_documents` worth returning.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        scores = [score for _, score in scored_documents]
+
+        keep = max(sum(1 for score in scores if score >= threshold), min(self.min_k, len(scores)))
+        above_threshold = keep
+
+        if self.gap > 0 and keep > self.min_k:
+            drops = [(scores[position - 1] - scores[position], position) for position in range(self.min_k, keep)]
+            drop, position = max(drops)
+            if drop >= self.gap:
+                keep = position
+
+        with self.lock:
+            self.searches += 1
+            self.candidates += len(scores)
+            self.returned += keep
+            self.below_threshold += len(scores) - above_threshold
+            self.after_elbow += above_threshold - keep
+        return scored_documents[:keep]
+
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "min_k": self.min_k,
+                "threshold": self.threshold,
+                "gap": self.gap,
+                "searches": self.searches,
+                "candidates": self.candidates,
+                "returned": self.returned,
+                "dropped_below_threshold": self.below_threshold,
+                "dropped_after_elbow": self.after_elbow,
+                "average_returned": (self.returned / self.searches) if self.searches else 0.0,
+            }
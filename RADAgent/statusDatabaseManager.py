@@ -1,5 +1,8 @@
-from peewee import CharField, SqliteDatabase, Model
+from peewee import CharField, IntegerField, BigIntegerField, FloatField, TextField, AutoField, SqliteDatabase, Model
+from contextlib import contextmanager
 from enum import Enum
+import threading
+import sqlite3
 import os
 
 class StatusEnum(str, Enum):
@@ -8,65 +11,360 @@ class StatusEnum(str, Enum):
     error = "error"
     deleted = "deleted"
 
+class JobStateEnum(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
 class Databases(Model):
     database_id = CharField(primary_key=True, max_length=100)
     status = CharField(choices=[(status.value, status.value) for status in StatusEnum])
 
     class Meta:
-        database = SqliteDatabase('RADAgent/status_database.db')  
+        #WAL lets the status reads of the request threads run while an ingestion job writes its progress
+        database = SqliteDatabase('RADAgent/status_database.db', pragmas={'journal_mode': 'wal'}, timeout=30)
+
+class FileParseStats(Model):
+    database_id = CharField(max_length=100, index=True)
+    file = CharField()
+    pages = IntegerField(default=0)
+    chunks = IntegerField(default=0)
+    seconds = FloatField(default=0.0)
+    status = CharField(default="ok")
+    error = CharField(null=True)
+
+    class Meta:
+        database = Databases._meta.database
+
+class IngestionStats(Model):
+    database_id = CharField(primary_key=True, max_length=100)
+    chunks = IntegerField(default=0)
+    seconds = FloatField(default=0.0)
+    chunks_per_second = FloatField(default=0.0)
+    embedding_cache_hits = IntegerField(default=0)
+    embedding_cache_misses = IntegerField(default=0)
+    embedding_cache_hit_rate = FloatField(default=0.0)
+
+    class Meta:
+        database = Databases._meta.database
+
+class IngestionProgress(Model):
+    database_id = CharField(primary_key=True, max_length=100)
+    files_total = IntegerField(default=0)
+    files_parsed = IntegerField(default=0)
+    pages_total = IntegerField(default=0)
+    pages_parsed = IntegerField(default=0)
+    chunks_produced = IntegerField(default=0)
+    chunks_embedded = IntegerField(default=0)
+    chunks_written = IntegerField(default=0)
+    bytes_written = BigIntegerField(default=0)
+    parse_seconds = FloatField(default=0.0)
+    split_seconds = FloatField(default=0.0)
+    embed_seconds = FloatField(default=0.0)
+    persist_seconds = FloatField(default=0.0)
+    started_at = FloatField()
+    updated_at = FloatField()
+
+    class Meta:
+        database = Databases._meta.database
+
+class IngestionJob(Model):
+    id = AutoField()
+    database_id = CharField(max_length=100, index=True)
+    kind = CharField()
+    user = CharField(default="anonymous")
+    priority = IntegerField(default=0)
+    container_path = CharField(null=True)
+    files = TextField(null=True)
+    state = CharField(choices=[(state.value, state.value) for state in JobStateEnum], default=JobStateEnum.queued, index=True)
+    created_at = FloatField()
+    started_at = FloatField(null=True)
+    finished_at = FloatField(null=True)
+
+    class Meta:
+        database = Databases._meta.database
+
+class StatusChange(Model):
+    id = AutoField()
+    database_id = CharField(max_length=100)
+    status = CharField()
+    pid = IntegerField()
+
+    class Meta:
+        database = Databases._meta.database
 
 class StatusDatabaseManager:
+    """
+        Status of every database and the ingestion tables, stored in `RADAgent/status_database.db`.
+
+        The status of the databases is also kept in a map shared by every instance in the process. It is loaded
+        from the table once and updated write-through by `add_entry` and `update_entry_status`, so the status
+        checks of every retrieval are a dictionary lookup instead of a query.
+
+        Peewee keeps one connection per thread. Methods reuse the connection already open in the thread and
+        only close the ones they open, so a listener or a nested call never closes the connection of its caller.
+
+        When several processes share the database, the workers of `PreforkServer`, every process calls
+        `follow_other_processes` to keep its map in sync with the changes made by the others.
+    """
+    
+    #Shared by every instance in the process so any manager can notify status changes
+    _listeners = []
+    _remote_listeners = []
+    _status = None
+    _status_lock = threading.Lock()
+    #Set by `follow_other_processes`
+    _changes = None
+    #Changes kept in the `StatusChange` table, a process that falls further behind reloads the whole map
+    KEEP_CHANGES = 10000
     
     def __init__(self):
         self.db = Databases._meta.database
         self.create_database()
 
     def create_database(self):
-        if not os.path.exists(self.db.database):
-            self.db.connect()
+        #Also on existing files, so tables added in later versions are created
+        with self._connection():
             self.create_tables()
-            self.db.close()
+            with StatusDatabaseManager._status_lock:
+                if StatusDatabaseManager._status is None:
+                    StatusDatabaseManager._status = {entry.database_id: entry.status for entry in Databases.select()}
         
     def create_tables(self):
-        self.db.create_tables([Databases])
+        self.db.create_tables([Databases, FileParseStats, IngestionStats, IngestionProgress, IngestionJob, StatusChange], safe=True)
+
+    @contextmanager
+    def _connection(self):
+        opened = self.db.connect(reuse_if_open=True)
+        try:
+            yield
+        finally:
+            if opened:
+                self.db.close()
         
 
     def add_entry(self, database_id: str, status_value: str = StatusEnum.processing):
         entry = {'database_id': database_id, 'status': status_value}
-        self.db.connect()
-        with self.db.atomic():
-            Databases.create(**entry)
-        self.db.close()
+        with self._connection():
+            with self.db.atomic():
+                Databases.create(**entry)
+                self._log_change(database_id, status_value)
+        with self._status_lock:
+            #The value, as read back from the table
+            self._status[database_id] = StatusEnum(entry['status']).value
 
 
     def get_all_entries(self):
-        self.db.connect()
-        entries = Databases.select()
-        self.db.close()
-        return [(entry.database_id, entry.status) for entry in entries]
+        self._catch_up()
+        with self._status_lock:
+            return list(self._status.items())
 
 
     def entry_exists(self, database_id: str) -> bool:
-        self.db.connect()
-        exists = Databases.select().where(Databases.database_id == database_id).exists()
-        self.db.close()
-        return exists
+        self._catch_up()
+        with self._status_lock:
+            return database_id in self._status
 
 
-    def update_entry_status(self, database_id: str, new_status: str) -> bool:
+    def update_entry_status(self, database_id: str, new_status: str, current_status: str = None) -> bool:
+        """
+        Sets the status of a database. With `current_status`, only if the database still has that status, so
+        a job does not bring back a database deleted while it ran.
+
+        Returns:
+            bool: True if the status was updated.
+        """
         if new_status not in [status.value for status in StatusEnum]:
             return False
 
-        self.db.connect()
-        query = Databases.update(status=new_status).where(Databases.database_id == database_id)
-        result = query.execute()
-        self.db.close()  
+        with self._connection():
+            with self.db.atomic():
+                query = Databases.update(status=new_status).where(Databases.database_id == database_id)
+                if current_status is not None:
+                    query = query.where(Databases.status == StatusEnum(current_status).value)
+                result = query.execute()
+                if result > 0:
+                    self._log_change(database_id, new_status)
+        
+        if result > 0:
+            with self._status_lock:
+                self._status[database_id] = StatusEnum(new_status).value
+            self._notify(database_id, new_status)
         return result > 0 
 
+    @classmethod
+    def add_listener(cls, callback):
+        """
+        Registers `callback(database_id, new_status)` to be called after every successful status update.
+        """
+        cls._listeners.append(callback)
+
+    @classmethod
+    def add_remote_listener(cls, callback):
+        """
+        Registers `callback(database_id, new_status)` to be called for every status update made by another
+        process, before the listeners. Only called after `follow_other_processes`.
+        """
+        cls._remote_listeners.append(callback)
+
+    @classmethod
+    def follow_other_processes(cls):
+        """
+        Keeps the status map of this process in sync with the status updates of the other processes that
+        share the database. Called in every worker process after the fork.
+
+        From then on every status update is also logged in the `StatusChange` table with the pid of its
+        process. The status reads first check `PRAGMA data_version` on a connection of their own, which only
+        changes when another connection commits, and then apply the updates logged by other processes since
+        the last read: the remote listeners and the listeners are notified before the map changes, so the
+        caches of a database are dropped before a search can see its new status. The other status reads of
+        the process wait meanwhile, so the listeners must leave slow work, like loading a collection, to
+        other threads.
+        """
+        connection = sqlite3.connect(Databases._meta.database.database, timeout=30, check_same_thread=False)
+        last_change = connection.execute("SELECT COALESCE(MAX(id), 0) FROM {}".format(StatusChange._meta.table_name)).fetchone()[0]
+        status = dict(connection.execute("SELECT database_id, status FROM {}".format(Databases._meta.table_name)))
+        with cls._status_lock:
+            cls._status = status
+            cls._changes = {"connection": connection, "lock": threading.RLock(), "data_version": None, "last_change": last_change}
+
+    def _log_change(self, database_id: str, new_status: str):
+        #In the transaction of the update, so other processes never see one without the other
+        if self._changes is None:
+            return
+        change_id = StatusChange.insert(database_id=database_id, status=StatusEnum(new_status).value, pid=os.getpid()).execute()
+        StatusChange.delete().where(StatusChange.id <= change_id - self.KEEP_CHANGES).execute()
+
+    def _catch_up(self):
+        changes = self._changes
+        if changes is None:
+            return
+
+        with changes["lock"]:
+            connection = changes["connection"]
+            data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == changes["data_version"]:
+                return
+            changes["data_version"] = data_version
+            rows = connection.execute("SELECT id, database_id, status, pid FROM {} WHERE id > ? ORDER BY id".format(
+                StatusChange._meta.table_name), (changes["last_change"],)).fetchall()
+            if not rows:
+                return
+            missed = rows[0][0] > changes["last_change"] + 1
+            changes["last_change"] = rows[-1][0]
+            if missed:
+                #Older changes were already deleted, every database may have changed
+                rows = [(None, database_id, status, None) for database_id, status in connection.execute(
+                    "SELECT database_id, status FROM {}".format(Databases._meta.table_name))]
+
+            #Still holding the lock: the other threads wait for the map instead of reading the old status
+            for _, database_id, status, pid in rows:
+                if pid == os.getpid():
+                    continue
+                for callback in list(self._remote_listeners):
+                    try:
+                        callback(database_id, status)
+                    except Exception as e:
+                        print(f"Remote status listener failed for {database_id}: {e}")
+                self._notify(database_id, status)
+                with self._status_lock:
+                    self._status[database_id] = status
+
+    def _notify(self, database_id: str, new_status: str):
+        for callback in list(self._listeners):
+            try:
+                callback(database_id, new_status)
+            except Exception as e:
+                print(f"Status listener failed for {database_id}: {e}")
+
+    def add_file_parse_stats(self, database_id: str, file_stats: dict):
+        """
+        Stores the parse stats of every file of a database, as reported by `PdfParsePool.file_stats`.
+        The previous stats of the same files are replaced.
+        """
+        rows = [dict(database_id=database_id, file=file, **stats) for file, stats in file_stats.items()]
+        with self._connection():
+            with self.db.atomic():
+                FileParseStats.delete().where(
+                    (FileParseStats.database_id == database_id) & (FileParseStats.file.in_(list(file_stats)))
+                ).execute()
+                if rows:
+                    FileParseStats.insert_many(rows).execute()
+
+
+    def delete_file_parse_stats(self, database_id: str, files: list):
+        with self._connection():
+            FileParseStats.delete().where(
+                (FileParseStats.database_id == database_id) & (FileParseStats.file.in_(list(files)))
+            ).execute()
+
+
+    def get_file_parse_stats(self, database_id: str) -> list:
+        with self._connection():
+            entries = list(FileParseStats.select().where(FileParseStats.database_id == database_id).order_by(FileParseStats.id))
+        return [{"file": entry.file, "pages": entry.pages, "chunks": entry.chunks, "seconds": entry.seconds,
+                 "status": entry.status, "error": entry.error} for entry in entries]
+
+
+    def add_ingestion_stats(self, database_id: str, stats: dict):
+        """
+        Stores the chunk count, duration, throughput and chunk embedding cache hit rate of the ingestion of a database.
+        """
+        with self._connection():
+            with self.db.atomic():
+                IngestionStats.replace(database_id=database_id, **stats).execute()
+
+
+    def get_ingestion_stats(self, database_id: str):
+        with self._connection():
+            entry = IngestionStats.get_or_none(IngestionStats.database_id == database_id)
+        if entry is None:
+            return None
+        return {field: getattr(entry, field) for field in IngestionStats._meta.sorted_field_names}
+
+
+    def set_ingestion_progress(self, database_id: str, progress: dict):
+        with self._connection():
+            with self.db.atomic():
+                IngestionProgress.replace(database_id=database_id, **progress).execute()
+
+
+    def get_ingestion_progress(self, database_id: str):
+        with self._connection():
+            entry = IngestionProgress.get_or_none(IngestionProgress.database_id == database_id)
+        if entry is None:
+            return None
+        return {field: getattr(entry, field) for field in IngestionProgress._meta.sorted_field_names if field != "database_id"}
+
+
+    def add_job(self, **fields) -> int:
+        with self._connection():
+            with self.db.atomic():
+                job = IngestionJob.create(**fields)
+        return job.id
+
+
+    def get_jobs(self, states: list) -> list:
+        """
+        Returns the ingestion jobs in any of the given states as dicts, oldest first.
+        """
+        with self._connection():
+            jobs = list(IngestionJob.select().where(IngestionJob.state.in_(list(states))).order_by(IngestionJob.id).dicts())
+        return jobs
+
+
+    def update_job(self, job_id: int, **fields) -> bool:
+        with self._connection():
+            result = IngestionJob.update(**fields).where(IngestionJob.id == job_id).execute()
+        return result > 0
+
+
     def get_database_status(self, database_id: str): 
-        
-        self.db.connect() 
-        status = Databases.select().where(Databases.database_id == database_id).get()
-        self.db.close()
-        return status.status
+        self._catch_up()
+        with self._status_lock:
+            status = self._status.get(database_id)
+        if status is None:
+            raise Databases.DoesNotExist("Unknown database {}".format(database_id))
+        return status
 
@@ -1,7 +1,13 @@
 import os
+import json
 
 class Utils:
     
+    #Frame types of the binary uploads
+    FRAME_METADATA = 1
+    FRAME_FILE = 2
+    FRAME_DATA = 3
+    
     def save_pdfs(self, container, files):
        
         for file in files:
@@ -14,4 +20,42 @@ class Utils:
             with open(file_path, 'wb') as pdf_file:
                 pdf_file.write(pdf_bytes)
 
-    
\ No newline at end of file
+
+    def save_pdf_frames(self, container, frames) -> list:
+        """
+        Writes the files of a binary upload into `container` as their frames are received.
+        Returns the titles of the files.
+        """
+        titles = []
+        pdf_file = None
+        try:
+            for frame_type, payload in frames:
+                if frame_type == self.FRAME_FILE:
+                    if pdf_file is not None:
+                        pdf_file.close()
+                    #Only the name, a title can not write outside the container
+                    file_name = os.path.basename(json.loads(payload).get("title", ""))
+                    if not file_name:
+                        raise ValueError("File without title")
+                    titles.append(file_name)
+                    pdf_file = open(os.path.join(container, file_name), 'wb')
+                elif frame_type == self.FRAME_DATA:
+                    if pdf_file is None:
+                        raise ValueError("File content before its title")
+                    pdf_file.write(payload)
+        finally:
+            if pdf_file is not None:
+                pdf_file.close()
+        return titles
+
+
+    def directory_size(self, path) -> int:
+        """Return the size in bytes of all the files below `path`."""
+        total = 0
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
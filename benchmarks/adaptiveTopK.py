@@ -0,0 +1,99 @@
+"""
+Chunks, prompt tokens and payload bytes saved by the adaptive top-k of the RAD agent, and the
+recall it keeps.
+
+Queries are spans of words taken from the chunks of the corpus, so every query has a known source
+chunk. Every query is searched with the exact cosine top-k and the result is cut by `ScoreCutoff`
+with each threshold and gap given. For every setting it reports the average of returned chunks,
+prompt tokens and bytes of the context JSON (what is encrypted and sent to the generation agent),
+and the share of queries whose source chunk is still returned. Tokens are counted with tiktoken
+when it is installed and estimated as characters / 4 otherwise.
+
+Usage (from the repository root):
+    python benchmarks/adaptiveTopK.py --pdfs path/to/pdfs --chunks 2000 --thresholds -1 0.3 0.5 --gaps 0 0.05 0.1
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RADAgent"))
+
+from configClasses.retrievalConfig import RetrievalConfig
+from embeddingBackends import build_embedding_model
+from scoreCutoff import ScoreCutoff
+from corpus import load_corpus
+
+
+def token_counter():
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text)), "tiktoken"
+    except ImportError:
+        return lambda text: len(text) // 4, "chars/4"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", help="Folder with reference PDFs.")
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-words", type=int, default=12, help="Words of the span used as query.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--min-k", type=int, default=1)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[-1.0, 0.3, 0.5])
+    parser.add_argument("--gaps", type=float, nargs="+", default=[0.0, 0.05, 0.1])
+    args = parser.parse_args()
+
+    config = RetrievalConfig()
+    model = build_embedding_model(config)
+    count_tokens, tokenizer = token_counter()
+
+    chunks = load_corpus(args.pdfs, args.chunks)
+    vectors = np.asarray(model.embed_documents(chunks), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    rng = np.random.default_rng(0)
+    sources = rng.choice(len(chunks), size=min(args.queries, len(chunks)), replace=False)
+    queries = []
+    for source in sources:
+        words = chunks[source].split()
+        start = int(rng.integers(0, max(1, len(words) - args.query_words)))
+        queries.append(" ".join(words[start:start + args.query_words]))
+    query_vectors = np.asarray(model.embed_documents(queries), dtype=np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    rankings = []
+    for query_vector in query_vectors:
+        scores = vectors @ query_vector
+        top = np.argsort(-scores)[:args.k]
+        rankings.append([(int(position), float(scores[position])) for position in top])
+
+    print(f"model={config.embedding_model} backend={config.embedding_backend} chunks={len(chunks)} "
+          f"queries={len(queries)} k={args.k} min_k={args.min_k} tokens={tokenizer}")
+    #Fixed top-k, what the agent returned before the cutoff
+    baseline_tokens = sum(count_tokens(chunks[position]) for ranking in rankings for position, _ in ranking)
+    print(f"fixed top-k: {baseline_tokens / len(queries):.1f} tokens per query")
+    print(f"{'threshold':>9} {'gap':>6} {'chunks':>7} {'tokens':>8} {'bytes':>8} {'recall':>7} {'tokens saved':>13}")
+
+    for threshold in args.thresholds:
+        for gap in args.gaps:
+            cutoff = ScoreCutoff(min_k=args.min_k, threshold=threshold, gap=gap)
+            returned = tokens = payload = found = 0
+            for source, ranking in zip(sources, rankings):
+                kept = cutoff.apply(ranking)
+                context = [{"page_content": chunks[position], "metadata": {"score": score}} for position, score in kept]
+                returned += len(kept)
+                tokens += sum(count_tokens(chunks[position]) for position, _ in kept)
+                payload += len(json.dumps(context).encode("utf-8"))
+                found += any(position == source for position, _ in kept)
+            saved = 1 - tokens / baseline_tokens if baseline_tokens else 0.0
+            print(f"{threshold:>9.2f} {gap:>6.2f} {returned / len(queries):>7.2f} {tokens / len(queries):>8.1f} "
+                  f"{payload / len(queries):>8.0f} {found / len(queries):>7.3f} {saved:>12.1%}")
+
+
+if __name__ == "__main__":
+    main()
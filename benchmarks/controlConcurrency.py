@@ -0,0 +1,272 @@
+"""
+Throughput and latency of `/processMessage` in the control agent with many conversations at once, served
+with Flask threads (`serving_mode:prefork`) and with the async server (`serving_mode:async`), in one process.
+
+Three processes, as between the agents:
+    - peers: stubs of RAD agent and of the generation agent that answer with envelopes v2 after
+      `--rad-ms` and `--generation-ms`, the time of the retrieval and of the LLM. They wait on an event
+      loop, so they are never the limit.
+    - control: the ControlAgent of the repository, with its users database, configuration and peer clients,
+      pointed to the stubs. It runs in a temporary folder with its own users.db and configFiles.
+    - clients (this process): `--concurrency` users that send a chat turn, wait for the generation and send
+      the next one, as the view agent does, for `--seconds` per row.
+Latencies are measured by the clients from sending the request to the decrypted generation. The CPU time,
+threads and RSS of the control process are read from /proc while the clients run.
+
+In threads mode the control agent is served by the threaded Werkzeug server of the dev and prefork serving
+modes, which starts a thread per request. `--flask-threads N` serves it with a pool of N threads instead, as a
+production WSGI server does (gunicorn --threads, waitress), where N is the limit of conversations at once.
+
+The user is hashed with `--bcrypt-rounds` (4 by default). Every message verifies the password, and with the
+cost of the agent (12, about 0.3 s of CPU) bcrypt alone would cap both modes at a few messages per second
+per core.
+
+Usage (from the repository root):
+    python benchmarks/controlConcurrency.py --concurrency 10 50 200 500 --seconds 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(ROOT, "controlAgent"))
+
+CONTROL_KEY = "1234567890abcdef1234567890abcdef"
+RAD_KEY = "fedcba0987654321fedcba0987654321"
+GENERATION_KEY = "9f8e7d6c5b4a32109f8e7d6c5b4a3210"
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_for_port(port: int, process, seconds: float = 60):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The server exited with {}".format(process.returncode))
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("The server did not start on port {}".format(port))
+
+
+def run_peers(args):
+    from starlette.applications import Starlette
+    from starlette.responses import Response
+    from starlette.routing import Route
+    from cryptoManager import CryptoManager
+    import uvicorn
+
+    context = [{"page_content": "Texto del manual " * 40, "metadata": {"file": "manual.pdf", "page_number": number,
+                                                                       "score": 0.9 - number * 0.1}}
+               for number in range(5)]
+
+    def envelope(data, key):
+        return Response(CryptoManager.seal(data, key), 200, headers={
+            "Content-Type": CryptoManager.ENVELOPE_CONTENT_TYPE,
+            CryptoManager.ENVELOPE_HEADER: str(CryptoManager.ENVELOPE_VERSION)})
+
+    def load(body, headers, key):
+        if headers.get("content-type", "").startswith(CryptoManager.ENVELOPE_CONTENT_TYPE):
+            return CryptoManager.unseal(body, key)
+        return json.loads(CryptoManager.decrypt_text(json.loads(body)["cipherData"], key))
+
+    async def retrieval(request):
+        load(await request.body(), request.headers, RAD_KEY)
+        await asyncio.sleep(args.rad_ms / 1000)
+        return envelope(context, RAD_KEY)
+
+    async def generation(request):
+        data = load(await request.body(), request.headers, GENERATION_KEY)
+        await asyncio.sleep(args.generation_ms / 1000)
+        return envelope({"generation": "Respuesta a " + data["chat"][-1]["text"]}, GENERATION_KEY)
+
+    app = Starlette(routes=[Route("/getretrievalcontext", retrieval, methods=["POST"]),
+                            Route("/generationwithmessagehistory", generation, methods=["POST"])])
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False, backlog=4096)
+
+
+def run_control(args):
+    #Configuration and users database of the agent, in the temporary folder
+    os.chdir(args.dir)
+    os.makedirs(os.path.join("controlAgent", "configFiles"))
+    peers = "http://127.0.0.1:{}".format(args.peers_port)
+    for name, key, read_timeout in (("radInfo", RAD_KEY, 60), ("generationInfo", GENERATION_KEY, 120)):
+        with open(os.path.join("controlAgent", "configFiles", name + ".txt"), "w") as file:
+            file.write("\n".join([f"ip:{peers}", f"cypherPass:{key}", f"pool_size:{args.pool_size}", "connect_timeout:3",
+                                  f"read_timeout:{read_timeout}", "retries:2", "retry_backoff:0.5",
+                                  f"max_concurrency:{args.max_concurrency}"]))
+
+    import bcrypt
+    from controlAgent import ControlAgent
+    from databaseManager import User
+
+    agent = ControlAgent()
+    User.update(password=bcrypt.hashpw(b"veryDifficultPass", bcrypt.gensalt(args.bcrypt_rounds)).decode()).execute()
+
+    if args.mode == "threads":
+        from concurrent.futures import ThreadPoolExecutor
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", args.port, agent.app, threaded=True)
+        if args.flask_threads:
+            pool = ThreadPoolExecutor(args.flask_threads)
+            server.process_request = lambda request, address: pool.submit(server.process_request_thread, request, address)
+        server.serve_forever()
+    else:
+        from asyncControlServer import AsyncControlServer
+        import uvicorn
+        server = AsyncControlServer(agent)
+        uvicorn.run(server.app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False, backlog=4096)
+
+
+async def load_test(port: int, concurrency: int, seconds: float) -> dict:
+    import httpx
+    from cryptoManager import CryptoManager
+
+    URL = "http://127.0.0.1:{}/processMessage".format(port)
+    headers = {"Content-Type": CryptoManager.ENVELOPE_CONTENT_TYPE,
+               CryptoManager.ENVELOPE_HEADER: str(CryptoManager.ENVELOPE_VERSION)}
+    #One client per user, as every user has its own view agent; building the SSL context of every client is slow
+    ssl_context = ssl.create_default_context()
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def user(number):
+        nonlocal errors
+        turn = 0
+        client = httpx.AsyncClient(timeout=httpx.Timeout(120, connect=30), verify=ssl_context)
+        while time.perf_counter() < deadline:
+            chat = [{"type": "HumanMessage", "text": f"Pregunta {turn} del usuario {number}"}]
+            body = CryptoManager.seal({"user": "al", "pass": "veryDifficultPass", "database": "db1",
+                                       "chat": json.dumps(chat)}, CONTROL_KEY)
+            started = time.perf_counter()
+            try:
+                response = await client.post(URL, content=body, headers=headers)
+                if response.status_code != 200:
+                    raise ValueError(response.status_code)
+                CryptoManager.load_response(response, CONTROL_KEY, field="cipher_response")
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+            turn += 1
+        await client.aclose()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    percentile = lambda share: latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000 if latencies else float("nan")
+    return {"completed": len(latencies), "errors": errors, "throughput": len(latencies) / elapsed,
+            "p50_ms": percentile(0.50), "p99_ms": percentile(0.99)}
+
+
+def read_proc(pid: int) -> dict:
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    with open(f"/proc/{pid}/status") as file:
+        status = dict(line.split(":", 1) for line in file)
+    return {"cpu": (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK"),
+            "threads": int(status["Threads"]), "rss_mb": int(status["VmRSS"].split()[0]) / 1024}
+
+
+async def sample_proc(pid: int, peak: dict):
+    while True:
+        sample = read_proc(pid)
+        peak["threads"] = max(peak.get("threads", 0), sample["threads"])
+        peak["rss_mb"] = max(peak.get("rss_mb", 0), sample["rss_mb"])
+        await asyncio.sleep(0.25)
+
+
+async def measure(pid: int, port: int, concurrency: int, seconds: float) -> dict:
+    peak = {}
+    sampler = asyncio.ensure_future(sample_proc(pid, peak))
+    cpu = read_proc(pid)["cpu"]
+    result = await load_test(port, concurrency, seconds)
+    result["cpu_ms"] = (read_proc(pid)["cpu"] - cpu) * 1000 / max(result["completed"], 1)
+    sampler.cancel()
+    result.update(peak)
+    return result
+
+
+def spawn(role, args, port, **extra):
+    command = [sys.executable, os.path.abspath(__file__), "--role", role, "--port", str(port),
+               "--rad-ms", str(args.rad_ms), "--generation-ms", str(args.generation_ms),
+               "--pool-size", str(args.pool_size), "--max-concurrency", str(args.max_concurrency),
+               "--bcrypt-rounds", str(args.bcrypt_rounds), "--flask-threads", str(args.flask_threads)]
+    for name, value in extra.items():
+        command += ["--" + name.replace("_", "-"), str(value)]
+    return subprocess.Popen(command)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200, 500], help="Users at the same time.")
+    parser.add_argument("--seconds", type=float, default=20, help="Time measured per row.")
+    parser.add_argument("--modes", nargs="+", default=["threads", "async"], choices=["threads", "async"])
+    parser.add_argument("--rad-ms", type=float, default=50, help="Time RAD agent takes to answer.")
+    parser.add_argument("--generation-ms", type=float, default=1000, help="Time the generation agent takes to answer.")
+    parser.add_argument("--pool-size", type=int, default=10, help="pool_size of the peers of the control agent.")
+    parser.add_argument("--max-concurrency", type=int, default=512, help="max_concurrency of the peers in async mode.")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="Cost of the password hash of the user.")
+    parser.add_argument("--flask-threads", type=int, default=0, help="Threads of the Flask server, 0 for one per request.")
+    parser.add_argument("--role", choices=["peers", "control"], help=argparse.SUPPRESS)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--peers-port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == "peers":
+        run_peers(args)
+        return
+    if args.role == "control":
+        run_control(args)
+        return
+
+    peers_port = free_port()
+    peers = spawn("peers", args, peers_port)
+    try:
+        wait_for_port(peers_port, peers)
+        print(f"rad={args.rad_ms:.0f} ms generation={args.generation_ms:.0f} ms pool_size={args.pool_size} "
+              f"max_concurrency={args.max_concurrency} bcrypt_rounds={args.bcrypt_rounds} flask_threads={args.flask_threads}")
+        print(f"{'mode':>8} {'users':>6} {'done':>6} {'errors':>7} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'CPU ms/msg':>11} {'threads':>8} {'RSS MB':>7}")
+        for mode in args.modes:
+            for concurrency in args.concurrency:
+                work = tempfile.mkdtemp(prefix="controlConcurrency-")
+                port = free_port()
+                control = spawn("control", args, port, mode=mode, peers_port=peers_port, dir=work)
+                try:
+                    wait_for_port(port, control)
+                    result = asyncio.run(measure(control.pid, port, concurrency, args.seconds))
+                finally:
+                    control.terminate()
+                    control.wait()
+                    shutil.rmtree(work, ignore_errors=True)
+                print(f"{mode:>8} {concurrency:>6} {result['completed']:>6} {result['errors']:>7} "
+                      f"{result['throughput']:>8.1f} {result['p50_ms']:>8.0f} {result['p99_ms']:>8.0f} "
+                      f"{result['cpu_ms']:>11.1f} {result['threads']:>8} {result['rss_mb']:>7.0f}", flush=True)
+    finally:
+        peers.terminate()
+        peers.wait()
+
+
+if __name__ == "__main__":
+    main()
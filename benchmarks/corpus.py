@@ -0,0 +1,26 @@
+"""
+Reference corpus shared by the benchmarks: the chunks of a folder of PDFs split like the RAD
+agent does, or synthetic Spanish chunks when no folder is given.
+"""
+import os
+
+import numpy as np
+
+
+def load_corpus(pdfs, limit):
+    if not pdfs:
+        words = ("el reglamento establece las condiciones de acceso a la información pública y los plazos "
+                 "de resolución de las solicitudes presentadas ante la administración general del estado").split()
+        rng = np.random.default_rng(0)
+        return [" ".join(rng.choice(words, size=rng.integers(40, 160))) for _ in range(limit)]
+
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100, separators=["\n\n", "\n", ".", " "])
+    chunks = []
+    for file in sorted(os.listdir(pdfs)):
+        for page in PyPDFLoader(os.path.join(pdfs, file)).lazy_load():
+            chunks.extend(splitter.split_text(page.page_content))
+            if len(chunks) >= limit:
+                return chunks[:limit]
+    return chunks
@@ -0,0 +1,81 @@
+"""
+Throughput and accuracy of the RAD agent embedding backends (torch, onnx, onnx-int8).
+
+For every backend it reports:
+    - single-query latency (p50/p95 over repeated `embed_query` calls),
+    - ingestion throughput in chunks/sec (`embed_documents` over a corpus of chunks),
+    - the cosine similarity of its vectors with the torch vectors (mean and minimum), which tells
+      whether databases built with one backend can be queried with another.
+
+The corpus is made of the chunks of the PDFs in --pdfs, split like the RAD agent does, or of
+synthetic sentences when no folder is given. Run it from the repository root:
+    python benchmarks/embeddingBackendComparison.py --pdfs path/to/pdfs --chunks 1000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RADAgent"))
+
+from configClasses.retrievalConfig import RetrievalConfig
+from embeddingBackends import BACKENDS, build_embedding_model
+from corpus import load_corpus
+
+
+def cosine(a, b):
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", help="Folder with reference PDFs.")
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.pdfs, args.chunks)
+    queries = ["¿Cuál es el plazo para resolver una solicitud?", "What are the access conditions?"] * (args.queries // 2)
+    config = RetrievalConfig()
+    reference = None
+
+    print(f"chunks={len(corpus)} queries={len(queries)}")
+    print(f"{'backend':<10} {'load s':>7} {'query p50 ms':>13} {'query p95 ms':>13} {'chunks/s':>9} {'cos mean':>9} {'cos min':>8}")
+    for backend in args.backends:
+        config.embedding_backend = backend
+        start = time.perf_counter()
+        model = build_embedding_model(config)
+        load_seconds = time.perf_counter() - start
+
+        model.embed_query("warm up")
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            model.embed_query(query)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+
+        start = time.perf_counter()
+        vectors = model.embed_documents(corpus)
+        throughput = len(corpus) / (time.perf_counter() - start)
+
+        if reference is None and backend == "torch":
+            reference = vectors
+        if reference is not None:
+            similarity = cosine(reference, vectors)
+            agreement = f"{similarity.mean():>9.4f} {similarity.min():>8.4f}"
+        else:
+            agreement = f"{'-':>9} {'-':>8}"
+
+        print(f"{backend:<10} {load_seconds:>7.1f} {1000 * statistics.median(latencies):>13.2f} "
+              f"{1000 * latencies[int(0.95 * (len(latencies) - 1))]:>13.2f} {throughput:>9.1f} {agreement}")
+
+
+if __name__ == "__main__":
+    main()
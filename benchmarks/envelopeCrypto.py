@@ -0,0 +1,98 @@
+"""
+Encrypt and decrypt throughput and payload size of the messages between the agents, with the JSON
+format (`CryptoManager.encrypt_text` of the JSON, base64 in `cipherData`) and with envelopes v2
+(`CryptoManager.seal`, AES-GCM over orjson), with and without compression.
+
+The messages are the typical ones of a chat turn:
+    - chat: the request of the view agent, with the credentials and the chat history.
+    - context: the response of RAD agent, with `--chunks` chunks of the corpus and their metadata.
+    - generation: the response of the generation agent.
+Encrypting includes the serialization of the data and of the HTTP body, decrypting the reverse. The
+relay row is what the control agent does with the generation to change its key: decrypting and
+encrypting it again with the JSON format, `CryptoManager.rewrap` with envelopes.
+
+Usage (from the repository root):
+    python benchmarks/envelopeCrypto.py --pdfs path/to/pdfs --chunks 5 --history 10
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RADAgent"))
+
+from cryptoManager import CryptoManager
+from corpus import load_corpus
+
+KEY = "fedcba0987654321fedcba0987654321"
+OTHER_KEY = "1234567890abcdef1234567890abcdef"
+
+
+def timed(function, seconds: float) -> float:
+    #Microseconds per call, repeating the call for about `seconds`
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return elapsed / calls * 1e6
+
+
+def json_format(data):
+    encrypt = lambda: json.dumps({"cipherData": CryptoManager.encrypt_text(json.dumps(data), KEY)}).encode()
+    body = encrypt()
+    decrypt = lambda: json.loads(CryptoManager.decrypt_text(json.loads(body)["cipherData"], KEY))
+    relay = lambda: json.dumps({"cipherData": CryptoManager.encrypt_text(
+        CryptoManager.decrypt_text(json.loads(body)["cipherData"], KEY), OTHER_KEY)}).encode()
+    return body, encrypt, decrypt, relay
+
+
+def envelope_format(data, compress):
+    encrypt = lambda: CryptoManager.seal(data, KEY, compress=compress)
+    body = encrypt()
+    decrypt = lambda: CryptoManager.unseal(body, KEY)
+    relay = lambda: CryptoManager.rewrap(body, KEY, OTHER_KEY)
+    return body, encrypt, decrypt, relay
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", help="Folder with reference PDFs.")
+    parser.add_argument("--chunks", type=int, default=5, help="Chunks of the context.")
+    parser.add_argument("--history", type=int, default=10, help="Messages of the chat history.")
+    parser.add_argument("--seconds", type=float, default=0.5, help="Time measured per row.")
+    args = parser.parse_args()
+
+    chunks = load_corpus(args.pdfs, args.chunks + args.history + 1)
+    context = [{"page_content": chunk, "metadata": {"database_id": "6f1c2e0a-8d4b-4c9e-9a57-3b2f1d0e4c6a", "file": "manual.pdf",
+                                                    "page_number": number, "score": 0.8 - number * 0.05}}
+               for number, chunk in enumerate(chunks[:args.chunks])]
+    history = [{"type": "HumanMessage" if number % 2 == 0 else "AIMessage", "text": chunk[:400]}
+               for number, chunk in enumerate(chunks[args.chunks:args.chunks + args.history])]
+    messages = {
+        "chat": {"user": "al", "pass": "veryDifficultPass", "database": "db1", "chat": json.dumps(history)},
+        "context": context,
+        "generation": {"generation": chunks[-1]},
+    }
+
+    formats = [("json", json_format), ("envelope", lambda data: envelope_format(data, False)),
+               ("envelope+zlib", lambda data: envelope_format(data, True))]
+
+    print(f"{'message':>10} {'format':>14} {'plain B':>8} {'wire B':>8} {'encrypt us':>11} {'decrypt us':>11} "
+          f"{'relay us':>9} {'encrypt MB/s':>13} {'decrypt MB/s':>13}")
+    for name, data in messages.items():
+        plain = len(json.dumps(data).encode())
+        for format_name, build in formats:
+            body, encrypt, decrypt, relay = build(data)
+            encrypt_us = timed(encrypt, args.seconds)
+            decrypt_us = timed(decrypt, args.seconds)
+            relay_us = timed(relay, args.seconds)
+            print(f"{name:>10} {format_name:>14} {plain:>8} {len(body):>8} {encrypt_us:>11.1f} {decrypt_us:>11.1f} "
+                  f"{relay_us:>9.1f} {plain / encrypt_us:>13.1f} {plain / decrypt_us:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Peak memory of database creation as the corpus grows.
+
+Every scale runs in a fresh process: it writes a synthetic corpus of PDFs, creates a database
+from it with `DatabasesManager.create_database` and samples the resident set size (VmRSS) of
+the process while the ingestion runs.
+
+Chroma keeps the HNSW index of a collection, with every vector, in memory while it is written,
+so part of the growth is the collection itself (reported as "hnsw MB", estimated as
+chunks x dimension x 4 bytes). The rest is the memory of the ingestion pipeline; with the
+streaming pipeline it depends on the batch size and stays nearly flat while the corpus grows
+many times larger than the batch.
+
+--hash-embeddings replaces the model with a cheap hashing embedding so the figures show the
+memory of the pipeline alone and the run takes seconds instead of minutes.
+
+Run it from the repository root:
+    python benchmarks/ingestionMemory.py --pages 200 --scales 1 4 16 --hash-embeddings
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPOSITORY, "RADAgent"))
+
+
+def write_pdf(path, pages):
+    """Writes a minimal PDF with one text stream per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = " ".join("(%s) '" % line for line in text.split("\n"))
+        stream = ("BT /F1 9 Tf 30 810 Td 11 TL %s ET" % lines).encode("latin-1")
+        page_number = len(objects) + 1
+        kids.append("%d 0 R" % page_number)
+        objects.append(("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+                        "/Resources << /Font << /F1 3 0 R >> >> >>" % (page_number + 1)).encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[1] = ("<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(kids), len(pages))).encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer << /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as file:
+        file.write(output)
+
+
+def write_corpus(folder, pages, pages_per_file=50):
+    words = ("reglamento condiciones acceso informacion publica plazos resolucion solicitudes "
+             "administracion estado articulo disposicion procedimiento recurso organo").split()
+    page_texts = []
+    for page in range(pages):
+        lines = [" ".join(words[(page + line + word) % len(words)] for word in range(12)) for line in range(60)]
+        page_texts.append("\n".join(lines))
+        if len(page_texts) == pages_per_file:
+            write_pdf(os.path.join(folder, "corpus_%05d.pdf" % page), page_texts)
+            page_texts = []
+    if page_texts:
+        write_pdf(os.path.join(folder, "corpus_last.pdf"), page_texts)
+
+
+def read_rss():
+    with open("/proc/self/status", "r") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class HashEmbeddings:
+    """Bag of hashed words, 768 dimensions, no model."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = [0.0] * 768
+        for word in text.split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 768] += 1.0
+        return vector
+
+
+def child(pages, hash_embeddings):
+    work = tempfile.mkdtemp()
+    os.makedirs(os.path.join(work, "RADAgent", "databases"))
+    corpus = os.path.join(work, "corpus")
+    os.makedirs(corpus)
+    write_corpus(corpus, pages)
+    os.chdir(work)
+
+    import databasesManager
+    if hash_embeddings:
+        databasesManager.build_embedding_model = lambda config, preload_for_fork=False: HashEmbeddings()
+    manager = databasesManager.DatabasesManager()
+    manager.embedding_model.embed_documents(["warm up"])
+
+    baseline = read_rss()
+    samples = []
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            samples.append(read_rss())
+            time.sleep(0.02)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    manager.status_database.add_entry(database_id="benchmark")
+    start = time.perf_counter()
+    manager.create_database(corpus, "benchmark")
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+
+    history = manager.get_ingestion_stats()
+    print(json.dumps({
+        "dimension": len(manager.embedding_model.embed_query("dimension")),
+        "pages": pages,
+        "chunks": history[-1]["chunks"] if history else 0,
+        "batch_size": manager.config.ingest_batch_size,
+        "seconds": elapsed,
+        "baseline_rss": baseline,
+        "peak_rss": max(samples or [baseline]),
+        "status": manager.status_database.get_database_status(database_id="benchmark"),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="Pages of the smallest corpus.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--hash-embeddings", action="store_true")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child, args.hash_embeddings)
+        return
+
+    print(f"{'pages':>7} {'chunks':>8} {'batch':>6} {'seconds':>8} {'baseline MB':>12} {'peak MB':>8} "
+          f"{'growth MB':>10} {'hnsw MB':>8} {'pipeline MB':>12}")
+    for scale in args.scales:
+        command = [sys.executable, os.path.abspath(__file__), "--child", str(args.pages * scale)]
+        if args.hash_embeddings:
+            command.append("--hash-embeddings")
+        output = subprocess.run(command, capture_output=True, text=True, check=True, cwd=REPOSITORY).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if result["status"] != "ready":
+            print(f"{result['pages']:>7} ingestion ended with status {result['status']}")
+            continue
+        growth = (result["peak_rss"] - result["baseline_rss"]) / 2**20
+        hnsw = result["chunks"] * result["dimension"] * 4 / 2**20
+        print(f"{result['pages']:>7} {result['chunks']:>8} {result['batch_size']:>6} {result['seconds']:>8.1f} "
+              f"{result['baseline_rss'] / 2**20:>12.1f} {result['peak_rss'] / 2**20:>8.1f} {growth:>10.1f} "
+              f"{hnsw:>8.1f} {growth - hnsw:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Embedding throughput of database creation, in chunks/sec, for several pool configurations.
+
+The baseline embeds the whole corpus with one `embed_documents` call, which is what
+`Chroma.from_documents` used to do. Every other row runs the batches through the `EmbeddingPool`
+used by `DatabasesManager._ingest_documents` with the given executor, number of workers and batch
+size, keeping the same number of batches in flight as the ingestion does.
+
+The corpus is made of the chunks of the PDFs in --pdfs (the reference corpus), or of synthetic
+chunks when no folder is given. Run it from the repository root:
+    python benchmarks/ingestionThroughput.py --pdfs path/to/pdfs --workers 1 2 4 --batch-sizes 32 64
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RADAgent"))
+
+from configClasses.retrievalConfig import RetrievalConfig
+from embeddingBackends import build_embedding_model
+from embeddingPool import EmbeddingPool
+from corpus import load_corpus
+
+
+def run_pool(config, model, corpus):
+    pool = EmbeddingPool(config, model)
+    #Pay the start up of the workers (model load in process mode) outside the measure
+    pool.submit(corpus[:1]).result()
+
+    start = time.perf_counter()
+    pending = deque()
+    for offset in range(0, len(corpus), pool.batch_size):
+        pending.append(pool.submit(corpus[offset:offset + pool.batch_size]))
+        while len(pending) >= pool.max_in_flight():
+            pending.popleft().result()
+    while pending:
+        pending.popleft().result()
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return len(corpus) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", help="Folder with the reference PDFs.")
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--executors", nargs="+", default=list(EmbeddingPool.EXECUTORS), choices=EmbeddingPool.EXECUTORS)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 64])
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.pdfs, args.chunks)
+    config = RetrievalConfig()
+    model = build_embedding_model(config)
+    model.embed_documents(corpus[:8])
+
+    start = time.perf_counter()
+    model.embed_documents(corpus)
+    baseline = len(corpus) / (time.perf_counter() - start)
+
+    print(f"backend={config.embedding_backend} chunks={len(corpus)} cpus={os.cpu_count()}")
+    print(f"{'executor':<10} {'workers':>7} {'batch':>6} {'chunks/s':>9} {'speedup':>8}")
+    print(f"{'baseline':<10} {1:>7} {'all':>6} {baseline:>9.1f} {1.0:>7.2f}x")
+    for executor, workers, batch_size in itertools.product(args.executors, args.workers, args.batch_sizes):
+        config.ingest_executor = executor
+        config.ingest_workers = workers
+        config.ingest_batch_size = batch_size
+        throughput = run_pool(config, model, corpus)
+        print(f"{executor:<10} {workers:>7} {batch_size:>6} {throughput:>9.1f} {throughput / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
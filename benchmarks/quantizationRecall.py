@@ -0,0 +1,79 @@
+"""
+Recall@k of the quantized vector stores against the exact float search.
+
+The float vectors are taken from the `quantized_index/vectors.f32` file of an existing database
+(any database built with a quantization) or generated at random. For every quantization an index
+is built in a temporary directory, queried with perturbed copies of stored vectors, and compared
+with the exact cosine top-k. Memory figures come from the same `get_stats` the RAD agent reports.
+
+Usage (from the repository root):
+    python benchmarks/quantizationRecall.py --database RADAgent/databases/<database_id>
+    python benchmarks/quantizationRecall.py --synthetic 20000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RADAgent"))
+
+from quantizedStore import QuantizedStore, QuantizedStoreBuilder
+
+
+def load_vectors(database_path):
+    path = os.path.join(database_path, QuantizedStore.DIRECTORY)
+    with open(os.path.join(path, "store.json"), "r", encoding="utf-8") as file:
+        info = json.load(file)
+    return np.fromfile(os.path.join(path, "vectors.f32"), dtype=np.float32).reshape(len(info["ids"]), info["dimension"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", help="Database directory with a quantized_index to read the float vectors from.")
+    parser.add_argument("--synthetic", type=int, default=10000, help="Number of random 768-d vectors when no database is given.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[20, 50, 100])
+    parser.add_argument("--noise", type=float, default=0.5, help="Relative noise added to the stored vectors to build queries.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.database:
+        vectors = load_vectors(args.database)
+    else:
+        vectors = rng.normal(size=(args.synthetic, 768)).astype(np.float32)
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + args.noise * rng.normal(size=(len(picks), vectors.shape[1])).astype(np.float32) / np.sqrt(vectors.shape[1])
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = [set(np.argsort(-(vectors @ query))[:args.k].tolist()) for query in queries]
+
+    print(f"vectors={len(vectors)} dimension={vectors.shape[1]} queries={len(queries)} k={args.k}")
+    print(f"{'quantization':<12} {'candidates':>10} {'recall@k':>9} {'ms/query':>9} {'resident':>12} {'float':>12} {'reduction':>9}")
+    for quantization in QuantizedStore.QUANTIZATIONS:
+        with tempfile.TemporaryDirectory() as directory:
+            builder = QuantizedStoreBuilder(directory, quantization)
+            builder.add([str(position) for position in range(len(vectors))], vectors)
+            builder.finalize()
+            store = QuantizedStore.load(directory)
+            stats = store.get_stats()
+
+            for candidates in args.candidates:
+                hits = 0
+                start = time.perf_counter()
+                for query, expected in zip(queries, truth):
+                    found = {int(chunk_id) for chunk_id, _ in store.search(query, args.k, candidates)}
+                    hits += len(found & expected)
+                elapsed = time.perf_counter() - start
+                print(f"{quantization:<12} {candidates:>10} {hits / (len(queries) * args.k):>9.3f} "
+                      f"{1000 * elapsed / len(queries):>9.2f} {stats['resident_bytes']:>12} {stats['float_bytes']:>12} {stats['reduction']:>8.1f}x")
+            del store
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Cold start, memory per process and requests per second of every agent with the serving modes of
+`configFiles/serverInfo.txt`:
+    - dev: `app.run(debug=True)`, the Werkzeug development server with the reloader, which builds the
+      agent in its watcher process and again in the serving process.
+    - prefork: `PreforkServer` with `--workers` worker processes forked after the agent is built, so they
+      share its memory (the embedding model of RAD agent) copy-on-write.
+    - async: the async server of the control agent, in `--workers` worker processes.
+
+Every agent runs from a temporary folder with a copy of its configFiles, so its settings and keys apply,
+and is asked what it does without the other agents and the LLM:
+    - view: GET / (the chat page).
+    - control: GET /getMetrics.
+    - rad: POST /getretrievalcontext cycling through 512 synthetic questions, on a database created first
+      from --pdfs or from a PDF of synthetic chunks. The query embedding and result caches are disabled, so every
+      request runs the embedding model and searches the collection.
+    - generation: POST /generationwithmessagehistory without fields, decrypted and answered 400.
+The model is the one of retrievalInfo.txt and is loaded as the agent does.
+
+Cold start is the time from starting the agent to its first HTTP answer. Rss, Pss and Uss (private memory)
+are read from /proc/<pid>/smaps_rollup of the server processes (the watcher and the server in dev mode,
+the parent and the workers with prefork) after the load; helper processes of the workers are left out. Pss
+splits the shared pages between the processes that map them, so its total is the memory of the agent.
+
+Usage (from the repository root):
+    python benchmarks/servingWorkers.py --agents rad control --workers 1 2 4 --concurrency 16 --seconds 20
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(ROOT, "RADAgent"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cryptoManager import CryptoManager
+from corpus import load_corpus
+
+AGENTS = {
+    "view": ("viewAgent", "viewAgent", "ViewAgent"),
+    "control": ("controlAgent", "controlAgent", "ControlAgent"),
+    "rad": ("RADAgent", "retrievalAndDatabaseAgent", "RetrievalAndDatabaseAgent"),
+    "generation": ("generationAgent", "generationAgent", "GenerationAgent"),
+}
+RAD_KEY = "fedcba0987654321fedcba0987654321"
+GENERATION_KEY = "9f8e7d6c5b4a32109f8e7d6c5b4a3210"
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def synthetic_pdf(pages: list) -> bytes:
+    #A PDF with one page of Helvetica text per item, enough for the parser of RAD agent
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               "<< /Type /Pages /Kids [{}] /Count {} >>".format(" ".join(f"{4 + 2 * number} 0 R" for number in range(len(pages))), len(pages)),
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for number, text in enumerate(pages):
+        words = text.replace("(", "").replace(")", "").split()
+        lines = [" ".join(words[start:start + 12]) for start in range(0, len(words), 12)]
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {5 + 2 * number} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    pdf += f"trailer << /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+
+def run_agent(args):
+    os.chdir(args.dir)
+    folder, module, name = AGENTS[args.role]
+    sys.path.insert(0, os.path.join(ROOT, folder))
+    agent = getattr(importlib.import_module(module), name)()
+    agent.run()
+
+
+def prepare(agent: str, mode: str, workers: int, port: int, work: str):
+    folder = AGENTS[agent][0]
+    config_dir = os.path.join(work, folder, "configFiles")
+    shutil.copytree(os.path.join(ROOT, folder, "configFiles"), config_dir)
+    with open(os.path.join(config_dir, "serverInfo.txt"), "w") as file:
+        file.write(f"serving_mode:{mode}\nhost:127.0.0.1\nport:{port}\nworkers:{workers}\naccess_log:false\n")
+
+    if agent == "rad":
+        with open(os.path.join(config_dir, "retrievalInfo.txt")) as file:
+            lines = file.read().rstrip("\n").split("\n")
+        lines += ["query_embedding_cache_size:0", "result_cache_entries:0"]
+        with open(os.path.join(config_dir, "retrievalInfo.txt"), "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.makedirs(os.path.join(work, folder, "databases"))
+        #The exported ONNX models, so they are not exported again
+        if os.path.isdir(os.path.join(ROOT, folder, "models")):
+            os.symlink(os.path.join(ROOT, folder, "models"), os.path.join(work, folder, "models"))
+
+
+def wait_for_answer(port: int, process, seconds: float) -> float:
+    import requests
+
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        if process.poll() is not None:
+            raise RuntimeError("The agent exited with {}".format(process.returncode))
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=5)
+            return time.perf_counter() - started
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    raise RuntimeError("The agent did not answer on port {}".format(port))
+
+
+def create_database(port: int, pdfs, seconds: float) -> str:
+    import requests
+
+    if pdfs:
+        files = []
+        for name in sorted(name for name in os.listdir(pdfs) if name.lower().endswith(".pdf")):
+            with open(os.path.join(pdfs, name), "rb") as pdf_file:
+                files.append({"title": name, "content": pdf_file.read().hex()})
+    else:
+        files = [{"title": "synthetic.pdf", "content": synthetic_pdf(load_corpus(None, 40)).hex()}]
+
+    URL = f"http://127.0.0.1:{port}"
+    response = requests.post(URL + "/createvectordatabase", json={"cipherData": CryptoManager.encrypt_text(json.dumps({"files": files}), RAD_KEY)})
+    database_id = json.loads(CryptoManager.decrypt_text(response.json()["cipherData"], RAD_KEY))["database_id"]
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        body = {"cipherData": CryptoManager.encrypt_text(json.dumps({"database_id": database_id}), RAD_KEY)}
+        status = json.loads(CryptoManager.decrypt_text(requests.post(URL + "/getdatabasestatus", json=body).json()["cipherData"], RAD_KEY))
+        if status["status"] == "ready":
+            return database_id
+        if status["status"] == "error":
+            raise RuntimeError("The database could not be created")
+        time.sleep(0.5)
+    raise RuntimeError("The database was not ready in {} seconds".format(seconds))
+
+
+def requests_of(agent: str, database_id: str) -> list:
+    #(method, path, JSON body) of the requests, used in turns
+    if agent == "view":
+        return [("GET", "/", None)]
+    if agent == "control":
+        return [("GET", "/getMetrics", None)]
+    if agent == "generation":
+        return [("POST", "/generationwithmessagehistory", {"cipherData": CryptoManager.encrypt_text(json.dumps({}), GENERATION_KEY)})]
+    questions = load_corpus(None, 512)
+    return [("POST", "/getretrievalcontext",
+             {"cipherData": CryptoManager.encrypt_text(json.dumps({"last_message": " ".join(question.split()[:12]), "database": database_id}), RAD_KEY)})
+            for question in questions]
+
+
+async def load_test(port: int, calls: list, expected: int, concurrency: int, seconds: float) -> dict:
+    import httpx
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def user(number):
+        nonlocal errors
+        turn = number
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+            while time.perf_counter() < deadline:
+                method, path, body = calls[turn % len(calls)]
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    if response.status_code != expected:
+                        raise ValueError(response.status_code)
+                    latencies.append(time.perf_counter() - started)
+                except Exception:
+                    errors += 1
+                turn += concurrency
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    percentile = lambda share: latencies[min(len(latencies) - 1, int(len(latencies) * share))] * 1000 if latencies else float("nan")
+    return {"completed": len(latencies), "errors": errors, "throughput": len(latencies) / elapsed,
+            "p50_ms": percentile(0.50), "p99_ms": percentile(0.99)}
+
+
+def server_processes(pid: int) -> list:
+    #The process started and its children: the workers, or the server of the reloader
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as file:
+            children += [int(child) for child in file.read().split()]
+    return [pid] + children
+
+
+def memory_mb(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return {"rss": values["Rss"], "pss": values["Pss"], "uss": values["Private_Clean"] + values["Private_Dirty"]}
+
+
+def stop(process, signum: int):
+    try:
+        os.killpg(process.pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+def measure(agent: str, mode: str, workers: int, args) -> dict:
+    work = tempfile.mkdtemp(prefix="servingWorkers-")
+    port = free_port()
+    prepare(agent, mode, workers, port, work)
+    log = open(os.path.join(work, "agent.log"), "w")
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--role", agent, "--dir", work],
+                               stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    try:
+        cold_start = wait_for_answer(port, process, args.start_timeout)
+        database_id = create_database(port, args.pdfs, args.start_timeout) if agent == "rad" else None
+        expected = 400 if agent == "generation" else 200
+        result = asyncio.run(load_test(port, requests_of(agent, database_id), expected, args.concurrency, args.seconds))
+        memory = [memory_mb(pid) for pid in server_processes(process.pid)]
+    except Exception:
+        log.flush()
+        with open(os.path.join(work, "agent.log")) as file:
+            print(file.read()[-3000:], file=sys.stderr)
+        raise
+    finally:
+        #The whole session, with the server of the reloader in dev mode
+        stop(process, signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            stop(process, signal.SIGKILL)
+            process.wait()
+        log.close()
+        shutil.rmtree(work, ignore_errors=True)
+
+    serving = memory[1:] or memory
+    result.update({
+        "cold_start": cold_start,
+        "processes": len(memory),
+        "rss_mb": max(entry["rss"] for entry in serving),
+        "uss_mb": sum(entry["uss"] for entry in serving) / len(serving),
+        "pss_mb": sum(entry["pss"] for entry in memory),
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", nargs="+", default=list(AGENTS), choices=list(AGENTS))
+    parser.add_argument("--modes", nargs="+", default=["dev", "prefork", "async"], choices=["dev", "prefork", "async"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker processes of prefork and async.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests at the same time.")
+    parser.add_argument("--seconds", type=float, default=20, help="Time measured per row.")
+    parser.add_argument("--pdfs", help="Folder with the PDFs of the RAD agent database.")
+    parser.add_argument("--start-timeout", type=float, default=600, help="Seconds to wait for an agent to start.")
+    parser.add_argument("--role", choices=list(AGENTS), help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role:
+        run_agent(args)
+        return
+
+    print(f"cpus={os.cpu_count()} concurrency={args.concurrency} seconds={args.seconds}")
+    print(f"{'agent':>10} {'mode':>8} {'workers':>8} {'start s':>8} {'procs':>6} {'RSS MB':>7} {'USS MB':>7} "
+          f"{'PSS MB':>7} {'req/s':>8} {'p50 ms':>7} {'p99 ms':>7} {'errors':>7}")
+    for agent in args.agents:
+        rows = [("dev", 1)] if "dev" in args.modes else []
+        rows += [(mode, workers) for mode in ("prefork", "async") if mode in args.modes for workers in args.workers
+                 if mode == "prefork" or agent == "control"]
+        for mode, workers in rows:
+            #The chats of the view agent are kept in the memory of its only process
+            if agent == "view" and workers > 1:
+                continue
+            result = measure(agent, mode, workers, args)
+            print(f"{agent:>10} {mode:>8} {workers:>8} {result['cold_start']:>8.2f} {result['processes']:>6} "
+                  f"{result['rss_mb']:>7.0f} {result['uss_mb']:>7.0f} {result['pss_mb']:>7.0f} {result['throughput']:>8.1f} "
+                  f"{result['p50_ms']:>7.1f} {result['p99_ms']:>7.1f} {result['errors']:>7}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
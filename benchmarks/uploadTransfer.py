@@ -0,0 +1,221 @@
+"""
+Peak memory and transfer time of every hop of a PDF upload, with the files as hex in encrypted JSON
+and with the binary stream.
+
+The upload goes through three processes, as between the agents: the view agent sends the files, the
+control agent receives them and sends them to RAD agent, and RAD agent writes them to disk.
+    - json: the files as hex in the JSON encrypted with `CryptoManager.encrypt_text`, saved to disk and
+      read again by the control agent (`/createNewDatabase` and `/createvectordatabase`).
+    - stream: the files as records of `CryptoManager.encrypt_stream`, relayed by the control agent
+      frame by frame (`/createNewDatabaseStream` and `/createvectordatabasestream`).
+Every process imports the CryptoManager and Utils of its agent, serves one request with Werkzeug and
+reports its peak RSS above the RSS it had once started. The time of a hop is measured by its sender
+up to the response, so the time of view -> control includes control -> RAD (with the stream both hops
+overlap). The files written by RAD agent are checked against the sent ones.
+
+Files are random bytes named .pdf unless a folder of PDFs is given.
+
+Usage (from the repository root):
+    python benchmarks/uploadTransfer.py --files 4 --size-mb 25
+    python benchmarks/uploadTransfer.py --pdfs path/to/pdfs --modes stream
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+AGENTS = {"view": "viewAgent", "control": "controlAgent", "rad": "RADAgent"}
+KEY = "uploadTransfer benchmark key"
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def file_hashes(paths) -> dict:
+    hashes = {}
+    for path in paths:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        hashes[os.path.basename(path)] = digest.hexdigest()
+    return hashes
+
+
+def read_hex_files(folder) -> list:
+    #What the view and control agents send with the JSON path
+    files = []
+    for name in sorted(name for name in os.listdir(folder) if name.lower().endswith(".pdf")):
+        with open(os.path.join(folder, name), "rb") as pdf_file:
+            files.append({"title": name, "content": pdf_file.read().hex()})
+    return files
+
+
+def run_role(args):
+    sys.path.insert(0, os.path.join(ROOT, AGENTS[args.role]))
+    from flask import Flask, request, jsonify
+    from werkzeug.serving import make_server
+    import requests
+    from cryptoManager import CryptoManager
+    from utils import Utils
+
+    utils = Utils()
+    result = {"role": args.role}
+    baseline = peak_rss_mb()
+
+    def send(url, started, **kwargs):
+        response = requests.post(url, **kwargs)
+        result["hop_seconds"] = time.perf_counter() - started
+        return response
+
+    if args.role == "view":
+        started = time.perf_counter()
+        paths = [os.path.join(args.dir, name) for name in sorted(os.listdir(args.dir)) if name.lower().endswith(".pdf")]
+        if args.mode == "json":
+            data = {"user": "user", "pass": "pass", "database": "db1", "files": read_hex_files(args.dir)}
+            cipherData = CryptoManager.encrypt_text(json.dumps(data), KEY)
+            response = send(args.next, started, json={"cipherData": cipherData})
+        else:
+            frames = utils.pdf_stream_frames({"user": "user", "pass": "pass", "database": "db1"}, paths, args.chunk_size)
+            response = send(args.next, started, data=CryptoManager.encrypt_stream(frames, KEY),
+                            headers={"Content-Type": "application/octet-stream"})
+        result["status"] = response.status_code
+        result["peak_rss_mb"] = peak_rss_mb() - baseline
+        print(json.dumps(result), flush=True)
+        return
+
+    app = Flask(__name__)
+
+    @app.route("/upload", methods=["POST"])
+    def upload():
+        started = time.perf_counter()
+        if args.role == "control":
+            if args.mode == "json":
+                data = json.loads(CryptoManager.decrypt_text(request.get_json()["cipherData"], KEY))
+                utils.save_pdfs(container=args.dir, files=data["files"])
+                data = {"files": read_hex_files(args.dir), "user": data["user"], "priority": 0}
+                cipherData = CryptoManager.encrypt_text(json.dumps(data), KEY)
+                response = send(args.next, started, json={"cipherData": cipherData})
+            else:
+                frames = CryptoManager.decrypt_stream(request.stream, KEY)
+                _, payload = next(frames)
+                relay = utils.relay_pdf_frames({"user": json.loads(payload)["user"], "priority": 0}, frames)
+                response = send(args.next, started, data=CryptoManager.encrypt_stream(relay, KEY),
+                                headers={"Content-Type": "application/octet-stream"})
+            return jsonify({"status": response.status_code}), response.status_code
+
+        if args.mode == "json":
+            data = json.loads(CryptoManager.decrypt_text(request.get_json()["cipherData"], KEY))
+            utils.save_pdfs(container=args.dir, files=data["files"])
+        else:
+            frames = CryptoManager.decrypt_stream(request.stream, KEY)
+            next(frames)
+            utils.save_pdf_frames(container=args.dir, frames=frames)
+        result["hop_seconds"] = time.perf_counter() - started
+        result["files"] = file_hashes(os.path.join(args.dir, name) for name in os.listdir(args.dir))
+        return jsonify({"OK": "OK"}), 200
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", args.port, app)
+    print("ready", flush=True)
+    server.handle_request()
+    result["peak_rss_mb"] = peak_rss_mb() - baseline
+    print(json.dumps(result), flush=True)
+
+
+def spawn(role, mode, directory, chunk_size, port=0, next_url=""):
+    command = [sys.executable, os.path.abspath(__file__), "--role", role, "--mode", mode, "--dir", directory,
+               "--port", str(port), "--next", next_url, "--chunk-size", str(chunk_size)]
+    return subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+
+
+def run_mode(mode, source, chunk_size) -> dict:
+    work = tempfile.mkdtemp(prefix="uploadTransfer-")
+    try:
+        rad_dir = os.path.join(work, "rad")
+        control_dir = os.path.join(work, "control")
+        os.makedirs(rad_dir)
+        os.makedirs(control_dir)
+
+        rad_port = free_port()
+        rad = spawn("rad", mode, rad_dir, chunk_size, rad_port)
+        assert rad.stdout.readline().strip() == "ready"
+        control_port = free_port()
+        control = spawn("control", mode, control_dir, chunk_size, control_port, f"http://127.0.0.1:{rad_port}/upload")
+        assert control.stdout.readline().strip() == "ready"
+
+        started = time.perf_counter()
+        view = spawn("view", mode, source, chunk_size, next_url=f"http://127.0.0.1:{control_port}/upload")
+        results = {}
+        for process in (view, control, rad):
+            output, _ = process.communicate()
+            result = json.loads(output.strip().splitlines()[-1])
+            results[result["role"]] = result
+        results["total_seconds"] = time.perf_counter() - started
+        return results
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", help="Folder with the PDFs to upload.")
+    parser.add_argument("--files", type=int, default=4, help="Random files to upload without --pdfs.")
+    parser.add_argument("--size-mb", type=float, default=25, help="Size of every random file.")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024, help="Bytes of file per stream record.")
+    parser.add_argument("--modes", nargs="+", default=["json", "stream"], choices=["json", "stream"])
+    parser.add_argument("--role", choices=list(AGENTS), help=argparse.SUPPRESS)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--next", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role:
+        run_role(args)
+        return
+
+    source = args.pdfs
+    generated = None
+    if source is None:
+        generated = source = tempfile.mkdtemp(prefix="uploadTransfer-pdfs-")
+        for number in range(args.files):
+            with open(os.path.join(source, f"file{number}.pdf"), "wb") as file:
+                file.write(os.urandom(int(args.size_mb * 1024 * 1024)))
+
+    try:
+        paths = [os.path.join(source, name) for name in sorted(os.listdir(source)) if name.lower().endswith(".pdf")]
+        expected = file_hashes(paths)
+        total_mb = sum(os.path.getsize(path) for path in paths) / (1024 * 1024)
+        print(f"files={len(paths)} size={total_mb:.1f} MB chunk_size={args.chunk_size}")
+        print(f"{'mode':>6} {'view MB':>8} {'control MB':>11} {'RAD MB':>7} {'view->control s':>16} "
+              f"{'control->RAD s':>15} {'RAD write s':>12} {'total s':>8} {'intact':>7}")
+        for mode in args.modes:
+            results = run_mode(mode, source, args.chunk_size)
+            view, control, rad = results["view"], results["control"], results["rad"]
+            print(f"{mode:>6} {view['peak_rss_mb']:>8.1f} {control['peak_rss_mb']:>11.1f} {rad['peak_rss_mb']:>7.1f} "
+                  f"{view['hop_seconds']:>16.2f} {control['hop_seconds']:>15.2f} {rad['hop_seconds']:>12.2f} "
+                  f"{results['total_seconds']:>8.2f} {str(rad['files'] == expected):>7}")
+    finally:
+        if generated:
+            shutil.rmtree(generated, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route, Mount
+from uvicorn.middleware.wsgi import WSGIMiddleware
+from cryptoManager import CryptoManager
+from asyncPeerClient import AsyncPeerClient
+from preforkServer import PreforkServer
+import contextlib
+import asyncio
+import json
+
+
+class AsyncControlServer:
+    """
+        Async serving mode of the control agent (`serving_mode:async` in serverInfo.txt).
+
+        `/processMessage` waits for RAD agent and for the generation on the event loop, so one process holds as
+        many conversations in flight as the peers allow (`max_concurrency` of each one) instead of one per
+        thread. The users database and bcrypt run in the default thread pool.
+
+        The other routes, uploads and database management, are the Flask ones of the agent, served in threads
+        through the WSGI middleware of uvicorn.
+
+        Every worker process has its own clients, so the limits of the peers apply to each worker.
+    """
+
+    def __init__(self, agent):
+        """
+        Args:
+            agent (ControlAgent): The agent whose configuration, users database and Flask routes are served.
+        """
+        self.agent = agent
+        self.rad_client = AsyncPeerClient(agent.radConfig)
+        self.generation_client = AsyncPeerClient(agent.generationConfig)
+        self.app = Starlette(
+            routes=[
+                Route('/processMessage', self.process_message, methods=['POST']),
+                Route('/getMetrics', self.get_metrics, methods=['GET']),
+                Mount('', app=WSGIMiddleware(agent.app)),
+            ],
+            lifespan=self._lifespan,
+        )
+
+
+    async def process_message(self, request):
+        """
+        Process a user message: the same request and responses as `ControlAgent.process_message`, except that
+        invalid credentials answer 403 "Invalid credentials".
+        """
+        try:
+            data, version = CryptoManager.load_request(_RequestBody(await request.body(), request.headers))
+
+            required_fields = ['user', 'pass', 'database', 'chat']
+            missing_fields = [field for field in required_fields if data.get(field) is None]
+
+            if missing_fields:
+                return JSONResponse({"error": "Faltan argumentos en el JSON", "missing_fields": missing_fields}, 400)
+
+            messages = json.loads(data.get("chat"))
+            retrieval = await asyncio.to_thread(self._verified_retrieval_request, data, messages)
+
+            if retrieval is None:
+                return JSONResponse({"message": "Invalid credentials"}, 403)
+            endpoint, data = retrieval
+
+            context = await self.rad_client.post(endpoint, data, idempotent=True)
+            if context.status_code != 200:
+                return JSONResponse({"Status": "Fail"}, 500)
+            context_data = self.rad_client.load(context)
+
+            data = self.agent._generation_request(messages, context_data, self.generation_client)
+            generation = await self.generation_client.post("/generationwithmessagehistory", data)
+            if generation.status_code != 200:
+                return JSONResponse({"Status": "Fail"}, 500)
+
+            return _response(*self.agent._relay_generation(generation, version, self.generation_client))
+
+        except Exception as e:
+            return JSONResponse({"message": "Error in Control Agent"}, 500)
+
+
+    async def get_metrics(self, request):
+        """
+        Counters of the connections to the other agents: `peers` for `/processMessage`, `wsgi_peers` for the
+        routes served by Flask.
+        """
+        try:
+            metrics = {
+                "peers": {
+                    "rad": self.rad_client.get_stats(),
+                    "generation": self.generation_client.get_stats()
+                },
+                "wsgi_peers": {
+                    "rad": self.agent.rad_client.get_stats(),
+                    "generation": self.agent.generation_client.get_stats()
+                }
+            }
+            return JSONResponse(metrics, 200)
+
+        except Exception as e:
+            return JSONResponse({"message": "Error in Control Agent"}, 500)
+
+
+    def _verified_retrieval_request(self, data: dict, messages: list):
+        #The database work of a message, in a single trip to the thread pool
+        if not self.agent.DBusers.verify_user(data.get('user'), data.get('pass')):
+            return None
+        return self.agent._retrieval_request(data.get('user'), data.get("database"), data.get("retrieval_mode"), messages)
+
+
+    def run(self, config):
+        """
+        Serves the app with uvicorn in `config.workers` processes forked by `PreforkServer`.
+        """
+        PreforkServer(self.app, config, asgi=True).serve_forever()
+
+
+    @contextlib.asynccontextmanager
+    async def _lifespan(self, app):
+        yield
+        await self.rad_client.aclose()
+        await self.generation_client.aclose()
+
+
+
+class _RequestBody:
+    #The parts of a Flask request that CryptoManager.load_request reads
+    def __init__(self, body: bytes, headers):
+        self.body = body
+        self.headers = headers
+        self.mimetype = headers.get("content-type", "").split(";")[0].strip().lower()
+
+    def get_data(self) -> bytes:
+        return self.body
+
+    def get_json(self):
+        return json.loads(self.body)
+
+
+def _response(body, status: int, headers: dict) -> Response:
+    if isinstance(body, bytes):
+        return Response(body, status, headers=headers)
+    return JSONResponse(body, status, headers=headers)
@@ -0,0 +1,148 @@
+from peerClient import PeerClient
+import asyncio
+import httpx
+import time
+
+
+class AsyncPeerClient(PeerClient):
+    """
+        `PeerClient` for the async serving mode: the same envelopes, timeouts, retries and metrics, over an
+        `httpx.AsyncClient` so waiting for the peer does not hold a thread.
+
+        At most `max_concurrency` requests are sent to the peer at the same time, the rest wait their turn
+        without a connection. As many conversations wait for the peer at once, up to `max_concurrency`
+        connections are kept alive instead of `pool_size`, closed after `KEEPALIVE_EXPIRY` idle seconds: before
+        the 5 seconds of uvicorn and gunicorn, so a connection is never reused while the peer closes it.
+
+        httpcore scans every connection of a pool several times per request, which costs more than the request
+        itself with hundreds of connections. The connections are split into pools of up to `POOL_SIZE_LIMIT`
+        and every request goes to the pool with the fewest requests in flight.
+
+        Requests are retried like in `PeerClient`. A request sent on a kept-alive connection that the peer
+        was closing is only retried if it is idempotent, as the peer may have processed it: a generation is
+        never requested twice.
+
+        The clients and their connections are created on the first request, in the worker process that sends
+        it, so a prefork server never shares them between workers. The client must be used from a single event
+        loop, the one of the worker.
+    """
+
+    POOL_SIZE_LIMIT = 16
+    KEEPALIVE_EXPIRY = 4.0
+
+    def __init__(self, config):
+        """
+        Args:
+            config (RadConfig | GenerationConfig): `ip` and `cypherPass` of the peer, and the pool, timeout,
+                                                   retry and concurrency settings.
+        """
+        self.max_concurrency = config.max_concurrency
+        self.semaphore = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.connections_opened = 0
+        super().__init__(config)
+        #One client per pool, together they hold `max_concurrency` connections
+        self.pools = -(-config.max_concurrency // self.POOL_SIZE_LIMIT)
+        self.pool_in_flight = [0] * self.pools
+
+
+    async def post(self, endpoint: str, data, idempotent: bool = False) -> httpx.Response:
+        """
+        Sends `data` encrypted to `endpoint`, as an envelope if the peer supports them.
+        """
+        body, headers = self._encode(data)
+        response = await self.send(endpoint, idempotent, content=body, headers=headers)
+        self._negotiate(response)
+        return response
+
+
+    async def send(self, endpoint: str, idempotent: bool = False, **kwargs) -> httpx.Response:
+        """
+        Posts to `endpoint` once there is room among the concurrent requests to the peer, with its timeouts
+        and retries. `kwargs` are passed to `httpx.AsyncClient.post`.
+        """
+        URL = f"{self.ip}{endpoint}"
+        if self.session is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.session = self._build_clients()
+        with self.lock:
+            self.requests += 1
+            self.waiting += 1
+
+        async with self.semaphore:
+            with self.lock:
+                self.waiting -= 1
+                self.in_flight += 1
+                pool = min(range(self.pools), key=self.pool_in_flight.__getitem__)
+                self.pool_in_flight[pool] += 1
+            try:
+                attempt = 0
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        response = await self.session[pool].post(URL, extensions={"trace": self._trace}, **kwargs)
+                        self._record(started, error=False)
+                        return response
+                    except httpx.TransportError as e:
+                        self._record(started, error=True)
+                        if attempt >= self.retries or not (idempotent or self._not_sent(e)):
+                            raise
+                    attempt += 1
+                    with self.lock:
+                        self.retried += 1
+                    await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+                    self.pool_in_flight[pool] -= 1
+
+
+    async def aclose(self):
+        for session in self.session or []:
+            await session.aclose()
+
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        with self.lock:
+            stats.update({
+                "max_concurrency": self.max_concurrency,
+                "pools": self.pools,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+            })
+        return stats
+
+
+    def _build_session(self, config):
+        #Built by the first request, `_build_clients`
+        self.connect_timeout = config.connect_timeout
+        self.read_timeout = config.read_timeout
+        return None
+
+
+    def _build_clients(self) -> list:
+        size = -(-self.max_concurrency // self.pools)
+        limits = httpx.Limits(max_connections=size, max_keepalive_connections=size, keepalive_expiry=self.KEEPALIVE_EXPIRY)
+        timeout = httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        ssl_context = httpx.create_ssl_context()
+        return [httpx.AsyncClient(limits=limits, timeout=timeout, verify=ssl_context) for _ in range(self.pools)]
+
+
+    def _connection_counts(self):
+        with self.lock:
+            return self.connections_opened, self.attempts
+
+
+    async def _trace(self, event_name: str, info: dict):
+        #httpcore reports every connection it opens, reused ones skip straight to sending the request
+        if event_name == "connection.connect_tcp.complete":
+            with self.lock:
+                self.connections_opened += 1
+
+
+    @staticmethod
+    def _not_sent(error: httpx.TransportError) -> bool:
+        #The connection was never opened, so the peer did not get the request
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
@@ -5,6 +5,12 @@ import os
 class GenerationConfig: 
     ip: str = field(default="")
     cypherPass: str = field(default="")
+    pool_size: int = field(default=10)
+    connect_timeout: float = field(default=3.0)
+    read_timeout: float = field(default=120.0)
+    retries: int = field(default=2)
+    retry_backoff: float = field(default=0.5)
+    max_concurrency: int = field(default=32)
     
     def __post_init__(self):
         file_path = os.path.join('controlAgent','configFiles', 'generationInfo.txt')
@@ -17,4 +23,10 @@ class GenerationConfig:
         
         self.ip = config.get('ip', 'http://default_ip')
         self.cypherPass = config.get('cypherPass', 'default_cypherPass')
+        self.pool_size = int(config.get('pool_size', self.pool_size))
+        self.connect_timeout = float(config.get('connect_timeout', self.connect_timeout))
+        self.read_timeout = float(config.get('read_timeout', self.read_timeout))
+        self.retries = int(config.get('retries', self.retries))
+        self.retry_backoff = float(config.get('retry_backoff', self.retry_backoff))
+        self.max_concurrency = int(config.get('max_concurrency', self.max_concurrency))
         
@@ -5,6 +5,14 @@ import os
 class RadConfig: 
     ip: str = field(default="")
     cypherPass: str = field(default="")
+    pool_size: int = field(default=10)
+    connect_timeout: float = field(default=3.0)
+    read_timeout: float = field(default=60.0)
+    retries: int = field(default=2)
+    retry_backoff: float = field(default=0.5)
+    max_concurrency: int = field(default=64)
+    ingest_priority: int = field(default=0)
+    user_priorities: dict = field(default_factory=dict)
     
     def __post_init__(self):
         file_path = os.path.join('controlAgent','configFiles', 'radInfo.txt')
@@ -17,6 +25,24 @@ class RadConfig:
         
         self.ip = config.get('ip', 'http://default_ip')
         self.cypherPass = config.get('cypherPass', 'default_cypherPass')
+        self.pool_size = int(config.get('pool_size', self.pool_size))
+        self.connect_timeout = float(config.get('connect_timeout', self.connect_timeout))
+        self.read_timeout = float(config.get('read_timeout', self.read_timeout))
+        self.retries = int(config.get('retries', self.retries))
+        self.retry_backoff = float(config.get('retry_backoff', self.retry_backoff))
+        self.max_concurrency = int(config.get('max_concurrency', self.max_concurrency))
+        self.ingest_priority = int(config.get('ingest_priority', self.ingest_priority))
+        self.user_priorities = self._parse_priorities(config.get('user_priorities', ''))
+        
+    @staticmethod
+    def _parse_priorities(value: str) -> dict:
+        #user=priority pairs separated by commas
+        priorities = {}
+        for pair in value.split(','):
+            if pair.strip():
+                user, priority = pair.split('=', 1)
+                priorities[user.strip()] = int(priority)
+        return priorities
         
         
 ra = RadConfig()
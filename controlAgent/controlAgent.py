@@ -3,10 +3,12 @@ from databaseManager import DatabaseManager
 from cryptoManager import CryptoManager
 from configClasses.radConfig import RadConfig
 from configClasses.generationConfig import GenerationConfig
+from configClasses.serverConfig import ServerConfig
 from utils import Utils
+from peerClient import PeerClient
+from preforkServer import PreforkServer
 import uuid
 import os 
-import requests
 import json
 
 class ControlAgent: 
@@ -17,12 +19,20 @@ class ControlAgent:
         self.DBusers = DatabaseManager()
         self.radConfig = RadConfig()
         self.generationConfig = GenerationConfig()
+        self.serverConfig = ServerConfig()
         self.utils = Utils()
+        self.rad_client = PeerClient(self.radConfig)
+        self.generation_client = PeerClient(self.generationConfig)
         
         
     def setup_routes(self):
         self.app.add_url_rule('/createNewDatabase', 'createNewDatabase', self.createNewDatabase, methods=['POST'])
+        self.app.add_url_rule('/createNewDatabaseStream', 'createNewDatabaseStream', self.create_new_database_stream, methods=['POST'])
         self.app.add_url_rule('/processMessage', 'processMessage', self.process_message, methods=['POST'])
+        self.app.add_url_rule('/addFilesToDatabase', 'addFilesToDatabase', self.add_files_to_database, methods=['POST'])
+        self.app.add_url_rule('/removeFilesFromDatabase', 'removeFilesFromDatabase', self.remove_files_from_database, methods=['POST'])
+        self.app.add_url_rule('/getDatabaseStatus', 'getDatabaseStatus', self.get_database_status, methods=['POST'])
+        self.app.add_url_rule('/getMetrics', 'getMetrics', self.get_metrics, methods=['GET'])
             
     def createNewDatabase(self):
         """
@@ -37,6 +47,8 @@ class ControlAgent:
         - `database`: Identifier for the target database slot (string).
         - `files`: List of files to be uploaded (array of strings, where each string is a file name and file content).
 
+        The priority of the ingestion job in RAD agent is the one of the user in radInfo.txt (see `_ingest_priority`).
+
         The function decrypts the `cipherData`, verifies the user's credentials, and if the verification is successful, 
         it creates a new folder for the files, saves the uploaded PDF files, and sends the data to create a new vector database. 
         If a database already exists in the specified slot, it will be deleted and updated accordingly.
@@ -83,6 +95,14 @@ class ControlAgent:
                 message:
                 type: string
                 example: "Invalid credentials"
+        429:
+            description: The ingestion queue of RAD agent is full, try again later.
+            schema:
+            type: object
+            properties:
+                Status:
+                type: string
+                example: "Busy"
         500:
             description: Internal server error occurred during processing.
             schema:
@@ -127,7 +147,6 @@ class ControlAgent:
             self.utils.save_pdfs(container=folder_path, files=files)
             
             endpoint = "/createvectordatabase"
-            URL = f"{self.radConfig.ip}{endpoint}"
             
             uploadPath = folder_path
             
@@ -147,7 +166,9 @@ class ControlAgent:
                     filesList.append(file_data)
 
             data = {
-                "files": filesList
+                "files": filesList,
+                "user": user,
+                "priority": self._ingest_priority(user)
             }
             
             json_data = json.dumps(data)
@@ -155,35 +176,120 @@ class ControlAgent:
             cipherData = CryptoManager.encrypt_text(json_data, self.radConfig.cypherPass)
             data_to_send = {"cipherData": cipherData}
             
-            response = requests.post(URL, json=data_to_send)
-
-            ##Update users database to include new database 
-            if response.status_code == 200:
-                #extact data from json
-                data = response.json()
-                cipherData = data.get("cipherData")
-                decrypted_data  = CryptoManager.decrypt_text(cipherData, self.radConfig.cypherPass)
-                data = json.loads(decrypted_data)
-                database_id = data["database_id"]
-                
-                #if slot already have a database delete it to avoid leftovers
-                database_number = self.utils.get_database_number(database_slot)
-                has_assigned = self.DBusers.has_assigned_db(user, database_number)
-                if (has_assigned):
-                    self._delete_database(user=user, database_number=database_number)
-                    
-                self.DBusers.update_databaseID(username=user, database_number=database_number, new_databaseID=database_id)
+            response = self.rad_client.send(endpoint, json=data_to_send)
+            
+            if response.status_code in (200, 429):
                 self.utils.delete_directory(folder_path)
-                
-                #No cipher content bc only need to check status code
-                response = make_response(jsonify({"Status": "ok"}), 200)
-                return response
-            else:
-                response = make_response(jsonify({"Status": "Fail"}), 500)
-                return response
+            
+            return self._assign_new_database(user, database_slot, response)
+
+        except Exception as e: 
+            return jsonify({"message": "Error in Control Agent"}), 500  
+        
+    
+    def create_new_database_stream(self):
+        """
+        Create a new database in RAD agent from files uploaded as a binary stream, and update the users database.
+
+        Same as `/createNewDatabase`, but the body is a stream of `CryptoManager.encrypt_stream` records instead 
+        of JSON with the files as hex. The frames are:
+
+        - A metadata frame with the JSON of `user`, `pass` and `database`.
+        - For every file, a frame with the JSON of its `title` followed by frames with its bytes.
+
+        Once the credentials of the metadata are verified, the files are relayed to `/createvectordatabasestream` 
+        of RAD agent frame by frame as they arrive, decrypted and encrypted again with the key of RAD agent, 
+        without saving them. Files that are not PDF are skipped.
+
+        ---
+        parameters:
+        - name: body
+            in: body
+            required: true
+            description: Encrypted binary stream (application/octet-stream) with the metadata and the files.
+
+        responses:
+        200:
+            description: Database created successfully and status updated.
+            schema:
+            type: object
+            properties:
+                Status:
+                type: string
+                example: "ok"
+        400:
+            description: Missing required fields in the metadata.
+        403:
+            description: Invalid user credentials.
+        429:
+            description: The ingestion queue of RAD agent is full, try again later.
+        500:
+            description: Internal server error occurred during processing.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Error in Control Agent"
+        """
+        try:
+            frames = CryptoManager.decrypt_stream(request.stream)
+            frame_type, payload = next(frames, (None, None))
+            data = json.loads(payload) if frame_type == self.utils.FRAME_METADATA else {}
+    
+            required_fields = ['user', 'pass', 'database']
+            missing_fields = [field for field in required_fields if data.get(field) is None]
+
+            if missing_fields:
+                return jsonify({"error": "Faltan argumentos en el JSON", "missing_fields": missing_fields}), 400
+
+            user = data["user"]
+            
+            if (not self.DBusers.verify_user(user, data["pass"])):
+                return jsonify({"message": "Invalid credentials"}), 403
+            
+            endpoint = "/createvectordatabasestream"
+            
+            relay = self.utils.relay_pdf_frames({"user": user, "priority": self._ingest_priority(user)}, frames)
+            response = self.rad_client.send(endpoint, data=CryptoManager.encrypt_stream(relay, self.radConfig.cypherPass),
+                                         headers={"Content-Type": "application/octet-stream"})
+            
+            return self._assign_new_database(user, data["database"], response)
 
         except Exception as e: 
             return jsonify({"message": "Error in Control Agent"}), 500  
+    
+    
+    def _assign_new_database(self, user, database_slot, response):
+        """
+        Assigns the database created by RAD agent to the slot of the user, from the response of RAD agent.
+        """
+        ##Update users database to include new database 
+        if response.status_code == 200:
+            #extact data from json
+            data = response.json()
+            cipherData = data.get("cipherData")
+            decrypted_data  = CryptoManager.decrypt_text(cipherData, self.radConfig.cypherPass)
+            data = json.loads(decrypted_data)
+            database_id = data["database_id"]
+            
+            #if slot already have a database delete it to avoid leftovers
+            database_number = self.utils.get_database_number(database_slot)
+            has_assigned = self.DBusers.has_assigned_db(user, database_number)
+            if (has_assigned):
+                self._delete_database(user=user, database_number=database_number)
+                
+            self.DBusers.update_databaseID(username=user, database_number=database_number, new_databaseID=database_id)
+            
+            #No cipher content bc only need to check status code
+            response = make_response(jsonify({"Status": "ok"}), 200)
+            return response
+        elif response.status_code == 429:
+            response = make_response(jsonify({"Status": "Busy"}), 429)
+            return response
+        else:
+            response = make_response(jsonify({"Status": "Fail"}), 500)
+            return response
         
 
     def _delete_database(self, user, database_number ):   
@@ -198,7 +304,6 @@ class ControlAgent:
             None: The function sends the request but does not return a specific response.
         """
         endpoint = "/deletevectordatabase"
-        URL = f"{self.radConfig.ip}{endpoint}"  
         
         database_id = self.DBusers.get_database_id_by_user_and_numdb(user, database_number)
     
@@ -211,7 +316,7 @@ class ControlAgent:
         cipherData = CryptoManager.encrypt_text(json_data, self.radConfig.cypherPass)
         data_to_send = {"cipherData": cipherData}
         
-        response = requests.post(URL, json=data_to_send)
+        response = self.rad_client.send(endpoint, json=data_to_send)
         
         if (not (response.status_code == 200)):
             raise RuntimeError("Error: deleting database  Reason: {}".format(response))
@@ -219,6 +324,327 @@ class ControlAgent:
    
    
    
+    def add_files_to_database(self):
+        """
+        Add files to the database of a user slot in RAD agent, without rebuilding it.
+
+        This endpoint receives encrypted data in the `cipherData` field. The expected structure of the decrypted 
+        JSON is as follows:
+        
+        - `user`: The username for authentication (string).
+        - `pass`: The password for authentication (string).
+        - `database`: Identifier for the target database slot (string).
+        - `files`: List of files to be added (array of objects with `title` and hex `content`).
+
+        The function verifies the user's credentials and forwards the PDF files to the database assigned to the 
+        slot. Only the new files are parsed and embedded by RAD agent, in a job with the priority of the user as 
+        in `/createNewDatabase`.
+
+        ---
+        parameters:
+        - name: cipherData
+            in: body
+            required: true
+            description: Encrypted JSON string that contains user credentials, the slot and the files.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted data representing user credentials, the slot and the files.
+
+        responses:
+        200:
+            description: Update of the database initiated successfully.
+            schema:
+            type: object
+            properties:
+                Status:
+                type: string
+                example: "ok"
+        400:
+            description: Missing required fields in the JSON request.
+            schema:
+            type: object
+            properties:
+                error:
+                type: string
+                example: "Faltan argumentos en el JSON"
+                missing_fields:
+                type: array
+                items:
+                    type: string
+        403:
+            description: Invalid user credentials.
+        404:
+            description: The slot has no database assigned.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "No database in slot"
+        429:
+            description: The ingestion queue of RAD agent is full, try again later.
+        500:
+            description: Internal server error occurred during processing.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Error in Control Agent"
+        """
+        try:
+            encrypted_data = request.get_json()
+
+            if isinstance(encrypted_data, str):
+                encrypted_data = json.loads(encrypted_data)
+
+            cipher_text = encrypted_data.get('cipherData')
+            decrypted_data = CryptoManager.decrypt_text(cipher_text)
+            data = json.loads(decrypted_data)
+    
+            required_fields = ['user', 'pass', 'database', 'files']
+            missing_fields = [field for field in required_fields if data.get(field) is None]
+
+            if missing_fields:
+                return jsonify({"error": "Faltan argumentos en el JSON", "missing_fields": missing_fields}), 400
+
+            user = data["user"]
+            files = [file for file in data["files"] if file.get("title", "").lower().endswith('.pdf')]
+            
+            if (not self.DBusers.verify_user(user, data["pass"])):
+                abort(403, description="Invalid credentials")
+            
+            database_id = self._get_slot_database_id(user, data["database"])
+            if database_id is None:
+                return jsonify({"message": "No database in slot"}), 404
+            
+            return self._send_update(endpoint="/addfilestovectordatabase", data={
+                "database_id": database_id, "files": files, "user": user, "priority": self._ingest_priority(user)
+            })
+
+        except Exception as e: 
+            return jsonify({"message": "Error in Control Agent"}), 500
+        
+        
+    def remove_files_from_database(self):
+        """
+        Remove files from the database of a user slot in RAD agent, without rebuilding it.
+
+        This endpoint receives encrypted data in the `cipherData` field. The expected structure of the decrypted 
+        JSON is as follows:
+        
+        - `user`: The username for authentication (string).
+        - `pass`: The password for authentication (string).
+        - `database`: Identifier for the target database slot (string).
+        - `files`: Names of the files to be removed (array of strings).
+
+        The removal runs in an ingestion job with the priority of the user, as in `/createNewDatabase`.
+
+        ---
+        parameters:
+        - name: cipherData
+            in: body
+            required: true
+            description: Encrypted JSON string that contains user credentials, the slot and the file names.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted data representing user credentials, the slot and the file names.
+
+        responses:
+        200:
+            description: Update of the database initiated successfully.
+            schema:
+            type: object
+            properties:
+                Status:
+                type: string
+                example: "ok"
+        400:
+            description: Missing required fields in the JSON request.
+        403:
+            description: Invalid user credentials.
+        404:
+            description: The slot has no database assigned.
+        429:
+            description: The ingestion queue of RAD agent is full, try again later.
+        500:
+            description: Internal server error occurred during processing.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Error in Control Agent"
+        """
+        try:
+            encrypted_data = request.get_json()
+
+            if isinstance(encrypted_data, str):
+                encrypted_data = json.loads(encrypted_data)
+
+            cipher_text = encrypted_data.get('cipherData')
+            decrypted_data = CryptoManager.decrypt_text(cipher_text)
+            data = json.loads(decrypted_data)
+    
+            required_fields = ['user', 'pass', 'database', 'files']
+            missing_fields = [field for field in required_fields if data.get(field) is None]
+
+            if missing_fields:
+                return jsonify({"error": "Faltan argumentos en el JSON", "missing_fields": missing_fields}), 400
+
+            user = data["user"]
+            
+            if (not self.DBusers.verify_user(user, data["pass"])):
+                abort(403, description="Invalid credentials")
+            
+            database_id = self._get_slot_database_id(user, data["database"])
+            if database_id is None:
+                return jsonify({"message": "No database in slot"}), 404
+            
+            return self._send_update(endpoint="/removefilesfromvectordatabase", data={
+                "database_id": database_id, "files": data["files"], "user": user, "priority": self._ingest_priority(user)
+            })
+
+        except Exception as e: 
+            return jsonify({"message": "Error in Control Agent"}), 500
+        
+        
+    def get_database_status(self):
+        """
+        Relay the status and ingestion progress of the database of a user slot from RAD agent.
+
+        This endpoint receives encrypted data in the `cipherData` field. The expected structure of the decrypted 
+        JSON is as follows:
+        
+        - `user`: The username for authentication (string).
+        - `pass`: The password for authentication (string).
+        - `database`: Identifier for the database slot (string).
+
+        The response contains, encrypted, the status of the database and the progress of its last ingestion: 
+        files and pages parsed, chunks produced, embedded and written, bytes written, per-stage seconds, 
+        throughput and ETA.
+
+        ---
+        parameters:
+        - name: cipherData
+            in: body
+            required: true
+            description: Encrypted JSON string that contains user credentials and the slot.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted data representing user credentials and the slot.
+
+        responses:
+        200:
+            description: Status and progress of the database.
+            schema:
+            type: object
+            properties:
+                cipherData:
+                type: string
+                description: The encrypted status and progress.
+        400:
+            description: Missing required fields in the JSON request.
+        403:
+            description: Invalid user credentials.
+        404:
+            description: The slot has no database assigned.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "No database in slot"
+        500:
+            description: Internal server error occurred during processing.
+            schema:
+            type: object
+            properties:
+                message:
+                type: string
+                example: "Error in Control Agent"
+        """
+        try:
+            encrypted_data = request.get_json()
+
+            if isinstance(encrypted_data, str):
+                encrypted_data = json.loads(encrypted_data)
+
+            cipher_text = encrypted_data.get('cipherData')
+            decrypted_data = CryptoManager.decrypt_text(cipher_text)
+            data = json.loads(decrypted_data)
+    
+            required_fields = ['user', 'pass', 'database']
+            missing_fields = [field for field in required_fields if data.get(field) is None]
+
+            if missing_fields:
+                return jsonify({"error": "Faltan argumentos en el JSON", "missing_fields": missing_fields}), 400
+
+            user = data["user"]
+            
+            if (not self.DBusers.verify_user(user, data["pass"])):
+                abort(403, description="Invalid credentials")
+            
+            database_id = self._get_slot_database_id(user, data["database"])
+            if database_id is None:
+                return jsonify({"message": "No database in slot"}), 404
+            
+            endpoint = "/getdatabasestatus"
+            
+            cipherData = CryptoManager.encrypt_text(json.dumps({"database_id": database_id}), self.radConfig.cypherPass)
+            response = self.rad_client.send(endpoint, idempotent=True, json={"cipherData": cipherData})
+            
+            if response.status_code != 200:
+                return make_response(jsonify({"Status": "Fail"}), 500)
+            
+            status = CryptoManager.decrypt_text(response.json()["cipherData"], self.radConfig.cypherPass)
+            return jsonify({"cipherData": CryptoManager.encrypt_text(status)}), 200
+
+        except Exception as e: 
+            return jsonify({"message": "Error in Control Agent"}), 500
+        
+        
+    def _ingest_priority(self, user: str) -> int:
+        #Set here and not by the users, so none can jump ahead of the others
+        return self.radConfig.user_priorities.get(user, self.radConfig.ingest_priority)
+
+
+    def _get_slot_database_id(self, user: str, database_slot: str):
+        """
+        Returns the database assigned to a slot (db1, db2, db3) of a user, or None if there is none.
+        """
+        database_number = self.utils.get_database_number(database_slot)
+        if database_number < 1 or not self.DBusers.has_assigned_db(user, database_number):
+            return None
+        return self.DBusers.get_database_id_by_user_and_numdb(user, database_number)
+    
+    
+    def _send_update(self, endpoint: str, data: dict):
+        """
+        Sends an update of an existing database to RAD agent and relays its outcome.
+        """
+        
+        cipherData = CryptoManager.encrypt_text(json.dumps(data), self.radConfig.cypherPass)
+        response = self.rad_client.send(endpoint, json={"cipherData": cipherData})
+        
+        if response.status_code == 200:
+            return make_response(jsonify({"Status": "ok"}), 200)
+        if response.status_code == 409:
+            return make_response(jsonify({"Status": "Database is not ready"}), 409)
+        if response.status_code == 429:
+            return make_response(jsonify({"Status": "Busy"}), 429)
+        return make_response(jsonify({"Status": "Fail"}), 500)
+        
+        
     def process_message(self):
         """
         Process a user message and retrieve context for message generation.
@@ -228,14 +654,24 @@ class ControlAgent:
         
         - `user`: The username for authentication (string).
         - `pass`: The password for authentication (string).
-        - `database`: Identifier for the target database slot (string).
+        - `database`: Identifier for the target database slot (string). `all` searches every slot 
+          assigned to the user at once.
         - `chat`: JSON string representing the chat history (array of messages).
+        - `retrieval_mode`: `dense`, `lexical` or `hybrid` (string, optional). Forwarded to the RAD agent, 
+          also in `all` mode.
 
         The function decrypts the `cipherData`, verifies the user's credentials, retrieves the last message 
-        from the chat history, and sends a request to get the context for that message. It then sends the 
+        from the chat history, and sends a request to get the context for that message. In `all` mode the 
+        RAD agent searches every assigned database concurrently and merges the results by score. It then sends the 
         entire chat history along with the context to generate a response. If the verification fails or 
         if any required fields are missing, appropriate error messages are returned.
 
+        Requests and responses can also be envelopes v2 (`CryptoManager.seal`), negotiated with every agent 
+        through the `X-Envelope` header. When the view and generation agents both use them, the generation 
+        is relayed with `CryptoManager.rewrap`, which encrypts its data key again without decrypting it.
+
+        With `serving_mode:async` this route is served by `AsyncControlServer.process_message` instead.
+
         ---
         parameters:
         - name: cipherData
@@ -288,18 +724,7 @@ class ControlAgent:
                 example: "Error in Control Agent"
         """
         try:
-            endpoint = "/getretrievalcontext"
-            URL = f"{self.radConfig.ip}{endpoint}"
-
-            encrypted_data = request.get_json()
-
-            if isinstance(encrypted_data, str):
-                encrypted_data = json.loads(encrypted_data)
-
-            cipher_text = encrypted_data.get('cipherData')
-            decrypted_data = CryptoManager.decrypt_text(cipher_text)
-            
-            data = json.loads(decrypted_data)
+            data, version = CryptoManager.load_request(request)
             
             required_fields = ['user', 'pass', 'database', 'chat']
             missing_fields = [field for field in required_fields if data.get(field) is None]
@@ -312,7 +737,7 @@ class ControlAgent:
             password = data.get('pass')
             chat = data.get("chat")
             database_slot = data.get("database")
-            database_slot_number = self.utils.get_database_number(database_slot)
+            retrieval_mode = data.get("retrieval_mode")
                 
             result = self.DBusers.verify_user(user, password)
             
@@ -320,59 +745,28 @@ class ControlAgent:
                 abort(403, description="Invalid credentials")
                 
             messages = json.loads(chat)
-            database = self.DBusers.get_database_id_by_user_and_numdb(username=user, numdb=database_slot_number)
             
             #Get retrieval of a last user message
+            endpoint, data = self._retrieval_request(user, database_slot, retrieval_mode, messages)
             
-            last_message = messages[-1].get("text")
-                
-                #Prepare data to send
-            data = {
-                "last_message":last_message,
-                "database": database
-            }
-            
-            json_data = json.dumps(data)
-            cipherData = CryptoManager.encrypt_text(json_data, self.radConfig.cypherPass)
-            data_to_send = {"cipherData": cipherData}
-            
-            context = requests.post(URL, json=data_to_send)
+            context = self.rad_client.post(endpoint, data, idempotent=True)
             
                 #Get response data
             if context.status_code == 200:
-                data = context.json()
-                cipher_data = data['cipherData']
-                decrypted_data = CryptoManager.decrypt_text(cipher_data, self.radConfig.cypherPass)
+                context_data = self.rad_client.load(context)
                 
             else:
                 response = make_response(jsonify({"Status": "Fail"}), 500)
                 return response
                 
             ##Generate response from generator Agent
-
-                #Prepare data to send
-            data = {
-                "chat" : messages,
-                "context": decrypted_data
-            }
-            
-            json_data = json.dumps(data)
-            cipherData = CryptoManager.encrypt_text(json_data, self.generationConfig.cypherPass)
-            data_to_send = {"cipherData": cipherData}
-
-                #Prepare URL
-            endpoint = "/generationwithmessagehistory"
-            URL = f"{self.generationConfig.ip}{endpoint}"  
+            data = self._generation_request(messages, context_data, self.generation_client)
             
                 #Send
-            generation = requests.post(URL, json=data_to_send)
+            generation = self.generation_client.post("/generationwithmessagehistory", data)
             
             if generation.status_code == 200:
-                data = generation.json()  
-                ciphered_generation = data['cipher_response'] 
-                generation = CryptoManager.decrypt_text(ciphered_generation, self.generationConfig.cypherPass)
-                ciphered_generation = CryptoManager.encrypt_text(generation)
-                return jsonify({"cipher_response": ciphered_generation}), 200
+                return self._relay_generation(generation, version, self.generation_client)
             else:
                         response = make_response(jsonify({"Status": "Fail"}), 500)
                         return response
@@ -381,10 +775,97 @@ class ControlAgent:
             return jsonify({"message": "Error in Control Agent"}), 500    
          
          
+    def _retrieval_request(self, user: str, database_slot: str, retrieval_mode, messages: list):
+        """
+        Returns the endpoint of RAD agent and the data to get the context of the last message of a chat.
+        """
+        last_message = messages[-1].get("text")
+        database_slot_number = self.utils.get_database_number(database_slot)
+        
+        if database_slot_number == 0:
+            endpoint = "/getretrievalcontextmulti"
+            data = {
+                "last_message":last_message,
+                "databases": self.DBusers.get_assigned_database_ids(username=user)
+            }
+        else:
+            endpoint = "/getretrievalcontext"
+            data = {
+                "last_message":last_message,
+                "database": self.DBusers.get_database_id_by_user_and_numdb(username=user, numdb=database_slot_number)
+            }
+        if retrieval_mode:
+            data["retrieval_mode"] = retrieval_mode
+        return endpoint, data
+    
+    
+    def _generation_request(self, messages: list, context_data, generation_client) -> dict:
+        #Generation agents without envelopes expect the context as JSON text
+        return {
+            "chat" : messages,
+            "context": context_data if generation_client.version == CryptoManager.ENVELOPE_VERSION else json.dumps(context_data)
+        }
+    
+    
+    def _relay_generation(self, generation, version: int, generation_client):
+        """
+        Returns the body, status and headers of the response to the view agent with a generation, in the
+        format of its request.
+        """
+        if version == CryptoManager.ENVELOPE_VERSION and generation_client.is_envelope(generation):
+            #Only the data key is decrypted and encrypted again with the key of the view agent
+            envelope = CryptoManager.rewrap(generation.content, self.generationConfig.cypherPass)
+            return envelope, 200, {"Content-Type": CryptoManager.ENVELOPE_CONTENT_TYPE,
+                                   CryptoManager.ENVELOPE_HEADER: str(CryptoManager.ENVELOPE_VERSION)}
+        generation = generation_client.load(generation, field="cipher_response")
+        return CryptoManager.dump_response(generation, version, field="cipher_response")
+         
+         
     
             
+    def get_metrics(self):
+        """
+        Return the counters of the connections of the control agent to the other agents.
+
+        The response only contains counters, never user content, so it is not encrypted.
+
+        ---
+        responses:
+        200:
+            description: Current metrics of the agent.
+            schema:
+            type: object
+            properties:
+                peers:
+                type: object
+                description: Per agent (rad, generation), requests, retries, errors, connections opened and reused, and the latency histogram.
+        500:
+            description: Internal server error occurred during processing.
+        """
+        try:
+            metrics = {
+                "peers": {
+                    "rad": self.rad_client.get_stats(),
+                    "generation": self.generation_client.get_stats()
+                }
+            }
+            return make_response(jsonify(metrics), 200)
+        
+        except Exception as e: 
+            return jsonify({"message": "Error in Control Agent"}), 500
+    
+    
     def run(self):
-        self.app.run(port=5006, debug=True)
+        if self.serverConfig.serving_mode == "async":
+            #uvicorn and httpx are only needed in async mode
+            from asyncControlServer import AsyncControlServer
+            AsyncControlServer(self).run(self.serverConfig)
+        elif self.serverConfig.serving_mode == "prefork":
+            PreforkServer(self.app, self.serverConfig).serve_forever()
+        elif self.serverConfig.serving_mode == "dev":
+            self.app.run(port=self.serverConfig.port, debug=True)
+        else:
+            raise ValueError("Unknown serving mode {}".format(self.serverConfig.serving_mode))
         
         
 
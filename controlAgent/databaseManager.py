@@ -244,6 +244,24 @@ class DatabaseManager:
             return None  
         
         
+    def get_assigned_database_ids(self, username: str) -> list:
+        """
+        Get the idDB of every database assigned to a user with a single query.
+
+        Args:
+            username (str): The username to look up.
+
+        Returns:
+            list: The idDB of every assigned slot ordered by numdb. Slots without a database ('-1') are skipped.
+        """
+        query = (Database
+                 .select(Database.idDB)
+                 .join(User)
+                 .where((User.username == username) & (Database.idDB != '-1'))
+                 .order_by(Database.numdb))
+        return [db_entry.idDB for db_entry in query]
+        
+        
     
 class BaseModel(Model):
     class Meta:
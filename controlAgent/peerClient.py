@@ -0,0 +1,176 @@
+from cryptoManager import CryptoManager
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+import requests
+import threading
+import time
+import json
+
+
+class PeerClient:
+    """
+        Sends encrypted requests to another agent over a pool of keep-alive connections, in the newest
+        envelope format both agents support.
+
+        Every peer has its own session with up to `pool_size` connections kept open, so a chat turn reuses the
+        connections of the previous ones instead of opening new ones. Requests time out after
+        `connect_timeout` seconds to connect and `read_timeout` seconds waiting for the response.
+
+        A failed request is retried up to `retries` times, waiting `retry_backoff` seconds and twice as long
+        after every attempt:
+            - Always when the connection could not be opened, as the peer did not get the request.
+            - For idempotent calls (reads), also after timeouts and connections dropped mid-request.
+        Responses, errors included, are never retried: the peer answered.
+
+        Requests start as JSON with `cipherData`, advertising envelopes in the `X-Envelope` header. Agents that
+        support them answer with an envelope and the same header, and from then on requests are sent as
+        envelopes too. Agents that do not keep getting the JSON format, so agents can be updated one at a time.
+
+        The latency of every attempt is kept in a histogram, with the counts of requests, retries, errors and
+        connections opened, for the metrics of the agent.
+    """
+
+    HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+    def __init__(self, config):
+        """
+        Args:
+            config (RadConfig | GenerationConfig | ControlConfig): `ip` and `cypherPass` of the peer, and the
+                                                                   pool, timeout and retry settings.
+        """
+        self.ip = config.ip
+        self.key_string = config.cypherPass
+        self.pool_size = config.pool_size
+        self.timeout = (config.connect_timeout, config.read_timeout)
+        self.retries = config.retries
+        self.retry_backoff = config.retry_backoff
+        self.version = 1
+
+        self.session = self._build_session(config)
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.attempts = 0
+        self.retried = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.histogram = [0] * (len(self.HISTOGRAM_BUCKETS_MS) + 1)
+
+
+    def post(self, endpoint: str, data, idempotent: bool = False) -> requests.Response:
+        """
+        Sends `data` encrypted to `endpoint`, as an envelope if the peer supports them.
+        """
+        body, headers = self._encode(data)
+        response = self.send(endpoint, idempotent, data=body, headers=headers)
+        self._negotiate(response)
+        return response
+
+
+    def send(self, endpoint: str, idempotent: bool = False, **kwargs) -> requests.Response:
+        """
+        Posts to `endpoint` through the pool, with the timeouts and retries of the peer. `kwargs` are passed
+        to `requests.Session.post`.
+        """
+        URL = f"{self.ip}{endpoint}"
+        with self.lock:
+            self.requests += 1
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.post(URL, timeout=self.timeout, **kwargs)
+                self._record(started, error=False)
+                return response
+            except requests.RequestException as e:
+                self._record(started, error=True)
+                if attempt >= self.retries or not (idempotent or self._not_sent(e)):
+                    raise
+            attempt += 1
+            with self.lock:
+                self.retried += 1
+            time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+
+    def load(self, response: requests.Response, field: str = "cipherData"):
+        return CryptoManager.load_response(response, self.key_string, field)
+
+
+    def is_envelope(self, response: requests.Response) -> bool:
+        return response.headers.get("Content-Type", "").startswith(CryptoManager.ENVELOPE_CONTENT_TYPE)
+
+
+    def get_stats(self) -> dict:
+        opened, served = self._connection_counts()
+        with self.lock:
+            labels = ["<{}".format(self.HISTOGRAM_BUCKETS_MS[0])]
+            labels += ["{}-{}".format(low, high) for low, high in zip(self.HISTOGRAM_BUCKETS_MS, self.HISTOGRAM_BUCKETS_MS[1:])]
+            labels += [">={}".format(self.HISTOGRAM_BUCKETS_MS[-1])]
+            return {
+                "ip": self.ip,
+                "envelope_version": self.version,
+                "requests": self.requests,
+                "attempts": self.attempts,
+                "retries": self.retried,
+                "errors": self.errors,
+                "pool_size": self.pool_size,
+                "connections_opened": opened,
+                "connection_reuse_rate": (1 - opened / served) if served else 0.0,
+                "average_latency_ms": (self.total_ms / self.attempts) if self.attempts else 0.0,
+                "latency_ms_histogram": dict(zip(labels, self.histogram)),
+            }
+
+
+    def _build_session(self, config) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.pool_size, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+
+    def _encode(self, data):
+        """
+        Returns the body and headers of a request with `data`, in the format of the peer.
+        """
+        headers = {CryptoManager.ENVELOPE_HEADER: str(CryptoManager.ENVELOPE_VERSION)}
+        if self.version == CryptoManager.ENVELOPE_VERSION:
+            headers["Content-Type"] = CryptoManager.ENVELOPE_CONTENT_TYPE
+            return CryptoManager.seal(data, self.key_string), headers
+        headers["Content-Type"] = "application/json"
+        cipherData = CryptoManager.encrypt_text(json.dumps(data), self.key_string)
+        return json.dumps({"cipherData": cipherData}).encode(), headers
+
+
+    def _negotiate(self, response):
+        if response.headers.get(CryptoManager.ENVELOPE_HEADER) == str(CryptoManager.ENVELOPE_VERSION):
+            self.version = CryptoManager.ENVELOPE_VERSION
+
+
+    def _connection_counts(self):
+        #The pool of the peer counts the connections it had to open and the requests it served
+        poolmanager = self.session.get_adapter(self.ip).poolmanager
+        pools = [poolmanager.pools[key] for key in poolmanager.pools.keys()]
+        return sum(pool.num_connections for pool in pools), sum(pool.num_requests for pool in pools)
+
+
+    def _record(self, started: float, error: bool):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        bucket = 0
+        while bucket < len(self.HISTOGRAM_BUCKETS_MS) and elapsed_ms >= self.HISTOGRAM_BUCKETS_MS[bucket]:
+            bucket += 1
+        with self.lock:
+            self.attempts += 1
+            self.errors += error
+            self.total_ms += elapsed_ms
+            self.histogram[bucket] += 1
+
+
+    @staticmethod
+    def _not_sent(error: requests.RequestException) -> bool:
+        #The connection was never opened, so the peer did not get the request
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
@@ -1,7 +1,13 @@
 import os 
+import json
 
 class Utils: 
     
+    #Frame types of the binary uploads
+    FRAME_METADATA = 1
+    FRAME_FILE = 2
+    FRAME_DATA = 3
+    
     def delete_directory(self, path):
         if os.path.exists(path):            
             if os.path.isdir(path):
@@ -22,6 +28,8 @@ class Utils:
                 return 2
             case "db3":
                 return 3
+            case "all":
+                return 0
             case _: 
                 return -1
             
@@ -36,4 +44,18 @@ class Utils:
             file_path = os.path.join(container, file_name)
             
             with open(file_path, 'wb') as pdf_file:
-                pdf_file.write(pdf_bytes)
\ No newline at end of file
+                pdf_file.write(pdf_bytes)
+
+
+    def relay_pdf_frames(self, metadata, frames):
+        """
+        Frames of a binary upload to RAD agent: `metadata`, then the PDF files of `frames` as they are received.
+        Files of other types are skipped.
+        """
+        yield self.FRAME_METADATA, json.dumps(metadata).encode()
+        forward = False
+        for frame_type, payload in frames:
+            if frame_type == self.FRAME_FILE:
+                forward = json.loads(payload).get("title", "").lower().endswith('.pdf')
+            if forward:
+                yield frame_type, payload
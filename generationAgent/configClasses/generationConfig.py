@@ -0,0 +1,23 @@
+from dataclasses import dataclass, field
+import os
+
+@dataclass
+class GenerationConfig: 
+    llm_model: str = field(default="gpt-4o-mini-2024-07-18")
+    prompt_token_budget: int = field(default=6000)
+    context_token_share: float = field(default=0.7)
+    
+    def __post_init__(self):
+        file_path = os.path.join('generationAgent','configFiles', 'generationInfo.txt')
+        config = dict()
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    key, value = line.strip().split(':', 1)
+                    config[key] = value
+        
+        self.llm_model = config.get('llm_model', self.llm_model)
+        self.prompt_token_budget = int(config.get('prompt_token_budget', self.prompt_token_budget))
+        self.context_token_share = float(config.get('context_token_share', self.context_token_share))
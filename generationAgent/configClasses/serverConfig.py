@@ -0,0 +1,37 @@
+from dataclasses import dataclass, field
+import os
+
+@dataclass
+class ServerConfig: 
+    serving_mode: str = field(default="dev")
+    host: str = field(default="127.0.0.1")
+    port: int = field(default=5008)
+    workers: int = field(default=2)
+    backlog: int = field(default=1024)
+    access_log: bool = field(default=False)
+    
+    def __post_init__(self):
+        file_path = os.path.join('generationAgent','configFiles', 'serverInfo.txt')
+        config = dict()
+        if os.path.exists(file_path):
+            with open(file_path, 'r') as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    key, value = line.strip().split(':', 1)
+                    config[key] = value
+                
+        
+        self.serving_mode = config.get('serving_mode', self.serving_mode)
+        self.host = config.get('host', self.host)
+        self.port = int(config.get('port', self.port))
+        self.workers = int(config.get('workers', self.workers))
+        self.backlog = int(config.get('backlog', self.backlog))
+        self.access_log = self._to_bool(config.get('access_log', self.access_log))
+        
+        
+    @staticmethod
+    def _to_bool(value) -> bool:
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in ("1", "true", "yes", "on")
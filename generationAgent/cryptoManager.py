@@ -2,13 +2,25 @@ import hashlib
 import base64
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 import os
+import json
+import zlib
+import functools
+import orjson
 
 class CryptoManager: 
     
+    #Envelope v2, see `seal`
+    ENVELOPE_VERSION = 2
+    ENVELOPE_CONTENT_TYPE = "application/x-rag-envelope"
+    ENVELOPE_HEADER = "X-Envelope"
+    ENVELOPE_COMPRESS_MIN_BYTES = 512
+    ENVELOPE_COMPRESSED = 0x01
+
     def encrypt_text(plain_text: str, key_string: str = "9f8e7d6c5b4a32109f8e7d6c5b4a3210") -> str:
-        key = hashlib.sha256(key_string.encode()).digest()
+        key = CryptoManager._derive_key(key_string)
         
         iv = os.urandom(16)
 
@@ -29,7 +41,7 @@ class CryptoManager:
 
 
     def decrypt_text(ciphertext_base64: str, key_string = "9f8e7d6c5b4a32109f8e7d6c5b4a3210") -> str:
-        key = hashlib.sha256(key_string.encode()).digest()
+        key = CryptoManager._derive_key(key_string)
 
         ciphertext_combined = base64.b64decode(ciphertext_base64)
 
@@ -67,3 +79,83 @@ class CryptoManager:
         
         with open(output_file_path, 'wb') as file:
             file.write(pdf_bytes)
+
+
+    @functools.lru_cache(maxsize=32)
+    def _derive_key(key_string: str) -> bytes:
+        #Derived once per peer instead of on every message
+        return hashlib.sha256(key_string.encode()).digest()
+
+
+    @functools.lru_cache(maxsize=32)
+    def _aead(key_string: str) -> AESGCM:
+        return AESGCM(CryptoManager._derive_key(key_string))
+
+
+    def seal(data, key_string: str = "9f8e7d6c5b4a32109f8e7d6c5b4a3210", compress: bool = None) -> bytes:
+        payload = orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+        flags = 0
+        if compress or (compress is None and len(payload) >= CryptoManager.ENVELOPE_COMPRESS_MIN_BYTES):
+            compressed = zlib.compress(payload, 1)
+            if compress or len(compressed) < len(payload):
+                payload = compressed
+                flags |= CryptoManager.ENVELOPE_COMPRESSED
+
+        header = bytes([CryptoManager.ENVELOPE_VERSION, flags])
+        data_key = AESGCM.generate_key(bit_length=256)
+        nonce = os.urandom(12)
+        ciphertext = AESGCM(data_key).encrypt(nonce, payload, header)
+        return header + CryptoManager._wrap_key(data_key, header, key_string) + nonce + ciphertext
+
+
+    def unseal(envelope: bytes, key_string: str = "9f8e7d6c5b4a32109f8e7d6c5b4a3210"):
+        header, data_key, body = CryptoManager._unwrap_key(envelope, key_string)
+        payload = AESGCM(data_key).decrypt(body[:12], body[12:], header)
+        if header[1] & CryptoManager.ENVELOPE_COMPRESSED:
+            payload = zlib.decompress(payload)
+        return orjson.loads(payload)
+
+
+    def rewrap(envelope: bytes, from_key_string: str, key_string: str = "9f8e7d6c5b4a32109f8e7d6c5b4a3210") -> bytes:
+        header, data_key, body = CryptoManager._unwrap_key(envelope, from_key_string)
+        return header + CryptoManager._wrap_key(data_key, header, key_string) + body
+
+
+    def load_request(request, key_string: str = "9f8e7d6c5b4a32109f8e7d6c5b4a3210"):
+        if request.mimetype == CryptoManager.ENVELOPE_CONTENT_TYPE:
+            return CryptoManager.unseal(request.get_data(), key_string), CryptoManager.ENVELOPE_VERSION
+
+        encrypted_data = request.get_json()
+        if isinstance(encrypted_data, str):
+            encrypted_data = json.loads(encrypted_data)
+        data = json.loads(CryptoManager.decrypt_text(encrypted_data.get('cipherData'), key_string))
+        accepted = request.headers.get(CryptoManager.ENVELOPE_HEADER) == str(CryptoManager.ENVELOPE_VERSION)
+        return data, CryptoManager.ENVELOPE_VERSION if accepted else 1
+
+
+    def dump_response(data, version: int, key_string: str = "9f8e7d6c5b4a32109f8e7d6c5b4a3210", field: str = "cipherData", status: int = 200):
+        headers = {CryptoManager.ENVELOPE_HEADER: str(CryptoManager.ENVELOPE_VERSION)}
+        if version == CryptoManager.ENVELOPE_VERSION:
+            headers["Content-Type"] = CryptoManager.ENVELOPE_CONTENT_TYPE
+            return CryptoManager.seal(data, key_string), status, headers
+        return {field: CryptoManager.encrypt_text(json.dumps(data), key_string)}, status, headers
+
+
+    def load_response(response, key_string: str = "9f8e7d6c5b4a32109f8e7d6c5b4a3210", field: str = "cipherData"):
+        if response.headers.get("Content-Type", "").startswith(CryptoManager.ENVELOPE_CONTENT_TYPE):
+            return CryptoManager.unseal(response.content, key_string)
+        return json.loads(CryptoManager.decrypt_text(response.json()[field], key_string))
+
+
+    def _wrap_key(data_key: bytes, header: bytes, key_string: str) -> bytes:
+        nonce = os.urandom(12)
+        return nonce + CryptoManager._aead(key_string).encrypt(nonce, data_key, header)
+
+
+    def _unwrap_key(envelope: bytes, key_string: str):
+        #Header, data key and `nonce | ciphertext`
+        if len(envelope) < 2 + 60 + 12 + 16 or envelope[0] != CryptoManager.ENVELOPE_VERSION:
+            raise ValueError("Unknown envelope format")
+        header = envelope[:2]
+        data_key = CryptoManager._aead(key_string).decrypt(envelope[2:14], envelope[14:62], header)
+        return header, data_key, envelope[62:]
@@ -2,7 +2,12 @@ from cryptoManager import CryptoManager
 from flask import Flask, request,jsonify
 import json
 from utils import Utils
+from promptBudget import PromptBudget
+from configClasses.generationConfig import GenerationConfig
+from configClasses.serverConfig import ServerConfig
+from preforkServer import PreforkServer
 from langchain.schema import Document
+import time
 
 
 class GenerationAgent: 
@@ -11,7 +16,11 @@ class GenerationAgent:
         self.app = Flask(__name__)            
         self.setup_routes()
         self.utils = Utils()
-        self.llm = self.utils.build_LLM()
+        self.config = GenerationConfig()
+        self.serverConfig = ServerConfig()
+        self.llm = self.utils.build_LLM(self.config.llm_model)
+        self.prompt_budget = PromptBudget(self.utils, self.config.llm_model, self.config.prompt_token_budget,
+                                          self.config.context_token_share)
         self.web_search_tool = self.utils.build_web_search_tool()
         
 
@@ -34,8 +43,9 @@ class GenerationAgent:
         - `context`: Additional context relevant to the conversation (string).
 
         The function decrypts the `cipherData`, prepares the prompt using the provided message history 
-        and context, invokes the language model to generate a response, and returns the encrypted 
-        generated response. If any required fields are missing or an error occurs during processing, 
+        and context, fitted into `prompt_token_budget` tokens (see `PromptBudget`): the most relevant chunks 
+        are kept and the oldest messages are dropped first. It then invokes the language model to generate 
+        a response, and returns the encrypted generated response. If any required fields are missing or an error occurs during processing, 
         an appropriate error message is returned.
 
         ---
@@ -79,28 +89,24 @@ class GenerationAgent:
         """
         #Get data
         try:
-            encrypted_data = request.get_json()
-
-            if isinstance(encrypted_data, str):
-                encrypted_data = json.loads(encrypted_data)
-
-            cipher_text = encrypted_data.get('cipherData')
-            decrypted_data = CryptoManager.decrypt_text(cipher_text)
-            data = json.loads(decrypted_data)
+            data, version = CryptoManager.load_request(request)
             
             messages = data["chat"]
             context_data = data["context"]
-            context = json.loads(context_data)
+            #JSON text in the JSON format, the list itself in envelopes
+            context = json.loads(context_data) if isinstance(context_data, str) else context_data
             
-            #Get last six messages 
-            #The unique purpouse of this is save tokens
-            messages = messages[-7:] 
             #Get question and history
             question = messages.pop(-1) 
             
-            
-            history_str = self.utils.format_history(messages)
-            context_str = self.utils.format_context(context)
+            #History and context fitted into the token budget, so prompt size and latency are bounded
+            prompt = self.prompt_budget.pack(
+                [self.utils.get_zsc_template(), self.utils.get_context_promt_template()],
+                question, messages, context
+            )
+            history_str = prompt["history"]
+            context_str = prompt["context"]
+            start = time.perf_counter()
             
             #Classify text 
             zsc_prompt_template = self.utils.get_zsc_template()
@@ -158,13 +164,17 @@ class GenerationAgent:
                 case _:
                     generation = "Text can´t be classified"
             
+            tokens = prompt["tokens"]
+            print(f"Prompt tokens: {tokens['prompt']}/{tokens['budget']} (fixed {tokens['fixed']}, "
+                  f"history {tokens['history']} in {tokens['messages_kept']}/{tokens['messages_total']} messages, "
+                  f"context {tokens['context']} in {tokens['chunks_kept']}/{tokens['chunks_total']} chunks), "
+                  f"category {category}, {time.perf_counter() - start:.2f}s")
+            
             data = {
                 "generation" : generation
             }
             
-            json_data = json.dumps(data)
-            cipher_response = CryptoManager.encrypt_text(json_data)
-            return jsonify({"cipher_response": cipher_response}), 200
+            return CryptoManager.dump_response(data, version, field="cipher_response")
         except Exception as e: 
             return jsonify({"message": "Error in RAD Agent"}), 500    
 
@@ -173,7 +183,13 @@ class GenerationAgent:
 
 
     def run(self):
-        self.app.run(port=5008 , debug=True)
+        if self.serverConfig.serving_mode == "prefork":
+            #The LLM clients and the tokenizer are loaded before forking, the workers share them
+            PreforkServer(self.app, self.serverConfig).serve_forever()
+        elif self.serverConfig.serving_mode == "dev":
+            self.app.run(port=self.serverConfig.port, debug=True)
+        else:
+            raise ValueError("Unknown serving mode {}".format(self.serverConfig.serving_mode))
 
 if __name__ == '__main__':
     generationAgent = GenerationAgent()
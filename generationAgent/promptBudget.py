@@ -0,0 +1,82 @@
+import tiktoken
+
+
+class PromptBudget:
+    """
+        Fits the history and the context of a question into a fixed number of prompt tokens.
+
+        Tokens are counted with the tiktoken encoding of the model. The template and the question are always
+        sent; the rest of the budget is shared:
+            1. The history keeps up to `1 - context_share` of it, or less if the history is shorter.
+            2. The context chunks are packed by relevance (the "score" metadata sent by the RAD agent, or the
+               order of the list) into what is left. A chunk that does not fit is skipped and smaller, less
+               relevant ones are still tried.
+            3. The history is trimmed oldest-first into whatever the context did not use.
+    """
+
+    def __init__(self, utils, model: str, budget: int, context_share: float = 0.7):
+        self.utils = utils
+        self.budget = budget
+        self.context_share = context_share
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("o200k_base")
+
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+
+    def pack(self, templates: list, question: str, messages: list, context: list) -> dict:
+        """
+        Args:
+            templates (List[PromptTemplate]): The templates the history and context are sent with. The largest
+                                              one is counted.
+            question (str): The last message of the user.
+            messages (List[dict]): The previous messages, oldest first, as sent by the control agent.
+            context (List[dict]): The chunks with `page_content` and `metadata`, as sent by the RAD agent.
+
+        Returns:
+            dict: "history" and "context" as formatted strings, and "tokens" with the counts of the prompt.
+        """
+        fixed = max(self.count(template.format(history="", context="", question=question)) for template in templates)
+        available = max(self.budget - fixed, 0)
+
+        history_costs = [self.count(self.utils.format_history([message])) + 1 for message in messages]
+        history_reserve = min(sum(history_costs), int(available * (1 - self.context_share)))
+
+        ranked = context
+        if context and all("score" in chunk.get("metadata", {}) for chunk in context):
+            ranked = sorted(context, key=lambda chunk: chunk["metadata"]["score"], reverse=True)
+
+        packed_context = []
+        context_tokens = 0
+        for chunk in ranked:
+            cost = self.count(self.utils.format_context([chunk])) + 2
+            if context_tokens + cost <= available - history_reserve:
+                packed_context.append(chunk)
+                context_tokens += cost
+
+        kept_messages = []
+        history_tokens = 0
+        for message, cost in zip(reversed(messages), reversed(history_costs)):
+            if history_tokens + cost > available - context_tokens:
+                break
+            kept_messages.insert(0, message)
+            history_tokens += cost
+
+        history_str = self.utils.format_history(kept_messages)
+        context_str = self.utils.format_context(packed_context)
+        tokens = {
+            "budget": self.budget,
+            "fixed": fixed,
+            "history": self.count(history_str),
+            "context": self.count(context_str),
+            "messages_kept": len(kept_messages),
+            "messages_total": len(messages),
+            "chunks_kept": len(packed_context),
+            "chunks_total": len(context),
+        }
+        tokens["prompt"] = tokens["fixed"] + tokens["history"] + tokens["context"]
+        return {"history": history_str, "context": context_str, "tokens": tokens}
@@ -7,12 +7,12 @@ import os
 class Utils: 
 
     #Utils
-    def build_LLM(self): 
+    def build_LLM(self, model="gpt-4o-mini-2024-07-18"): 
         
         api_key = self.get_api_key_from_file()
          
         if (not (api_key == None)):
-            llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18",
+            llm = ChatOpenAI(model=model,
                             api_key=api_key)
             return llm
         
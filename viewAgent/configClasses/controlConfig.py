@@ -5,6 +5,11 @@ import os
 class ControlConfig: 
     ip: str = field(default="")
     cypherPass: str = field(default="")
+    pool_size: int = field(default=10)
+    connect_timeout: float = field(default=3.0)
+    read_timeout: float = field(default=180.0)
+    retries: int = field(default=2)
+    retry_backoff: float = field(default=0.5)
     
     def __post_init__(self):
         file_path = os.path.join('viewAgent','configFiles', 'controlInfo.txt')
@@ -19,5 +24,10 @@ class ControlConfig:
         self.password = config.get('password', 'default_password')
         self.ip = config.get('ip', 'http://default_ip')
         self.cypherPass = config.get('cypherPass', 'default_cypherPass')
+        self.pool_size = int(config.get('pool_size', self.pool_size))
+        self.connect_timeout = float(config.get('connect_timeout', self.connect_timeout))
+        self.read_timeout = float(config.get('read_timeout', self.read_timeout))
+        self.retries = int(config.get('retries', self.retries))
+        self.retry_backoff = float(config.get('retry_backoff', self.retry_backoff))
         
 
@@ -2,13 +2,31 @@ import hashlib
 import base64
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 import os
+import json
+import zlib
+import functools
+import orjson
 
 class CryptoManager: 
     
+    #Envelope v2, see `seal`
+    ENVELOPE_VERSION = 2
+    ENVELOPE_CONTENT_TYPE = "application/x-rag-envelope"
+    ENVELOPE_HEADER = "X-Envelope"
+    ENVELOPE_COMPRESS_MIN_BYTES = 512
+    ENVELOPE_COMPRESSED = 0x01
+
+    #Chunked authenticated encryption of the binary uploads
+    STREAM_MAGIC = b"RAGS"
+    STREAM_VERSION = 1
+    STREAM_END = 0xFF
+    STREAM_MAX_RECORD = 16 * 1024 * 1024 + 16
+
     def encrypt_text(plain_text: str, key_string: str) -> str:
-        key = hashlib.sha256(key_string.encode()).digest()
+        key = CryptoManager._derive_key(key_string)
         
         iv = os.urandom(16)
 
@@ -29,7 +47,7 @@ class CryptoManager:
 
 
     def decrypt_text(ciphertext_base64: str, key_string : str) -> str:
-        key = hashlib.sha256(key_string.encode()).digest()
+        key = CryptoManager._derive_key(key_string)
 
         ciphertext_combined = base64.b64decode(ciphertext_base64)
 
@@ -67,3 +85,146 @@ class CryptoManager:
         
         with open(output_file_path, 'wb') as file:
             file.write(pdf_bytes)
+
+    
+    def encrypt_stream(frames, key_string: str):
+        #Header, then `type | length | AES-GCM ciphertext and tag` per frame and an empty STREAM_END record
+        aesgcm = CryptoManager._aead(key_string)
+        header = CryptoManager.STREAM_MAGIC + bytes([CryptoManager.STREAM_VERSION]) + os.urandom(8)
+        yield header
+
+        number = 0
+        for frame_type, payload in frames:
+            yield CryptoManager._seal_record(aesgcm, header, number, frame_type, payload)
+            number += 1
+        yield CryptoManager._seal_record(aesgcm, header, number, CryptoManager.STREAM_END, b"")
+
+
+    def decrypt_stream(stream, key_string: str):
+        aesgcm = CryptoManager._aead(key_string)
+        header = CryptoManager._read_exact(stream, len(CryptoManager.STREAM_MAGIC) + 9)
+        if header[:len(CryptoManager.STREAM_MAGIC) + 1] != CryptoManager.STREAM_MAGIC + bytes([CryptoManager.STREAM_VERSION]):
+            raise ValueError("Unknown stream format")
+
+        number = 0
+        while True:
+            record_header = CryptoManager._read_exact(stream, 5)
+            frame_type = record_header[0]
+            length = int.from_bytes(record_header[1:], "big")
+            if length > CryptoManager.STREAM_MAX_RECORD:
+                raise ValueError("Stream record too long")
+            ciphertext = CryptoManager._read_exact(stream, length)
+
+            payload = aesgcm.decrypt(CryptoManager._record_nonce(header, number), ciphertext,
+                                     CryptoManager._record_aad(header, number, frame_type))
+            if frame_type == CryptoManager.STREAM_END:
+                return
+            yield frame_type, payload
+            number += 1
+
+
+    def _seal_record(aesgcm, header: bytes, number: int, frame_type: int, payload: bytes) -> bytes:
+        ciphertext = aesgcm.encrypt(CryptoManager._record_nonce(header, number), payload,
+                                    CryptoManager._record_aad(header, number, frame_type))
+        return bytes([frame_type]) + len(ciphertext).to_bytes(4, "big") + ciphertext
+
+
+    def _record_nonce(header: bytes, number: int) -> bytes:
+        #8 bytes of random prefix and 4 of record number
+        return header[-8:] + number.to_bytes(4, "big")
+
+
+    def _record_aad(header: bytes, number: int, frame_type: int) -> bytes:
+        return header + number.to_bytes(8, "big") + bytes([frame_type])
+
+
+    def _read_exact(stream, size: int) -> bytes:
+        chunks = []
+        missing = size
+        while missing > 0:
+            chunk = stream.read(missing)
+            if not chunk:
+                raise ValueError("Truncated stream")
+            chunks.append(chunk)
+            missing -= len(chunk)
+        return b"".join(chunks)
+
+
+    @functools.lru_cache(maxsize=32)
+    def _derive_key(key_string: str) -> bytes:
+        #Derived once per peer instead of on every message
+        return hashlib.sha256(key_string.encode()).digest()
+
+
+    @functools.lru_cache(maxsize=32)
+    def _aead(key_string: str) -> AESGCM:
+        return AESGCM(CryptoManager._derive_key(key_string))
+
+
+    def seal(data, key_string: str, compress: bool = None) -> bytes:
+        payload = orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+        flags = 0
+        if compress or (compress is None and len(payload) >= CryptoManager.ENVELOPE_COMPRESS_MIN_BYTES):
+            compressed = zlib.compress(payload, 1)
+            if compress or len(compressed) < len(payload):
+                payload = compressed
+                flags |= CryptoManager.ENVELOPE_COMPRESSED
+
+        header = bytes([CryptoManager.ENVELOPE_VERSION, flags])
+        data_key = AESGCM.generate_key(bit_length=256)
+        nonce = os.urandom(12)
+        ciphertext = AESGCM(data_key).encrypt(nonce, payload, header)
+        return header + CryptoManager._wrap_key(data_key, header, key_string) + nonce + ciphertext
+
+
+    def unseal(envelope: bytes, key_string: str):
+        header, data_key, body = CryptoManager._unwrap_key(envelope, key_string)
+        payload = AESGCM(data_key).decrypt(body[:12], body[12:], header)
+        if header[1] & CryptoManager.ENVELOPE_COMPRESSED:
+            payload = zlib.decompress(payload)
+        return orjson.loads(payload)
+
+
+    def rewrap(envelope: bytes, from_key_string: str, key_string: str) -> bytes:
+        header, data_key, body = CryptoManager._unwrap_key(envelope, from_key_string)
+        return header + CryptoManager._wrap_key(data_key, header, key_string) + body
+
+
+    def load_request(request, key_string: str):
+        if request.mimetype == CryptoManager.ENVELOPE_CONTENT_TYPE:
+            return CryptoManager.unseal(request.get_data(), key_string), CryptoManager.ENVELOPE_VERSION
+
+        encrypted_data = request.get_json()
+        if isinstance(encrypted_data, str):
+            encrypted_data = json.loads(encrypted_data)
+        data = json.loads(CryptoManager.decrypt_text(encrypted_data.get('cipherData'), key_string))
+        accepted = request.headers.get(CryptoManager.ENVELOPE_HEADER) == str(CryptoManager.ENVELOPE_VERSION)
+        return data, CryptoManager.ENVELOPE_VERSION if accepted else 1
+
+
+    def dump_response(data, version: int, key_string: str, field: str = "cipherData", status: int = 200):
+        headers = {CryptoManager.ENVELOPE_HEADER: str(CryptoManager.ENVELOPE_VERSION)}
+        if version == CryptoManager.ENVELOPE_VERSION:
+            headers["Content-Type"] = CryptoManager.ENVELOPE_CONTENT_TYPE
+            return CryptoManager.seal(data, key_string), status, headers
+        return {field: CryptoManager.encrypt_text(json.dumps(data), key_string)}, status, headers
+
+
+    def load_response(response, key_string: str, field: str = "cipherData"):
+        if response.headers.get("Content-Type", "").startswith(CryptoManager.ENVELOPE_CONTENT_TYPE):
+            return CryptoManager.unseal(response.content, key_string)
+        return json.loads(CryptoManager.decrypt_text(response.json()[field], key_string))
+
+
+    def _wrap_key(data_key: bytes, header: bytes, key_string: str) -> bytes:
+        nonce = os.urandom(12)
+        return nonce + CryptoManager._aead(key_string).encrypt(nonce, data_key, header)
+
+
+    def _unwrap_key(envelope: bytes, key_string: str):
+        #Header, data key and `nonce | ciphertext`
+        if len(envelope) < 2 + 60 + 12 + 16 or envelope[0] != CryptoManager.ENVELOPE_VERSION:
+            raise ValueError("Unknown envelope format")
+        header = envelope[:2]
+        data_key = CryptoManager._aead(key_string).decrypt(envelope[2:14], envelope[14:62], header)
+        return header, data_key, envelope[62:]
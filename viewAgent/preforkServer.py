@@ -0,0 +1,143 @@
+import traceback
+import threading
+import logging
+import socket
+import signal
+import time
+import sys
+import gc
+import os
+
+
+class PreforkServer:
+    """
+        Production server of an agent (`serving_mode:prefork` in serverInfo.txt): this process opens the
+        listening socket and forks `workers` worker processes that accept connections on it.
+
+        Everything the agent loaded before `serve_forever` (models, tokenizers, configuration) is shared by the
+        workers copy-on-write, so a worker only adds the memory it allocates while serving. The objects are
+        frozen out of the garbage collector before forking so collections do not touch, and copy, their pages.
+
+        WSGI apps (Flask) are served by the threaded Werkzeug server, a thread per connection without the
+        reloader and the debugger of the development server. ASGI apps are served by uvicorn.
+
+        `post_fork(number)` is called in every worker before it starts serving, with its number from 0 to
+        `workers - 1`: the place to start threads and open connections, which do not survive a fork. A worker
+        that dies is forked again with the same number, but if `post_fork` fails the server is stopped, as the
+        next worker would fail too. SIGTERM and SIGINT stop the workers and the server.
+    """
+
+    RESPAWN_DELAY_SECONDS = 1.0
+    BOOT_ERROR_CODE = 3
+
+    def __init__(self, app, config, post_fork=None, asgi: bool = False):
+        """
+        Args:
+            app: The WSGI app, or the ASGI app if `asgi`.
+            config (ServerConfig): `host`, `port`, `workers`, `backlog` and `access_log` of the agent.
+            post_fork (Callable[[int], None], optional): Called in every worker with its number.
+            asgi (bool, optional): Whether `app` is an ASGI app. Defaults to False.
+        """
+        self.app = app
+        self.host = config.host
+        self.port = config.port
+        self.workers = max(1, config.workers)
+        self.backlog = config.backlog
+        self.access_log = config.access_log
+        self.post_fork = post_fork
+        self.asgi = asgi
+        self.listener = None
+        self.children = {}
+        self.stopping = False
+        self.boot_failed = False
+
+
+    def serve_forever(self):
+        self.listener = socket.create_server((self.host, self.port), backlog=self.backlog)
+        #Every worker waits on the socket, the ones that lose the race for a connection must not block in accept
+        self.listener.setblocking(False)
+        print(f" * Serving on http://{self.host}:{self.port} with {self.workers} worker processes (pid {os.getpid()})")
+        sys.stdout.flush()
+
+        gc.freeze()
+        for number in range(self.workers):
+            self._spawn(number)
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            number = self.children.pop(pid, None)
+            if number is None or self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code == self.BOOT_ERROR_CODE:
+                print(f"Worker {number} (pid {pid}) failed to start, stopping the server")
+                self.boot_failed = True
+                self._stop(None, None)
+                continue
+            print(f"Worker {number} (pid {pid}) exited with code {code}, starting it again")
+            time.sleep(self.RESPAWN_DELAY_SECONDS)
+            if not self.stopping:
+                self._spawn(number)
+        self.listener.close()
+        if self.boot_failed:
+            raise RuntimeError("A worker failed to start")
+
+
+    def _spawn(self, number: int):
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid > 0:
+            self.children[pid] = number
+            return
+
+        code = self.BOOT_ERROR_CODE
+        try:
+            #The server stops the workers with SIGTERM, Ctrl+C in the terminal reaches it too
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            if self.post_fork is not None:
+                self.post_fork(number)
+            code = 1
+            if self.asgi:
+                self._serve_asgi()
+            else:
+                self._serve_wsgi()
+            code = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+
+    def _serve_wsgi(self):
+        from werkzeug.serving import make_server
+
+        if not self.access_log:
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        server = make_server(self.host, self.port, self.app, threaded=True, fd=self.listener.fileno())
+        #shutdown waits for the loop of serve_forever, so it cannot run in the signal handler of the same thread
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start())
+        server.serve_forever()
+
+
+    def _serve_asgi(self):
+        import uvicorn
+
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, access_log=self.access_log)
+        uvicorn.Server(config).run(sockets=[self.listener])
+
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
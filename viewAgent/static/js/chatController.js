@@ -6,7 +6,8 @@ let currentDB = 'db1';
 const messageHistories = {
     db1: [],
     db2: [],
-    db3: []
+    db3: [],
+    all: []
 };
 
 function updateChat() {
@@ -86,6 +87,7 @@ window.onload = function() {
         messageHistories.db1 = [];
         messageHistories.db2 = [];
         messageHistories.db3 = [];
+        messageHistories.all = [];
         updateChat();
     })
     .catch(error => {
@@ -3,7 +3,7 @@ const selectedValue = document.getElementById('selectedValue');
 
 dbSlider.addEventListener('input', (event) => {
     const value = event.target.value;
-    currentDB = `db${value}`;
-    selectedValue.textContent = `db${value}`;
+    currentDB = value === '4' ? 'all' : `db${value}`;
+    selectedValue.textContent = currentDB;
     updateChat();
 });
@@ -4,6 +4,11 @@ import re
 
 class Utils: 
     
+    #Frame types of the binary uploads
+    FRAME_METADATA = 1
+    FRAME_FILE = 2
+    FRAME_DATA = 3
+    
     def parse_message(self, message):
         message = re.sub(r'(?<!\\)\*\*(.*?)\*\*', r'<strong>\1</strong>', message)
         message = message.replace(r'\*\*', '**')  
@@ -28,4 +33,13 @@ class Utils:
             return db_json
         else:
             return None
-        
\ No newline at end of file
+
+
+    def pdf_stream_frames(self, metadata, paths, chunk_size=1024 * 1024):
+        """Frames of a binary upload: the metadata, then the title and the bytes of every file, read chunk by chunk."""
+        yield self.FRAME_METADATA, json.dumps(metadata).encode()
+        for path in paths:
+            yield self.FRAME_FILE, json.dumps({"title": os.path.basename(path)}).encode()
+            with open(path, 'rb') as pdf_file:
+                for chunk in iter(lambda: pdf_file.read(chunk_size), b""):
+                    yield self.FRAME_DATA, chunk
@@ -1,10 +1,11 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for
 from configClasses.controlConfig import ControlConfig
+from configClasses.serverConfig import ServerConfig
+from preforkServer import PreforkServer
 from cryptoManager import CryptoManager
 import os
-import requests
-import json
 from utils import Utils
+from peerClient import PeerClient
 
 
 
@@ -19,9 +20,12 @@ class ViewAgent:
             'db1':[],
             'db2':[],
             'db3':[],
+            'all':[],
             }
         self.utils = Utils()
         self.controlConfig = ControlConfig()
+        self.serverConfig = ServerConfig()
+        self.control_client = PeerClient(self.controlConfig)
         
     def configure_upload_folder(self):
         self.UPLOAD_FOLDER = 'viewAgent/uploads/'
@@ -40,6 +44,7 @@ class ViewAgent:
         
         #States control
         self.app.add_url_rule('/clear_messages', 'clear_messages', self.clear_messages, methods=['POST']) 
+        self.app.add_url_rule('/getMetrics', 'getMetrics', self.get_metrics, methods=['GET'])
         
 
     ##HTML returns
@@ -66,7 +71,7 @@ class ViewAgent:
                 file.save(os.path.join(self.app.config['UPLOAD_FOLDER'], file.filename))
         '''
             Send to: 
-                endpoint = "/createNewDatabase"
+                endpoint = "/createNewDatabaseStream"
                 logInPath = f"{self.controlAgentIP}{endpoint}"
                 
             Data to send: 
@@ -75,8 +80,7 @@ class ViewAgent:
                 DatabaseNumber
                 Documents
         '''
-        endpoint = "/createNewDatabase"
-        URL = f"{self.controlConfig.ip}{endpoint}"
+        endpoint = "/createNewDatabaseStream"
         
         uploadPath = os.path.join("viewAgent", "uploads")
 
@@ -84,31 +88,20 @@ class ViewAgent:
         for file in os.listdir(uploadPath):
             filePath = os.path.join(uploadPath, file)
             if os.path.isfile(filePath) and file.lower().endswith('.pdf'):          
-                
-                with open(filePath, 'rb') as pdf_file:
-                    pdf_bytes = pdf_file.read()
-                    auxName = file.split(os.sep)
-                    name = auxName[-1]
-                    file_data = {
-                        "title": name,
-                        "content": pdf_bytes.hex()  # Almacena las páginas como una lista
-                    }
-                filesList.append(file_data)
+                filesList.append(filePath)
 
         
         data = {
             "user":self.controlConfig.user,
             "pass":self.controlConfig.password,
-            "database": self.database,
-            "files":filesList
+            "database": self.database
         }
 
-        json_data = json.dumps(data)
-        
-        cipherData = CryptoManager.encrypt_text(json_data, self.controlConfig.cypherPass)
-        data_to_send = {"cipherData": cipherData}
+        #The files are read, encrypted and sent chunk by chunk
+        frames = self.utils.pdf_stream_frames(data, filesList)
+        cipherStream = CryptoManager.encrypt_stream(frames, self.controlConfig.cypherPass)
         
-        response = requests.post(URL, json=data_to_send)
+        response = self.control_client.send(endpoint, data=cipherStream, headers={"Content-Type": "application/octet-stream"})
         delete_path = os.path.join("viewAgent", "uploads")
         self.utils.empty_directory(delete_path)
         self.database = "aaa"
@@ -144,18 +137,10 @@ class ViewAgent:
                 "chat":json_chat, 
                 "database":currentDB
             }
-            json_data = json.dumps(data)
-            
-            cipherData = CryptoManager.encrypt_text(json_data, self.controlConfig.cypherPass)
-            data_to_send = {"cipherData": cipherData}
-            
-            generation = requests.post(URL, json=data_to_send)
+            generation = self.control_client.post(endpoint, data)
             
             if generation.status_code == 200:
-                data = generation.json()  
-                ciphered_generation = data['cipher_response'] 
-                generation_json = CryptoManager.decrypt_text(ciphered_generation, self.controlConfig.cypherPass)
-                generation = json.loads(generation_json)
+                generation = self.control_client.load(generation, field="cipher_response")
                 text = generation["generation"]
                 response_message = self.utils.parse_message(text) 
                 
@@ -181,12 +166,26 @@ class ViewAgent:
         self.messages['db1'] = []
         self.messages['db2'] = []
         self.messages['db3'] = []
+        self.messages['all'] = []
         
         return jsonify({'status': 'Messages cleared successfully'})
 
 
+    def get_metrics(self):
+        #Counters of the connections to the control agent, no user content
+        return jsonify({"peers": {"control": self.control_client.get_stats()}})
+
+
     def run(self):
-        self.app.run(port=5005, debug=True)
+        if self.serverConfig.serving_mode == "prefork":
+            #The chats are kept in the memory of the process, a second worker would not see them
+            if self.serverConfig.workers != 1:
+                raise ValueError("The view agent keeps the chats in memory and can only run 1 worker")
+            PreforkServer(self.app, self.serverConfig).serve_forever()
+        elif self.serverConfig.serving_mode == "dev":
+            self.app.run(port=self.serverConfig.port, debug=True)
+        else:
+            raise ValueError("Unknown serving mode {}".format(self.serverConfig.serving_mode))
 
 if __name__ == '__main__':
     my_app = ViewAgent()